@@ -0,0 +1,55 @@
+"""
+Benchmark of the batched bronze/silver writes of the ETL.
+
+Writes one synthetic observation per city to bronze with write_bronze_batch,
+transforms it into hourly weather rows and prints the rows per second for
+every city count.
+
+    uv run python benchmarks/bench_batched_writes.py
+"""
+
+from datetime import datetime, timezone
+import argparse
+import random
+import time
+
+from weather_call.config import SqliteProfile
+from weather_call.etl_service import write_bronze_batch
+from weather_call.transform import transform_bronze_to_silver
+
+from synthetic import BenchmarkDatabase, hourly_bronze_rows, seed_cities
+
+
+def run(city_count: int, batch_size: int) -> float:
+    """Returns the rows per second written for city_count cities"""
+    # plain sqlite, the batching is measured apart from the tuned profile
+    with BenchmarkDatabase(SqliteProfile.sqlite_defaults()) as database:
+        with database.Session() as session:
+            seed_cities(session, city_count)
+            session.commit()
+
+            dt = int(datetime.now(timezone.utc).timestamp())
+            bronze_rows = hourly_bronze_rows(city_count, dt, random.Random(0))
+
+            start = time.perf_counter()
+            write_bronze_batch(session, bronze_rows, batch_size)
+            transform_bronze_to_silver(session, batch_size=batch_size)
+            elapsed = time.perf_counter() - start
+
+    # every city writes one bronze and one hourly weather row
+    return 2 * city_count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cities", type=int, nargs="+", default=[10, 1_000, 100_000])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    for city_count in args.cities:
+        rows_per_second = run(city_count, args.batch_size)
+        print(f"{city_count:>7} cities: {rows_per_second:>12,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
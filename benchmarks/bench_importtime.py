@@ -0,0 +1,177 @@
+"""
+Startup time benchmark of the cli and its commands.
+
+Every target is imported in a fresh interpreter started with
+python -X importtime, and the time spent importing it is summed from the
+report, leaving out the modules the interpreter loads before any user code:
+
+- cli: weather_call.main, what every weather-call invocation pays
+- init, ingest, report: the modules each command imports when it runs
+
+Heavy dependencies a target must not load (the cli must not load any of
+them) fail the benchmark right away. --compare fails when the median import
+time of a target got slower than --threshold times a previous result.
+
+    uv run python benchmarks/bench_importtime.py --output importtime.json
+    uv run python benchmarks/bench_importtime.py --compare importtime.json
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = [
+    "aiosqlite",
+    "httpx",
+    "polars",
+    "pydantic",
+    "pydantic_settings",
+    "requests",
+    "sqlalchemy",
+]
+
+# optional dependencies of the async path, the sync commands must not load them
+ASYNC_MODULES = ["aiosqlite", "httpx"]
+
+# modules imported by each target and the heavy modules it must not load
+TARGETS = {
+    "cli": (["weather_call.main"], HEAVY_MODULES),
+    "init": (
+        [
+            "weather_call.main",
+            "weather_call.api.client",
+            "weather_call.api.geocoding_cache",
+            "weather_call.city_registry",
+            "weather_call.config",
+            "weather_call.model.database",
+            "weather_call.model.initial_database",
+        ],
+        ["polars", *ASYNC_MODULES],
+    ),
+    "ingest": (
+        [
+            "weather_call.main",
+            "weather_call.api.client",
+            "weather_call.city_registry",
+            "weather_call.config",
+            "weather_call.etl_service",
+            "weather_call.model.database",
+        ],
+        ASYNC_MODULES,
+    ),
+    "report": (
+        [
+            "weather_call.main",
+            "weather_call.config",
+            "weather_call.model.database",
+            "weather_call.report_cache",
+            "weather_call.reports",
+        ],
+        ["requests", *ASYNC_MODULES],
+    ),
+}
+
+
+def parse_importtime(report: str) -> list[tuple[str, int, int]]:
+    """(module, nesting level, cumulative microseconds) of every import"""
+    imports = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            # header line
+            continue
+        level = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), level, int(cumulative)))
+    return imports
+
+
+def import_report(code: str) -> list[tuple[str, int, int]]:
+    """Importtime report of running code in a fresh interpreter"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(completed.stderr)
+
+
+def measure(modules: list[str], startup: set[str]) -> tuple[float, set[str]]:
+    """Import milliseconds of modules and every module they loaded"""
+    imports = import_report("; ".join(f"import {module}" for module in modules))
+    milliseconds = (
+        sum(
+            cumulative
+            for name, level, cumulative in imports
+            if level == 0 and name not in startup
+        )
+        / 1000
+    )
+    return milliseconds, {name for name, _, _ in imports}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument(
+        "--targets", nargs="+", default=list(TARGETS), choices=list(TARGETS)
+    )
+    parser.add_argument("--output", help="json file for the results")
+    parser.add_argument("--compare", help="previous json result to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="median ratio above which a target is a regression",
+    )
+    args = parser.parse_args()
+
+    # modules loaded by the interpreter itself are not part of the targets
+    startup = {name for name, _, _ in import_report("pass")}
+
+    failed = False
+    results = {}
+    for target in args.targets:
+        modules, forbidden = TARGETS[target]
+        timings = []
+        for _ in range(args.repeat):
+            milliseconds, loaded = measure(modules, startup)
+            timings.append(milliseconds)
+        results[target] = {"timings": timings, "median": statistics.median(timings)}
+
+        heavy = sorted(module for module in forbidden if module in loaded)
+        flag = ""
+        if heavy:
+            flag = f"  LOADS {', '.join(heavy)}"
+            failed = True
+        print(f"{target:<10} {results[target]['median']:>8.1f} ms{flag}")
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump({"targets": results}, output_file, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)["targets"]
+        for target, result in results.items():
+            if target not in baseline:
+                continue
+            ratio = result["median"] / baseline[target]["median"]
+            flag = ""
+            if ratio > args.threshold:
+                flag = "  REGRESSION"
+                failed = True
+            print(f"{target:<10} {ratio:>6.2f}x{flag}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
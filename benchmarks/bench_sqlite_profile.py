@@ -0,0 +1,76 @@
+"""
+Benchmark of the sqlite performance profile.
+
+Runs the same workload with a plain sqlite configuration and with the
+tuned SqliteProfile, and prints ingest and report throughput for both:
+
+- ingest: hourly runs writing one bronze observation per city and
+  transforming it into silver, committing every run
+- reports: the ReportBundle of a 48 hour window computed repeatedly
+
+    uv run python benchmarks/bench_sqlite_profile.py
+"""
+
+from datetime import datetime, timedelta, timezone
+import argparse
+import random
+import time
+
+from weather_call.config import SqliteProfile
+from weather_call.etl_service import write_bronze_batch
+from weather_call.reports import ReportBundle
+from weather_call.transform import transform_bronze_to_silver
+
+from synthetic import BenchmarkDatabase, hourly_bronze_rows, seed_cities
+
+
+def run(profile: SqliteProfile, city_count: int, hours: int, report_runs: int):
+    """Returns (ingested rows per second, reports per second)"""
+    rng = random.Random(0)
+    with BenchmarkDatabase(profile) as database:
+        with database.Session() as session:
+            seed_cities(session, city_count)
+            session.commit()
+
+            # one committed run per hour, like the hourly job
+            now = datetime.now(timezone.utc).replace(minute=0, second=0)
+            start = time.perf_counter()
+            for hour in range(hours):
+                dt = int((now - timedelta(hours=hours - hour - 1)).timestamp())
+                write_bronze_batch(session, hourly_bronze_rows(city_count, dt, rng))
+                transform_bronze_to_silver(session, max_age=None)
+            ingest_rate = 2 * city_count * hours / (time.perf_counter() - start)
+
+        final_time = datetime.now(timezone.utc).replace(tzinfo=None)
+        initial_time = final_time - timedelta(hours=48)
+        with database.ReadSession() as read_session:
+            start = time.perf_counter()
+            for _ in range(report_runs):
+                ReportBundle(read_session, initial_time, final_time).collect()
+            report_rate = report_runs / (time.perf_counter() - start)
+
+    return ingest_rate, report_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cities", type=int, default=500)
+    parser.add_argument("--hours", type=int, default=96)
+    parser.add_argument("--report-runs", type=int, default=20)
+    args = parser.parse_args()
+
+    profiles = {
+        "sqlite defaults": SqliteProfile.sqlite_defaults(),
+        "tuned profile": SqliteProfile(),
+    }
+    for name, profile in profiles.items():
+        ingest_rate, report_rate = run(
+            profile, args.cities, args.hours, args.report_runs
+        )
+        print(
+            f"{name:>16}: ingest {ingest_rate:>10,.0f} rows/s, reports {report_rate:>8,.1f} bundles/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
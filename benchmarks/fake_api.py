@@ -0,0 +1,95 @@
+"""
+In-process fake of the OpenWeather api for the benchmarks.
+
+FakeApiClient answers the current weather, group weather, historical
+weather and geocoding requests with synthetic payloads instead of calling the network, so the
+seed and ingest scenarios run without an api key and without network noise.
+"""
+
+import json
+import random
+import threading
+import time
+
+import requests
+
+from weather_call.api.client import ApiClient
+
+from synthetic import PROVIDER_ID_OFFSET, city_coordinates, weather_payload
+
+
+class FakeApiClient(ApiClient):
+    """
+    ApiClient returning synthetic responses, with an optional latency per
+    request to model the network round trip.
+    """
+
+    def __init__(self, latency: float = 0.0, seed: int = 0, **kwargs):
+        super().__init__(base_url="http://fake.invalid", **kwargs)
+        self.latency = latency
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def get(
+        self, path: str, params: dict, headers: dict | None = None
+    ) -> requests.Response:
+        with self._lock:
+            self.requests += 1
+            # random.Random is shared by the fetch threads
+            body = fake_body(path, params, self._rng)
+        if self.latency:
+            time.sleep(self.latency)
+
+        response = requests.Response()
+        if body is None:
+            response.status_code = 404
+            response._content = b"{}"
+        else:
+            response.status_code = 200
+            response._content = json.dumps(body).encode()
+        return response
+
+
+def fake_body(path: str, params: dict, rng: random.Random):
+    """Synthetic body of an api request, None for an unknown path"""
+    dt = int(time.time())
+    if path == "/data/2.5/weather":
+        # the synthetic provider id is derived from the coordinates
+        coordinates = (float(params["lat"]), float(params["lon"]))
+        provider_id = PROVIDER_ID_OFFSET + abs(hash(coordinates)) % 10**6
+        return weather_payload(provider_id, dt, rng)
+    if path == "/data/2.5/group":
+        return {
+            "list": [
+                weather_payload(int(provider_id), dt, rng)
+                for provider_id in params["id"].split(",")
+            ]
+        }
+    if path == "/data/3.0/onecall/timemachine":
+        observation = weather_payload(0, int(params["dt"]), rng)
+        return {
+            "lat": params["lat"],
+            "lon": params["lon"],
+            "timezone": "UTC",
+            "data": [
+                {
+                    "dt": observation["dt"],
+                    "temp": observation["main"]["temp"],
+                    "wind_speed": observation["wind"]["speed"],
+                    "weather": observation["weather"],
+                }
+            ],
+        }
+    if path == "/geo/1.0/direct":
+        city_name, country_code = params["q"].split(",")
+        latitude, longitude = city_coordinates(city_name)
+        return [
+            {
+                "name": city_name,
+                "country": country_code,
+                "lat": latitude,
+                "lon": longitude,
+            }
+        ]
+    return None
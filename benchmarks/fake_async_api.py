@@ -0,0 +1,40 @@
+"""
+In-process fake of the OpenWeather api for the async ingest benchmark.
+
+Kept apart from fake_api.py because it needs the optional async
+dependencies, so the other scenarios run without them.
+"""
+
+import asyncio
+import random
+
+import httpx
+
+from weather_call.api.async_client import AsyncApiClient
+
+from fake_api import fake_body
+
+
+class FakeAsyncApiClient(AsyncApiClient):
+    """
+    AsyncApiClient returning the synthetic responses of FakeApiClient, with
+    an optional latency per request awaited on the event loop.
+    """
+
+    def __init__(self, latency: float = 0.0, seed: int = 0, **kwargs):
+        super().__init__(base_url="http://fake.invalid", **kwargs)
+        self.latency = latency
+        self.requests = 0
+        self._rng = random.Random(seed)
+
+    async def get(
+        self, path: str, params: dict, headers: dict | None = None
+    ) -> httpx.Response:
+        self.requests += 1
+        body = fake_body(path, params, self._rng)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if body is None:
+            return httpx.Response(404, json={})
+        return httpx.Response(200, json=body)
@@ -0,0 +1,432 @@
+"""
+Timed benchmark scenarios of the ETL and the reports, on synthetic data.
+
+Every scenario runs on a temporary database filled by the deterministic
+generator in synthetic.py, with the api replaced by the in-process fake in
+fake_api.py, so no api key or network is needed:
+
+- seed: full database initialization of the cities, geocoded by the fake api
+- ingest: one hourly add_new_hourly_data run over a filled history
+- ingest_async: the same run through add_new_hourly_data_async, needs the
+  async extra and is not run by default
+- ingest_rerun: a second ingest run right after the first, where every city
+  was just observed and the api calls are skipped
+- backfill: the day before the history filled from the historical endpoint
+- replay: full bronze to silver replay of the history
+- report_*: every reports.py function and the ReportBundle, on the last
+  48 hours and on the whole history
+- report_workers: the ReportBundle over the whole history computed by a
+  ReportPool of each --workers size, next to the single process bundle;
+  the speedup is only meaningful on a machine with that many cores
+
+Results are written as JSON, and --compare prints the ratio against a
+previous result file and fails when a scenario got slower than --threshold.
+
+    uv run python benchmarks/run_benchmarks.py --output results.json
+    uv run python benchmarks/run_benchmarks.py --compare results.json
+"""
+
+from datetime import timedelta
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+
+import polars as pl
+import sqlalchemy
+
+from weather_call.api.geocoding_cache import GeocodingCache
+from weather_call.backfill import backfill_hourly_weather
+from weather_call.city_registry import CityRegistry
+from weather_call.config import SqliteProfile
+from weather_call.etl_service import add_new_hourly_data
+from weather_call.model.initial_database import full_database_initialization
+from weather_call.observation_index import ObservationIndex
+from weather_call.report_pool import ReportPool
+from weather_call.transform import transform_bronze_to_silver
+from weather_call import reports
+
+from fake_api import FakeApiClient
+from synthetic import (
+    BenchmarkDatabase,
+    current_hour,
+    generate_history,
+    synthetic_cities,
+)
+
+
+def timed(function, repeat: int) -> list[float]:
+    """Wall clock seconds of repeat calls of function"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_seed(args) -> dict:
+    """Initialization of an empty database, geocoding every city"""
+    cities = synthetic_cities(args.cities)
+
+    def run():
+        with BenchmarkDatabase() as database, database.Session() as session:
+            with FakeApiClient(latency=args.latency, seed=args.seed) as client:
+                full_database_initialization(
+                    session,
+                    database.engine,
+                    "fake",
+                    cities,
+                    client=client,
+                    geocoding_cache=GeocodingCache(),
+                )
+
+    return {"timings": timed(run, args.repeat), "rows": args.cities}
+
+
+def bench_ingest(args, rerun: bool = False) -> dict:
+    """
+    One hourly ingest run on top of the generated history, or with rerun
+    the run right after it
+    """
+    cities = synthetic_cities(args.cities)
+    timings = []
+    api_calls = []
+    for _ in range(args.repeat):
+        with BenchmarkDatabase() as database, database.Session() as session:
+            generate_history(
+                session, args.cities, args.hours, end=args.end, seed=args.seed
+            )
+            registry = CityRegistry()
+            observations = ObservationIndex()
+            with FakeApiClient(latency=args.latency, seed=args.seed) as client:
+
+                def run():
+                    add_new_hourly_data(
+                        session,
+                        "fake",
+                        cities=cities,
+                        client=client,
+                        max_concurrency=args.concurrency,
+                        registry=registry,
+                        observations=observations,
+                    )
+
+                if rerun:
+                    run()
+                requests_before = client.requests
+                start = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - start)
+                api_calls.append(client.requests - requests_before)
+    return {"timings": timings, "rows": args.cities, "api_calls": api_calls}
+
+
+def bench_ingest_async(args) -> dict:
+    """One hourly asyncio ingest run on top of the generated history"""
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    from weather_call.etl_service import add_new_hourly_data_async
+    from weather_call.model.database import build_async_engine
+
+    from fake_async_api import FakeAsyncApiClient
+
+    cities = synthetic_cities(args.cities)
+
+    async def run(database) -> float:
+        engine = build_async_engine(
+            f"sqlite+aiosqlite:///{database.path}", SqliteProfile()
+        )
+        try:
+            async with async_sessionmaker(engine)() as session:
+                async with FakeAsyncApiClient(
+                    latency=args.latency, seed=args.seed
+                ) as client:
+                    start = time.perf_counter()
+                    await add_new_hourly_data_async(
+                        session,
+                        "fake",
+                        cities=cities,
+                        client=client,
+                        max_concurrency=args.concurrency,
+                        registry=CityRegistry(),
+                        observations=ObservationIndex(),
+                    )
+                    return time.perf_counter() - start
+        finally:
+            await engine.dispose()
+
+    timings = []
+    for _ in range(args.repeat):
+        with BenchmarkDatabase() as database:
+            with database.Session() as session:
+                generate_history(
+                    session, args.cities, args.hours, end=args.end, seed=args.seed
+                )
+            timings.append(asyncio.run(run(database)))
+    return {"timings": timings, "rows": args.cities}
+
+
+def bench_backfill(args) -> dict:
+    """Gap detection and backfill of the 24 hours before the history"""
+    history_start = args.end - timedelta(hours=args.hours - 1)
+    timings = []
+    for _ in range(args.repeat):
+        with BenchmarkDatabase() as database, database.Session() as session:
+            generate_history(
+                session, args.cities, args.hours, end=args.end, seed=args.seed
+            )
+            with FakeApiClient(latency=args.latency, seed=args.seed) as client:
+                start = time.perf_counter()
+                backfill_hourly_weather(
+                    session,
+                    "fake",
+                    history_start - timedelta(hours=24),
+                    history_start,
+                    client=client,
+                    max_concurrency=args.concurrency,
+                )
+                timings.append(time.perf_counter() - start)
+    return {"timings": timings, "rows": args.cities * 24}
+
+
+def bench_replay(args, session) -> dict:
+    """Full bronze to silver replay of the history"""
+    rows = args.cities * args.hours
+    return {
+        "timings": timed(
+            lambda: transform_bronze_to_silver(session, full_replay=True), args.repeat
+        ),
+        "rows": rows,
+    }
+
+
+def report_scenarios(args, session) -> dict[str, dict]:
+    """Every report function and the report bundle, on two windows"""
+    # hourly timestamps are stored as naive utc
+    final_time = args.end.replace(tzinfo=None)
+    windows = {
+        "48h": final_time - timedelta(hours=47),
+        "history": final_time - timedelta(hours=args.hours - 1),
+    }
+    report_functions = {
+        "distinct_weather": reports.distinct_weather,
+        "rank_common_weather": reports.rank_common_weather,
+        "average_temperature": reports.average_temperature,
+        "city_with_variation": reports.city_with_variation,
+    }
+
+    results = {}
+    for window_name, initial_time in windows.items():
+        rows = args.cities * int((final_time - initial_time) / timedelta(hours=1) + 1)
+        calls = {
+            name: lambda function=function: function(initial_time, final_time, session)
+            for name, function in report_functions.items()
+        }
+        for column in ["temperature", "wind_speed"]:
+            calls[f"city_with_highest_{column}"] = lambda column=column: (
+                reports.city_with_highest_column_value(
+                    column, initial_time, final_time, session
+                )
+            )
+        calls["bundle"] = lambda: reports.ReportBundle(
+            session, initial_time, final_time
+        ).collect()
+        calls["bundle_rollup"] = lambda: reports.ReportBundle(
+            session, initial_time, final_time, rollup=True
+        ).collect()
+
+        for name, call in calls.items():
+            results[f"report_{name}_{window_name}"] = {
+                "timings": timed(call, args.repeat),
+                "rows": rows,
+            }
+    return results
+
+
+def report_worker_scenarios(args, session) -> dict[str, dict]:
+    """The report bundle over the whole history, by number of workers"""
+    final_time = args.end.replace(tzinfo=None)
+    initial_time = final_time - timedelta(hours=args.hours - 1)
+    rows = args.cities * args.hours
+
+    results = {
+        "report_workers_0": {
+            "timings": timed(
+                lambda: reports.ReportBundle(
+                    session, initial_time, final_time
+                ).collect(),
+                args.repeat,
+            ),
+            "rows": rows,
+        }
+    }
+    for workers in args.workers:
+        with ReportPool(workers) as pool:
+
+            def run():
+                reports.ReportBundle(
+                    session, initial_time, final_time, pool=pool
+                ).collect()
+
+            # the first call starts the worker processes
+            run()
+            results[f"report_workers_{workers}"] = {
+                "timings": timed(run, args.repeat),
+                "rows": rows,
+            }
+    return results
+
+
+def git_commit() -> str | None:
+    """Commit of the benchmarked tree, if it is a git checkout"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(scenarios: dict[str, dict]) -> dict[str, dict]:
+    """Adds min, median and rows per second to the raw timings"""
+    for result in scenarios.values():
+        timings = result["timings"]
+        result["min"] = min(timings)
+        result["median"] = statistics.median(timings)
+        result["rows_per_second"] = result["rows"] / result["median"]
+    return scenarios
+
+
+def compare(scenarios: dict[str, dict], baseline_path: str, threshold: float) -> bool:
+    """Prints the median ratio of every scenario against a baseline result"""
+    with open(baseline_path, encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)["scenarios"]
+
+    regressed = False
+    for name, result in scenarios.items():
+        if name not in baseline:
+            continue
+        ratio = result["median"] / baseline[name]["median"]
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"{name:<45} {ratio:>6.2f}x{flag}")
+    return not regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--cities", type=int, default=100)
+    parser.add_argument("--hours", type=int, default=24 * 30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds per fake api request"
+    )
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        default=["seed", "ingest", "ingest_rerun", "backfill", "replay", "reports"],
+        choices=[
+            "seed",
+            "ingest",
+            "ingest_async",
+            "ingest_rerun",
+            "backfill",
+            "replay",
+            "reports",
+            "report_workers",
+        ],
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8],
+        help="report pool sizes of the report_workers scenario",
+    )
+    parser.add_argument("--output", help="json file for the results, default stdout")
+    parser.add_argument("--compare", help="previous json result to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="median ratio above which a scenario is a regression",
+    )
+    args = parser.parse_args()
+    args.end = current_hour()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    scenarios = {}
+    if "seed" in args.scenarios:
+        scenarios["seed"] = bench_seed(args)
+    if "ingest" in args.scenarios:
+        scenarios["ingest"] = bench_ingest(args)
+    if "ingest_rerun" in args.scenarios:
+        scenarios["ingest_rerun"] = bench_ingest(args, rerun=True)
+    if "ingest_async" in args.scenarios:
+        scenarios["ingest_async"] = bench_ingest_async(args)
+    if "backfill" in args.scenarios:
+        scenarios["backfill"] = bench_backfill(args)
+    if {"replay", "reports", "report_workers"} & set(args.scenarios):
+        with BenchmarkDatabase() as database, database.Session() as session:
+            generate_history(
+                session, args.cities, args.hours, end=args.end, seed=args.seed
+            )
+            if "replay" in args.scenarios:
+                scenarios["replay"] = bench_replay(args, session)
+            if "reports" in args.scenarios:
+                scenarios.update(report_scenarios(args, session))
+            if "report_workers" in args.scenarios:
+                scenarios.update(report_worker_scenarios(args, session))
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "polars": pl.__version__,
+            "sqlalchemy": sqlalchemy.__version__,
+            "sqlite": sqlite3.sqlite_version,
+            "cities": args.cities,
+            "hours": args.hours,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "latency": args.latency,
+            "cpus": os.cpu_count(),
+        },
+        "scenarios": summarize(scenarios),
+    }
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.compare is not None and not compare(
+        scenarios, args.compare, args.threshold
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
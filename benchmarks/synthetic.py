@@ -0,0 +1,195 @@
+"""
+Deterministic synthetic data and temporary databases for the benchmarks.
+
+The same seed, scale and end hour always produce the same countries,
+cities, bronze payloads and hourly weather rows, so timings of different
+commits are measured on identical data.
+"""
+
+from datetime import datetime, timedelta, timezone
+import os
+import random
+import tempfile
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, sessionmaker
+
+from weather_call.config import SqliteProfile
+from weather_call.etl_service import build_bronze_row
+from weather_call.model.city import City
+from weather_call.model.country import Country
+from weather_call.model.database import Base, build_engine
+from weather_call.model.observation import CityObservation
+from weather_call.model.weather import HourlyWeather, HourlyWeatherBronze
+from weather_call.rollup import refresh_daily_summaries
+from weather_call.transform import BRONZE_WATERMARK
+from weather_call.watermark import write_watermark
+
+WEATHER_CONDITIONS = ["Clear", "Clouds", "Rain", "Drizzle", "Snow", "Mist"]
+
+# offset of the synthetic provider ids, so they differ from the city ids
+PROVIDER_ID_OFFSET = 100_000
+
+
+def synthetic_cities(city_count: int, country_count: int = 10) -> list[dict]:
+    """City list in the format of load_city_list"""
+    return [
+        {
+            "city_name": f"city_{index:06d}",
+            "country_name": f"country_{index % country_count:02d}",
+            "iso_3166": iso_code(index % country_count),
+        }
+        for index in range(city_count)
+    ]
+
+
+def iso_code(index: int) -> str:
+    """Two letter code of the index-th synthetic country"""
+    return chr(ord("A") + index // 26 % 26) + chr(ord("A") + index % 26)
+
+
+def city_coordinates(city_name: str) -> tuple[float, float]:
+    """Stable latitude and longitude of a synthetic city"""
+    rng = random.Random(city_name)
+    return round(rng.uniform(-60, 70), 6), round(rng.uniform(-180, 180), 6)
+
+
+def weather_payload(provider_id: int, dt: int, rng: random.Random) -> dict:
+    """Payload shaped like the current weather api response"""
+    return {
+        "id": provider_id,
+        "dt": dt,
+        "main": {"temp": round(rng.uniform(-20, 40), 2)},
+        "wind": {"speed": round(rng.uniform(0, 25), 2)},
+        "weather": [{"main": rng.choice(WEATHER_CONDITIONS)}],
+    }
+
+
+def hourly_bronze_rows(city_count: int, dt: int, rng: random.Random) -> list[dict]:
+    """Bronze rows of one observation at dt for each of the city_count cities"""
+    return [
+        build_bronze_row(
+            city_id, weather_payload(PROVIDER_ID_OFFSET + city_id, dt, rng)
+        )
+        for city_id in range(1, city_count + 1)
+    ]
+
+
+def seed_cities(session: Session, city_count: int) -> list[dict]:
+    """
+    Stores the countries and the cities of synthetic_cities, with their
+    stable coordinates, without committing. Returns the city list.
+    """
+    cities = synthetic_cities(city_count)
+    countries = {city["country_name"]: city["iso_3166"] for city in cities}
+    session.execute(
+        insert(Country),
+        [{"name": name, "iso_3166": iso} for name, iso in countries.items()],
+    )
+    country_ids = {name: index + 1 for index, name in enumerate(countries)}
+    city_rows = []
+    for city in cities:
+        latitude, longitude = city_coordinates(city["city_name"])
+        city_rows.append(
+            {
+                "name": city["city_name"],
+                "country_id": country_ids[city["country_name"]],
+                "latitude": latitude,
+                "longitude": longitude,
+            }
+        )
+    session.execute(insert(City), city_rows)
+    return cities
+
+
+class BenchmarkDatabase:
+    """
+    Temporary database with the sqlite profile (the tuned one by default),
+    with a writer and a read only engine, removed on exit
+    """
+
+    def __init__(self, profile: SqliteProfile | None = None):
+        self.profile = profile if profile is not None else SqliteProfile()
+
+    def __enter__(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._folder.name, "bench.db")
+        database_url = f"sqlite:///{self.path}"
+        self.engine = build_engine(database_url, self.profile)
+        self.read_engine = build_engine(database_url, self.profile, read_only=True)
+        Base.metadata.create_all(bind=self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.ReadSession = sessionmaker(bind=self.read_engine)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.engine.dispose()
+        self.read_engine.dispose()
+        self._folder.cleanup()
+
+
+def current_hour() -> datetime:
+    """Start of the current utc hour"""
+    return datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def generate_history(
+    session: Session,
+    city_count: int,
+    hours: int,
+    end: datetime | None = None,
+    seed: int = 0,
+    batch_size: int = 5000,
+) -> int:
+    """
+    Fills the country, city, bronze and hourly weather tables with hours of
+    observations for city_count cities, ending at the end hour (the current
+    hour by default). The bronze watermark, the provider ids of the cities
+    and the daily rollup are stored as if the etl had produced the rows.
+    Returns the number of hourly rows.
+    """
+    if end is None:
+        end = current_hour()
+    rng = random.Random(seed)
+
+    seed_cities(session, city_count)
+
+    bronze_rows = []
+    hourly_rows = []
+    start = end - timedelta(hours=hours - 1)
+    for hour in range(hours):
+        dt = int((start + timedelta(hours=hour)).timestamp()) + rng.randrange(3600)
+        for bronze_row in hourly_bronze_rows(city_count, dt, rng):
+            payload = bronze_row["payload"]
+            bronze_rows.append(bronze_row)
+            hourly_rows.append(
+                {
+                    "city_id": bronze_row["city_id"],
+                    "hourly_timestamp": bronze_row["hourly_timestamp"],
+                    "temperature": payload["main"]["temp"],
+                    "wind_speed": payload["wind"]["speed"],
+                    "weather_condition": payload["weather"][0]["main"],
+                }
+            )
+        if len(bronze_rows) >= batch_size or hour == hours - 1:
+            session.execute(insert(HourlyWeatherBronze), bronze_rows)
+            session.execute(insert(HourlyWeather), hourly_rows)
+            bronze_rows = []
+            hourly_rows = []
+
+    # observed_at is left at 0 so every city is due in the ingest scenarios
+    session.execute(
+        insert(CityObservation),
+        [
+            {
+                "city_id": city_id,
+                "observed_at": 0,
+                "provider_id": PROVIDER_ID_OFFSET + city_id,
+            }
+            for city_id in range(1, city_count + 1)
+        ],
+    )
+    write_watermark(session, BRONZE_WATERMARK, city_count * hours)
+    refresh_daily_summaries(session)
+    session.commit()
+    return city_count * hours
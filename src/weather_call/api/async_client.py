@@ -0,0 +1,113 @@
+from weather_call.api.client import (
+    OPENWEATHER_BASE_URL,
+    BaseApiClient,
+    CircuitBreaker,
+)
+from weather_call import metrics
+import asyncio
+import httpx
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncTokenBucket:
+    """
+    Token bucket rate limiter shared by every task using the async client.
+    Waiting tasks sleep on the event loop instead of blocking it.
+    """
+
+    def __init__(self, rate: float, capacity: int | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Waits until a token is available and takes it"""
+        # tasks queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncApiClient(BaseApiClient):
+    """
+    Asyncio counterpart of ApiClient, built on a shared httpx.AsyncClient.
+    Keeps up to pool_size keep-alive connections for the concurrent tasks,
+    and applies the same rate limit, retries with jittered exponential
+    backoff and circuit breaker as the sync client.
+    Needs the async extra: pip install weather-call[async].
+    """
+
+    def __init__(
+        self,
+        base_url: str = OPENWEATHER_BASE_URL,
+        pool_size: int = 10,
+        timeout: float = 10.0,
+        rate_limit_per_minute: float | None = None,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        circuit_breaker: CircuitBreaker | None = None,
+    ):
+        super().__init__(
+            base_url, timeout, max_retries, backoff_base, backoff_max, circuit_breaker
+        )
+        self.rate_limiter = (
+            AsyncTokenBucket(rate_limit_per_minute / 60)
+            if rate_limit_per_minute
+            else None
+        )
+
+        self.http = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+        )
+
+    async def get(
+        self, path: str, params: dict, headers: dict | None = None
+    ) -> httpx.Response:
+        """
+        Sends a GET request to the api using the pooled client.
+        Responses that are not worth retrying are returned to the caller,
+        ApiError is raised when the retries are exhausted. headers are added
+        to the request, like the validators of a conditional request.
+        """
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.max_retries + 1):
+            self.circuit_breaker.before_request()
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+
+            try:
+                with metrics.span("api_request", path=path):
+                    response = await self.http.get(url, params=params, headers=headers)
+            except httpx.HTTPError as error:
+                delay = self.request_failed(path, attempt, error)
+            else:
+                delay = self.retry_delay(path, attempt, response)
+                if delay is None:
+                    return response
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self.http.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
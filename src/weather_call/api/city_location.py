@@ -1,20 +1,47 @@
-import requests
+from weather_call.api.client import ApiClient, ApiError, use_client
 from weather_call.schema.city import CityData
+from typing import TYPE_CHECKING
 
+# the async client needs the optional httpx dependency
+if TYPE_CHECKING:
+    from weather_call.api.async_client import AsyncApiClient
 
-def get_lat_long_from_api(city_name: str, country_code: str, api_key: str) -> dict:
+GEOCODING_PATH = "/geo/1.0/direct"
+
+
+def get_lat_long_from_api(
+    city_name: str, country_code: str, api_key: str, client: ApiClient | None = None
+) -> dict:
     """
     Fetches latitude and longitude for a given city name using a geocoding API
     """
+    with use_client(client) as client:
+        city_response = client.get(
+            GEOCODING_PATH, params=_geocoding_params(city_name, country_code, api_key)
+        )
+    return _geocoding_result(city_response, city_name, country_code)
+
 
-    city_response = requests.get(
-        f"http://api.openweathermap.org/geo/1.0/direct?q={city_name},{country_code}&limit=1&appid={api_key}"
+async def get_lat_long_from_api_async(
+    city_name: str, country_code: str, api_key: str, client: "AsyncApiClient"
+) -> dict:
+    """Fetches latitude and longitude for a given city name without blocking"""
+    city_response = await client.get(
+        GEOCODING_PATH, params=_geocoding_params(city_name, country_code, api_key)
     )
+    return _geocoding_result(city_response, city_name, country_code)
+
+
+def _geocoding_params(city_name: str, country_code: str, api_key: str) -> dict:
+    return {"q": f"{city_name},{country_code}", "limit": 1, "appid": api_key}
+
 
+def _geocoding_result(city_response, city_name: str, country_code: str) -> dict:
     if city_response.status_code == 200:
         return city_response.json()
 
     else:
-        raise Exception(
-            f"Error fetching data from Geocoding API: {city_response.status_code}. Error getting city {city_name} from country {country_code}"
+        raise ApiError(
+            f"Error fetching data from Geocoding API: {city_response.status_code}. Error getting city {city_name} from country {country_code}",
+            status_code=city_response.status_code,
         )
@@ -0,0 +1,310 @@
+from collections.abc import Iterator
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import requests
+from requests.adapters import HTTPAdapter
+from weather_call import metrics
+import asyncio
+import functools
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+OPENWEATHER_BASE_URL = "https://api.openweathermap.org"
+
+# statuses worth retrying: rate limited or temporary server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class ApiError(Exception):
+    """Raised when an api request fails, possibly after retries"""
+
+    def __init__(self, message: str, status_code: int | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(ApiError):
+    """Raised without calling the api while the circuit breaker is open"""
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter shared by every thread using the client.
+    Allows bursts of up to capacity requests and rate requests per second
+    on average.
+    """
+
+    def __init__(self, rate: float, capacity: int | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and takes it"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Stops calling the api after failure_threshold consecutive failures.
+    After reset_timeout seconds one trial request is let through: a success
+    closes the circuit again, a failure keeps it open for another timeout.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def before_request(self):
+        """Raises CircuitOpenError while the circuit is open"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError("Circuit breaker is open, skipping api call")
+            # half open: let this request through as a trial
+            self._opened_at = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(
+                        f"Opening circuit breaker after {self._failures} consecutive failures"
+                    )
+                self._opened_at = time.monotonic()
+
+
+def retry_after_seconds(response: requests.Response) -> float | None:
+    """Reads the Retry-After header, given either in seconds or as a date"""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class BaseApiClient:
+    """
+    Retry, backoff and circuit breaker decisions shared by the sync and the
+    asyncio clients, which only differ in how they send a request and wait.
+    Requests are retried with jittered exponential backoff (honoring
+    Retry-After, up to backoff_max) on 429 and 5xx responses, and are
+    short-circuited while the api keeps failing.
+    """
+
+    def __init__(
+        self,
+        base_url: str = OPENWEATHER_BASE_URL,
+        timeout: float = 10.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        circuit_breaker: CircuitBreaker | None = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.circuit_breaker = (
+            circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def request_failed(self, path: str, attempt: int, error: Exception) -> float:
+        """
+        Records a request that got no response. Returns the seconds to wait
+        before the next attempt, or raises ApiError after the last one.
+        """
+        metrics.count("api_responses", path=path, status="error")
+        self.circuit_breaker.record_failure()
+        if attempt == self.max_retries:
+            raise ApiError(f"Error calling {path}: {error}") from error
+        delay = self.backoff(attempt)
+        logger.warning(f"Error calling {path}: {error}, retrying in {delay:.1f}s")
+        metrics.count("api_retries", path=path)
+        return delay
+
+    def retry_delay(self, path: str, attempt: int, response) -> float | None:
+        """
+        Records a response. Returns None when it goes to the caller, else the
+        seconds to wait before retrying it, or raises ApiError when the
+        retries are exhausted.
+        """
+        metrics.count("api_responses", path=path, status=response.status_code)
+        if response.status_code not in RETRY_STATUS_CODES:
+            self.circuit_breaker.record_success()
+            return None
+
+        # a 429 means we are too fast, not that the api is down
+        if response.status_code != 429:
+            self.circuit_breaker.record_failure()
+        if attempt == self.max_retries:
+            raise ApiError(
+                f"Error calling {path}: {response.status_code} after {attempt + 1} attempts",
+                status_code=response.status_code,
+            )
+        delay = retry_after_seconds(response)
+        if delay is None:
+            delay = self.backoff(attempt)
+        # a far away Retry-After must not stall the run
+        delay = min(delay, self.backoff_max)
+        logger.warning(
+            f"Got {response.status_code} from {path}, retrying in {delay:.1f}s"
+        )
+        metrics.count("api_retries", path=path)
+        return delay
+
+
+class ApiClient(BaseApiClient):
+    """
+    Shared HTTP client for the OpenWeather APIs.
+    Keeps a keep-alive requests session with a connection pool sized for the
+    number of concurrent workers, so calls reuse connections instead of
+    opening a new one per request.
+    Every request goes through a token bucket matched to the plan quota,
+    and is retried and short-circuited as described in BaseApiClient.
+    """
+
+    def __init__(
+        self,
+        base_url: str = OPENWEATHER_BASE_URL,
+        pool_size: int = 10,
+        timeout: float = 10.0,
+        rate_limit_per_minute: float | None = None,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        circuit_breaker: CircuitBreaker | None = None,
+    ):
+        super().__init__(
+            base_url, timeout, max_retries, backoff_base, backoff_max, circuit_breaker
+        )
+        self.rate_limiter = (
+            TokenBucket(rate_limit_per_minute / 60) if rate_limit_per_minute else None
+        )
+
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+
+    def get(
+        self, path: str, params: dict, headers: dict | None = None
+    ) -> requests.Response:
+        """
+        Sends a GET request to the api using the pooled session.
+        Responses that are not worth retrying are returned to the caller,
+        ApiError is raised when the retries are exhausted. headers are added
+        to the request, like the validators of a conditional request.
+        """
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.max_retries + 1):
+            self.circuit_breaker.before_request()
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            try:
+                with metrics.span("api_request", path=path):
+                    response = self.http.get(
+                        url, params=params, headers=headers, timeout=self.timeout
+                    )
+            except requests.RequestException as error:
+                delay = self.request_failed(path, attempt, error)
+            else:
+                delay = self.retry_delay(path, attempt, response)
+                if delay is None:
+                    return response
+            time.sleep(delay)
+
+    def close(self):
+        self.http.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@contextmanager
+def use_client(client: ApiClient | None) -> Iterator[ApiClient]:
+    """
+    Yields the given client, or a new one closed on exit for the calls made
+    without a shared client
+    """
+    if client is not None:
+        yield client
+        return
+    with ApiClient() as client:
+        yield client
+
+
+class ExecutorClient:
+    """
+    Asyncio view of a sync ApiClient: every request runs on the executor
+    threads, or inline without executor, so the asyncio code paths can drive
+    the sync client. The pooled session, rate limit and circuit breaker
+    stay the ones of the wrapped client.
+    """
+
+    def __init__(self, client: ApiClient, executor: Executor | None = None):
+        self.client = client
+        self.executor = executor
+
+    @property
+    def circuit_breaker(self) -> CircuitBreaker:
+        return self.client.circuit_breaker
+
+    async def get(
+        self, path: str, params: dict, headers: dict | None = None
+    ) -> requests.Response:
+        if self.executor is None:
+            return self.client.get(path, params, headers)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(self.client.get, path, params, headers)
+        )
@@ -0,0 +1,94 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from weather_call.model.city import CityBronze
+from weather_call.model.country import Country
+from collections import OrderedDict
+from pathlib import Path
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class GeocodingCache:
+    """
+    Cache of geocoding api results keyed by normalized (city_name, country_code).
+    Entries are kept in memory with LRU eviction and persisted to a json file,
+    so rebuilding the database does not call the geocoder again.
+    """
+
+    def __init__(self, path: str | Path | None = None, max_size: int = 100_000):
+        self.path = Path(path) if path is not None else None
+        self.max_size = max_size
+        self._entries: OrderedDict[tuple[str, str], dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(city_name: str, country_code: str) -> tuple[str, str]:
+        return city_name.strip().lower(), country_code.strip().upper()
+
+    def get(self, city_name: str, country_code: str) -> dict | None:
+        """Returns the cached geocoding result, marking it as recently used"""
+        key = self.key(city_name, country_code)
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+            return payload
+
+    def put(self, city_name: str, country_code: str, payload: dict):
+        """Adds a geocoding result, evicting the least recently used ones"""
+        key = self.key(city_name, country_code)
+        with self._lock:
+            self._entries[key] = payload
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        """Loads the entries persisted on disk, if any"""
+        if self.path is None or not self.path.exists():
+            return
+        with open(self.path, encoding="utf-8") as cache_file:
+            for entry in json.load(cache_file):
+                self.put(entry["city_name"], entry["country_code"], entry["payload"])
+        logger.info(f"Loaded {len(self)} geocoding results from {self.path}")
+
+    def save(self):
+        """Persists the entries on disk, replacing the file atomically"""
+        if self.path is None:
+            return
+        with self._lock:
+            entries = [
+                {
+                    "city_name": city_name,
+                    "country_code": country_code,
+                    "payload": payload,
+                }
+                for (city_name, country_code), payload in self._entries.items()
+            ]
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as cache_file:
+            json.dump(entries, cache_file)
+        os.replace(tmp_path, self.path)
+        logger.info(f"Saved {len(entries)} geocoding results to {self.path}")
+
+    def warm_from_bronze(self, session: Session):
+        """Adds the geocoding results already stored in the CityBronze table"""
+        rows = session.execute(
+            select(CityBronze.name, Country.iso_3166, CityBronze.payload)
+            .join(Country)
+            .where(CityBronze.is_latest)
+            .order_by(CityBronze.id)
+        )
+        count = 0
+        for city_name, country_code, payload in rows:
+            self.put(city_name, country_code, payload)
+            count += 1
+        logger.info(f"Warmed geocoding cache with {count} results from bronze")
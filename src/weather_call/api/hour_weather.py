@@ -1,19 +1,257 @@
-import requests
+from weather_call.api.client import ApiClient, ApiError, ExecutorClient, use_client
+from weather_call import metrics
+from typing import TYPE_CHECKING
+import asyncio
 
+# the async client needs the optional httpx dependency
+if TYPE_CHECKING:
+    from weather_call.api.async_client import AsyncApiClient
+    from weather_call.observation_index import ObservationIndex
 
-def get_weather(lat: float, long: float, api_key: str) -> dict:
+WEATHER_PATH = "/data/2.5/weather"
+GROUP_PATH = "/data/2.5/group"
+
+
+def get_weather(
+    lat: float, long: float, api_key: str, client: ApiClient | None = None
+) -> dict:
     """
-    Fetches latitude and longitude for a given city name using a geocoding API
+    Fetches the current weather for a given latitude and longitude.
+    Uses the shared client when given, so connections are reused across calls.
+    """
+    with use_client(client) as client:
+        response = client.get(WEATHER_PATH, params=_weather_params(lat, long, api_key))
+    return _weather_result(response, lat, long)
+
+
+async def get_weather_async(
+    lat: float, long: float, api_key: str, client: "AsyncApiClient | ExecutorClient"
+) -> dict:
+    """Fetches the current weather for a latitude and longitude without blocking"""
+    response = await client.get(
+        WEATHER_PATH, params=_weather_params(lat, long, api_key)
+    )
+    return _weather_result(response, lat, long)
+
+
+def get_weather_if_modified(
+    city, api_key: str, client: ApiClient, observations: "ObservationIndex"
+) -> dict | None:
     """
+    Fetches the current weather of a city (any object with id, latitude and
+    longitude) as a conditional request, sending the ETag and Last-Modified
+    of its previous response when the provider gave them. Returns None when
+    the provider answers 304 Not Modified, and keeps the new validators.
+    """
+    response = client.get(
+        WEATHER_PATH,
+        params=_weather_params(city.latitude, city.longitude, api_key),
+        headers=_conditional_headers(observations, city.id),
+    )
+    return _conditional_result(response, city, observations)
+
+
+async def get_weather_if_modified_async(
+    city,
+    api_key: str,
+    client: "AsyncApiClient | ExecutorClient",
+    observations: "ObservationIndex",
+) -> dict | None:
+    """Asyncio counterpart of get_weather_if_modified"""
+    response = await client.get(
+        WEATHER_PATH,
+        params=_weather_params(city.latitude, city.longitude, api_key),
+        headers=_conditional_headers(observations, city.id),
+    )
+    return _conditional_result(response, city, observations)
+
+
+def _conditional_headers(observations: "ObservationIndex", city_id: int) -> dict:
+    observation = observations.get(city_id)
+    headers = {}
+    if observation is not None and observation.etag is not None:
+        headers["If-None-Match"] = observation.etag
+    if observation is not None and observation.last_modified is not None:
+        headers["If-Modified-Since"] = observation.last_modified
+    return headers
+
+
+def _conditional_result(response, city, observations: "ObservationIndex"):
+    if response.status_code == 304:
+        metrics.count("not_modified_responses")
+        return None
+    payload = _weather_result(response, city.latitude, city.longitude)
+    observations.record_validators(
+        city.id, response.headers.get("ETag"), response.headers.get("Last-Modified")
+    )
+    return payload
+
+
+def _weather_params(lat: float, long: float, api_key: str) -> dict:
     part = "current,minutely,daily,alerts"
     units = "metric"
-    response = requests.get(
-        f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={long}&exclude={part}&units={units}&appid={api_key}"
-    )
+    return {
+        "lat": lat,
+        "lon": long,
+        "exclude": part,
+        "units": units,
+        "appid": api_key,
+    }
 
+
+def _weather_result(response, lat: float, long: float) -> dict:
     if response.status_code == 200:
         return response.json()
     else:
-        raise Exception(
-            f"Error fetching data from Hourly Weather API: {response.status_code}. Error getting weather for lat {lat} and long {long}"
+        raise ApiError(
+            f"Error fetching data from Hourly Weather API: {response.status_code}. Error getting weather for lat {lat} and long {long}",
+            status_code=response.status_code,
         )
+
+
+def get_weather_at(
+    lat: float, long: float, dt: int, api_key: str, client: ApiClient | None = None
+) -> dict:
+    """
+    Fetches the weather observed at a past unix time from the one call
+    timemachine endpoint. Returns the observation with the lat and lon of
+    the response, raising ApiError when the provider has no data for it.
+    """
+    with use_client(client) as client:
+        response = client.get(
+            "/data/3.0/onecall/timemachine",
+            params={
+                "lat": lat,
+                "lon": long,
+                "dt": dt,
+                "units": "metric",
+                "appid": api_key,
+            },
+        )
+
+    if response.status_code == 200:
+        body = response.json()
+        if not body.get("data"):
+            raise ApiError(
+                f"No historical weather for lat {lat} and long {long} at {dt}",
+                status_code=404,
+            )
+        return {"lat": body.get("lat"), "lon": body.get("lon"), **body["data"][0]}
+    else:
+        raise ApiError(
+            f"Error fetching data from Timemachine Weather API: {response.status_code}. Error getting weather for lat {lat} and long {long} at {dt}",
+            status_code=response.status_code,
+        )
+
+
+# largest number of city ids accepted by the group endpoint
+GROUP_MAX_IDS = 20
+
+
+def get_weather_group(
+    provider_ids: list[int], api_key: str, client: ApiClient | None = None
+) -> dict[int, dict]:
+    """
+    Fetches the current weather for several OpenWeather city ids in a single
+    request to the group endpoint, keyed by OpenWeather city id.
+    """
+    params = _group_params(provider_ids, api_key)
+    with use_client(client) as client:
+        response = client.get(GROUP_PATH, params=params)
+    return _group_result(response, provider_ids)
+
+
+async def get_weather_group_async(
+    provider_ids: list[int], api_key: str, client: "AsyncApiClient | ExecutorClient"
+) -> dict[int, dict]:
+    """Fetches the current weather of several city ids in one non blocking request"""
+    params = _group_params(provider_ids, api_key)
+    response = await client.get(GROUP_PATH, params=params)
+    return _group_result(response, provider_ids)
+
+
+def _group_params(provider_ids: list[int], api_key: str) -> dict:
+    if len(provider_ids) > GROUP_MAX_IDS:
+        raise ValueError(
+            f"The group endpoint accepts at most {GROUP_MAX_IDS} ids, got {len(provider_ids)}"
+        )
+    return {
+        "id": ",".join(str(provider_id) for provider_id in provider_ids),
+        "units": "metric",
+        "appid": api_key,
+    }
+
+
+def _group_result(response, provider_ids: list[int]) -> dict[int, dict]:
+    if response.status_code == 200:
+        return {payload["id"]: payload for payload in response.json()["list"]}
+    else:
+        raise ApiError(
+            f"Error fetching data from Group Weather API: {response.status_code}. Error getting weather for ids {provider_ids}",
+            status_code=response.status_code,
+        )
+
+
+def get_weather_batch(
+    cities: list,
+    api_key: str,
+    provider_ids: dict[int, int] | None = None,
+    client: ApiClient | None = None,
+    observations: "ObservationIndex | None" = None,
+) -> list[tuple[object, dict | None]]:
+    """
+    Fetches the current weather for a batch of cities, see
+    get_weather_batch_async, which runs on the sync client
+    """
+    if provider_ids is None:
+        provider_ids = {}
+    with use_client(client) as client:
+        return asyncio.run(
+            get_weather_batch_async(
+                cities, api_key, provider_ids, ExecutorClient(client), observations
+            )
+        )
+
+
+async def get_weather_batch_async(
+    cities: list,
+    api_key: str,
+    provider_ids: dict[int, int],
+    client: "AsyncApiClient | ExecutorClient",
+    observations: "ObservationIndex | None" = None,
+) -> list[tuple[object, dict | None]]:
+    """
+    Fetches the current weather for a batch of cities (City rows or any object
+    with id, latitude and longitude) and returns (city, payload) pairs.
+    Cities with a known OpenWeather id are fetched with one group request,
+    the others fall back to one request per city. With observations, the
+    requests per city are conditional and a city not modified since its
+    previous response gets a None payload.
+    """
+    grouped = [city for city in cities if city.id in provider_ids]
+    single = [city for city in cities if city.id not in provider_ids]
+
+    results = []
+    if grouped:
+        payloads = await get_weather_group_async(
+            [provider_ids[city.id] for city in grouped], api_key, client
+        )
+        for city in grouped:
+            payload = payloads.get(provider_ids[city.id])
+            if payload is None:
+                # the provider did not return this id, ask by coordinates
+                single.append(city)
+            else:
+                results.append((city, payload))
+
+    for city in single:
+        if observations is not None:
+            payload = await get_weather_if_modified_async(
+                city, api_key, client, observations
+            )
+        else:
+            payload = await get_weather_async(
+                city.latitude, city.longitude, api_key, client
+            )
+        results.append((city, payload))
+    return results
@@ -0,0 +1,301 @@
+from sqlalchemy import DateTime, exists, func, literal, select, true, type_coerce
+from sqlalchemy.orm import Session
+from weather_call.model.city import City
+from weather_call.model.weather import HourlyWeather
+from weather_call.api.client import ApiClient, ApiError
+from weather_call.api.hour_weather import get_weather_at
+from weather_call.city_registry import CityRegistry, city_registry
+from weather_call.etl_service import build_bronze_row, write_bronze_batch
+from weather_call.transform import transform_bronze_to_silver
+from weather_call.watermark import read_watermark, write_watermark
+from weather_call import metrics
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+HOUR = timedelta(hours=1)
+EPOCH = datetime(1970, 1, 1)
+
+# prefix of the checkpoint of a backfill range: the last hour of the range
+# that was completely fetched, in hours since epoch
+BACKFILL_CHECKPOINT = "backfill_hour"
+
+# first hour, in hours since epoch, of the last backfill without end that
+# stopped before the current hour, 0 when it completed
+PENDING_BACKFILL_START = "backfill_pending_start"
+
+# the provider has no data for the hour, asking again will not help
+UNAVAILABLE_STATUS_CODES = {400, 404}
+
+# format of the datetimes stored by sqlalchemy in sqlite, at the hour
+SQLITE_HOUR_FORMAT = "%Y-%m-%d %H:00:00.000000"
+
+
+class BackfillResult(NamedTuple):
+    """Outcome of a backfill run"""
+
+    missing: int
+    filled: int
+    unavailable: int
+    complete: bool
+
+
+def utc_hour(moment: datetime) -> datetime:
+    """Start of the hour containing moment, as naive utc like the stored rows"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def hour_number(hour: datetime) -> int:
+    """Hours since epoch of a naive utc hour"""
+    return (hour - EPOCH) // HOUR
+
+
+def backfill_checkpoint(first_hour: datetime, end_hour: datetime | None) -> str:
+    """
+    Name of the checkpoint of a backfill range, from its first hour and its
+    requested end only, so a run interrupted in a previous hour resumes it
+    """
+    if end_hour is None:
+        return f"{BACKFILL_CHECKPOINT}:{hour_number(first_hour)}"
+    return f"{BACKFILL_CHECKPOINT}:{hour_number(first_hour)}:{hour_number(end_hour)}"
+
+
+def pending_backfill_start(session: Session) -> datetime | None:
+    """First hour of the last backfill without end that did not complete"""
+    pending = read_watermark(session, PENDING_BACKFILL_START)
+    return EPOCH + pending * HOUR if pending else None
+
+
+def find_missing_hours(
+    session: Session,
+    first_hour: datetime,
+    hour_count: int,
+    city_ids: list[int] | None = None,
+) -> list[tuple[int, datetime]]:
+    """
+    Returns the (city_id, hourly_timestamp) pairs without an hourly weather
+    row among hour_count hours from first_hour, ordered by hour and city.
+    The hours are generated by a recursive cte and crossed with the cities
+    in one query, the lookups seek on the uq_city_time index.
+    """
+    if hour_count <= 0:
+        return []
+    offsets = select(literal(0).label("offset")).cte("offsets", recursive=True)
+    offsets = offsets.union_all(
+        select(offsets.c.offset + 1).where(offsets.c.offset < hour_count - 1)
+    )
+    hours = select(
+        func.strftime(
+            SQLITE_HOUR_FORMAT,
+            first_hour.strftime("%Y-%m-%d %H:%M:%S"),
+            func.printf("+%d hours", offsets.c.offset),
+        ).label("hourly_timestamp")
+    ).cte("hours")
+
+    stmt = (
+        select(City.id, type_coerce(hours.c.hourly_timestamp, DateTime))
+        .join(hours, true())
+        .where(
+            ~exists().where(
+                HourlyWeather.city_id == City.id,
+                HourlyWeather.hourly_timestamp == hours.c.hourly_timestamp,
+            )
+        )
+        .order_by(hours.c.hourly_timestamp, City.id)
+    )
+    if city_ids is not None:
+        stmt = stmt.where(City.id.in_(city_ids))
+    return [(city_id, hour) for city_id, hour in session.execute(stmt)]
+
+
+def plan_chunks(
+    missing: list[tuple[int, datetime]], chunk_size: int
+) -> list[list[tuple[int, datetime]]]:
+    """
+    Splits the missing hours in chunks of whole hours with about chunk_size
+    fetches each, so a chunk done means every hour in it is done.
+    """
+    chunks = []
+    chunk = []
+    for index, (city_id, hour) in enumerate(missing):
+        chunk.append((city_id, hour))
+        last_of_hour = index + 1 == len(missing) or missing[index + 1][1] != hour
+        if last_of_hour and len(chunk) >= chunk_size:
+            chunks.append(chunk)
+            chunk = []
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def fetch_chunk(
+    executor: ThreadPoolExecutor,
+    chunk: list[tuple[int, datetime]],
+    locations: dict[int, tuple[float, float]],
+    api_key: str,
+    client: ApiClient,
+) -> tuple[list[dict], int, int]:
+    """
+    Fetches every (city_id, hour) of the chunk concurrently and returns the
+    bronze rows, the number of hours the provider has no data for and the
+    number of failed requests.
+    """
+    futures = {}
+    for city_id, hour in chunk:
+        latitude, longitude = locations[city_id]
+        dt = int(hour.replace(tzinfo=timezone.utc).timestamp())
+        futures[
+            executor.submit(get_weather_at, latitude, longitude, dt, api_key, client)
+        ] = (city_id, hour)
+
+    bronze_rows = []
+    unavailable = 0
+    failed = 0
+    for future in as_completed(futures):
+        city_id, hour = futures[future]
+        try:
+            bronze_rows.append(build_bronze_row(city_id, future.result()))
+        except ApiError as e:
+            if e.status_code in UNAVAILABLE_STATUS_CODES:
+                unavailable += 1
+                logger.debug(f"No historical weather for city {city_id} at {hour}")
+            else:
+                failed += 1
+                logger.warning(f"Backfill of city {city_id} at {hour} failed: {e}")
+    return bronze_rows, unavailable, failed
+
+
+def backfill_hourly_weather(
+    session: Session,
+    api_key: str,
+    start: datetime,
+    end: datetime | None = None,
+    cities: list[dict] | None = None,
+    client: ApiClient | None = None,
+    max_concurrency: int = 8,
+    max_calls: int | None = None,
+    chunk_size: int = 1000,
+    batch_size: int = 1000,
+    registry: CityRegistry | None = None,
+) -> BackfillResult:
+    """
+    Fills the hourly weather rows missing between start and end (end
+    excluded, the current hour by default) from the historical endpoint.
+    Naive datetimes are utc. Every city in the database is backfilled unless
+    cities is given.
+    Missing hours are fetched oldest first, in chunks of whole hours run
+    concurrently on a bounded thread pool; the api client rate limiter
+    keeps the requests within the quota and max_calls caps the requests of
+    the run. The bronze rows of every chunk go through the bronze to silver
+    stage, without its age cutoff, which refreshes the daily rollup and
+    invalidates the cached reports.
+    After every chunk a checkpoint of the range is committed, so an
+    interrupted or capped run resumes after the last completed hour when it
+    is run again with the same start and end, even in a later hour. A chunk
+    with failed requests stops the run without moving the checkpoint.
+    """
+    first_hour = utc_hour(start)
+    end_hour = utc_hour(datetime.now(timezone.utc))
+    requested_end_hour = None
+    if end is not None:
+        requested_end_hour = utc_hour(end + HOUR - timedelta(microseconds=1))
+        end_hour = min(end_hour, requested_end_hour)
+    hour_count = math.ceil((end_hour - first_hour) / HOUR)
+    checkpoint = backfill_checkpoint(first_hour, requested_end_hour)
+
+    # hours up to the checkpoint were completed by a previous run
+    done_hour = read_watermark(session, checkpoint, default=hour_number(first_hour) - 1)
+    resume_hour = EPOCH + (done_hour + 1) * HOUR
+    remaining_hours = hour_count - (done_hour + 1 - hour_number(first_hour))
+    if resume_hour > first_hour:
+        logger.info(f"Resuming the backfill from {resume_hour}")
+
+    city_query = select(City.id, City.latitude, City.longitude)
+    if cities is not None:
+        if registry is None:
+            registry = city_registry
+        city_ids = [location.id for location in registry.resolve(session, cities)]
+        city_query = city_query.where(City.id.in_(city_ids))
+    else:
+        city_ids = None
+    locations = {
+        city_id: (float(latitude), float(longitude))
+        for city_id, latitude, longitude in session.execute(city_query)
+    }
+
+    with metrics.span("backfill_plan"):
+        missing = find_missing_hours(session, resume_hour, remaining_hours, city_ids)
+    logger.info(
+        f"Backfill from {resume_hour} to {end_hour}: {len(missing)} missing city hours"
+    )
+
+    owns_client = client is None
+    if owns_client:
+        client = ApiClient(pool_size=max_concurrency)
+
+    calls = 0
+    filled = 0
+    unavailable = 0
+    complete = True
+    try:
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            for chunk in plan_chunks(missing, chunk_size):
+                partial = False
+                if max_calls is not None:
+                    if calls >= max_calls:
+                        complete = False
+                        break
+                    if len(chunk) > max_calls - calls:
+                        chunk = chunk[: max_calls - calls]
+                        partial = True
+
+                with metrics.span("backfill_fetch"):
+                    bronze_rows, chunk_unavailable, failed = fetch_chunk(
+                        executor, chunk, locations, api_key, client
+                    )
+                calls += len(chunk)
+                unavailable += chunk_unavailable
+                filled += len(bronze_rows)
+                metrics.count("backfill_rows", len(bronze_rows))
+
+                write_bronze_batch(session, bronze_rows, batch_size)
+                # historical rows are older than the cutoff of the hourly runs
+                transform_bronze_to_silver(session, batch_size=batch_size, max_age=None)
+
+                if failed or partial:
+                    session.commit()
+                    complete = False
+                    if failed:
+                        logger.error(
+                            f"Stopping the backfill, {failed} requests failed in the chunk"
+                        )
+                    break
+                write_watermark(session, checkpoint, hour_number(chunk[-1][1]))
+                session.commit()
+    finally:
+        if owns_client:
+            client.close()
+
+    if complete:
+        write_watermark(session, checkpoint, hour_number(end_hour) - 1)
+    else:
+        logger.info(f"Backfill stopped after {calls} requests, run it again to resume")
+    if end is None:
+        # lets the next run without start resume this one, see
+        # pending_backfill_start
+        pending = read_watermark(session, PENDING_BACKFILL_START)
+        if not complete:
+            write_watermark(session, PENDING_BACKFILL_START, hour_number(first_hour))
+        elif pending and pending >= hour_number(first_hour):
+            write_watermark(session, PENDING_BACKFILL_START, 0)
+    session.commit()
+    logger.info(
+        f"Backfilled {filled} of {len(missing)} missing city hours, {unavailable} not available"
+    )
+    return BackfillResult(len(missing), filled, unavailable, complete)
@@ -0,0 +1,99 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from weather_call.model.city import City
+from weather_call.model.country import Country
+from typing import NamedTuple
+from pathlib import Path
+import csv
+import logging
+
+logger = logging.getLogger(__name__)
+
+# cities tracked when no cities file is configured
+DEFAULT_CITIES = [
+    {"city_name": "milan", "country_name": "italy", "iso_3166": "IT"},
+    {"city_name": "bologna", "country_name": "italy", "iso_3166": "IT"},
+    {"city_name": "cagliari", "country_name": "italy", "iso_3166": "IT"},
+]
+
+
+class CityLocation(NamedTuple):
+    """Id and coordinates of a city stored in the database"""
+
+    id: int
+    name: str
+    country_name: str
+    latitude: float
+    longitude: float
+
+
+def load_city_list(path: str | Path | None = None) -> list[dict]:
+    """
+    Loads the tracked cities from a csv file with the columns
+    city_name, country_name and iso_3166, or the default cities
+    when no file is given.
+    """
+    if path is None:
+        return [dict(city) for city in DEFAULT_CITIES]
+
+    with open(path, newline="", encoding="utf-8") as cities_file:
+        cities = [
+            {
+                "city_name": row["city_name"].strip().lower(),
+                "country_name": row["country_name"].strip().lower(),
+                "iso_3166": row["iso_3166"].strip().upper(),
+            }
+            for row in csv.DictReader(cities_file)
+        ]
+    logger.info(f"Loaded {len(cities)} cities from {path}")
+    return cities
+
+
+class CityRegistry:
+    """
+    In-process cache of city locations keyed by (city_name, country_name).
+    Missing cities are loaded with one query per country set instead of one
+    query per city.
+    """
+
+    def __init__(self):
+        self._locations: dict[tuple[str, str], CityLocation] = {}
+
+    def refresh(self, session: Session, country_names: set[str] | None = None):
+        """Loads every city of the given countries (or of all countries)"""
+        stmt = select(
+            City.id, City.name, Country.name, City.latitude, City.longitude
+        ).join(Country)
+        if country_names is not None:
+            stmt = stmt.where(Country.name.in_(country_names))
+
+        for row in session.execute(stmt):
+            location = CityLocation(*row)
+            self._locations[(location.name, location.country_name)] = location
+        logger.debug(f"City registry holds {len(self._locations)} cities")
+
+    def resolve(self, session: Session, cities: list[dict]) -> list[CityLocation]:
+        """
+        Returns the location of every city, skipping the ones that are not
+        in the database yet.
+        """
+        keys = [(city["city_name"], city["country_name"]) for city in cities]
+        missing = {key for key in keys if key not in self._locations}
+        if missing:
+            self.refresh(session, {country_name for _, country_name in missing})
+
+        locations = []
+        for key in keys:
+            location = self._locations.get(key)
+            if location is None:
+                logger.warning(f"City {key[0]}, {key[1]} not found in database")
+                continue
+            locations.append(location)
+        return locations
+
+    def clear(self):
+        self._locations.clear()
+
+
+# shared registry, kept warm for the lifetime of the process
+city_registry = CityRegistry()
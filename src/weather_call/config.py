@@ -1,3 +1,4 @@
+from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -12,4 +13,107 @@ class Config(BaseSettings):
         extra="ignore",
     )
 
-    api_key: str
+    # only needed by the commands that call the api, reports run without it
+    api_key: str | None = None
+
+    # api client
+    api_base_url: str = "https://api.openweathermap.org"
+    request_timeout: float = 10.0
+    geocoding_cache_file: str = "./data/geocoding_cache.json"
+    # free plan quota
+    rate_limit_per_minute: float = 60
+    max_retries: int = 3
+    backoff_base: float = 0.5
+    backoff_max: float = 30.0
+    circuit_breaker_failures: int = 5
+    circuit_breaker_reset: float = 60.0
+
+    # etl
+    cities_file: str | None = None
+    max_concurrency: int = 8
+    write_batch_size: int = 1000
+    # cities per group weather request, 1 for providers without batching;
+    # the group endpoint takes at most 20 ids (GROUP_MAX_IDS)
+    fetch_group_size: int = Field(default=20, ge=1, le=20)
+    # the provider refreshes the current weather about every 10 minutes,
+    # cities observed more recently are not fetched again (0 fetches all)
+    observation_refresh_minutes: float = 10
+    # minutes of every hour over which the serve mode spreads the fetches
+    schedule_spread_minutes: float = 45
+
+    # backfill
+    # most historical requests of a backfill run, a capped run is resumed by
+    # the next one
+    backfill_max_calls: int | None = None
+
+    # bronze retention
+    # folder of the zstd compressed parquet archive of the aged bronze rows,
+    # aged rows stay in the database with their payload pruned when unset
+    bronze_archive_root: str | None = None
+    # bronze rows of older hours are moved to the archive by the compact command
+    bronze_retention_days: float = 30
+
+    # reports
+    # hive partitioned parquet export of the hourly weather table, when set
+    # reports are read from it instead of SQLite
+    parquet_root: str | None = None
+    # compute the reports from the daily rollup table
+    report_rollup: bool = False
+    # stream the report window in batches that fit in this many MiB
+    report_memory_limit_mb: float | None = None
+    # compute the reports on a pool of this many processes, each reading a
+    # shard of the cities on its own connection
+    report_workers: int | None = None
+    # seconds a cached report stays valid, results are also dropped as soon
+    # as new hourly rows are written
+    report_cache_ttl: float = 300.0
+    # folder where cached reports are persisted as parquet, to reuse them
+    # across runs
+    report_cache_dir: str | None = None
+
+    # observability
+    # file where the stage timings and counters of a run are written, json
+    # when it ends with .json and prometheus text otherwise; metrics are
+    # not collected when unset
+    metrics_file: str | None = None
+
+
+class SqliteProfile(BaseSettings):
+    """
+    Performance profile of the sqlite engine: pragmas run on every new
+    connection and the size of the reader pool.
+    Values are read from SQLITE_ prefixed env variables.
+    """
+
+    model_config = SettingsConfigDict(
+        env_prefix="SQLITE_",
+        env_file=".env",
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+
+    # write ahead log lets readers run while the writer commits
+    journal_mode: str = "WAL"
+    # with WAL, NORMAL only syncs on checkpoints instead of every commit
+    synchronous: str = "NORMAL"
+    # negative values are KiB, so 64 MiB of page cache per connection
+    cache_size: int = -64_000
+    mmap_size: int = 256 * 1024 * 1024
+    temp_store: str = "MEMORY"
+    # milliseconds to wait for a lock before failing with "database is locked"
+    busy_timeout: int = 5_000
+
+    # connections of the read only engine used by reports
+    reader_pool_size: int = 5
+
+    @classmethod
+    def sqlite_defaults(cls) -> "SqliteProfile":
+        """Profile matching a plain sqlite connection, used as a baseline"""
+        return cls(
+            journal_mode="DELETE",
+            synchronous="FULL",
+            cache_size=-2_000,
+            mmap_size=0,
+            temp_store="DEFAULT",
+            busy_timeout=0,
+        )
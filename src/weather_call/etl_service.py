@@ -1,97 +1,449 @@
-from sqlalchemy import select, Engine
+from sqlalchemy import delete, insert, select
 from sqlalchemy.orm import Session
-from weather_call.model.database import Base
-from weather_call.model.city import City
-from weather_call.model.country import Country
-from weather_call.schema.weather import HourlyWeatherData, HourlyWeatherDataBronze
-from weather_call.model.weather import HourlyWeatherBronze, HourlyWeather
 from sqlalchemy.dialects.sqlite import insert as sqlite_insert
-from weather_call.api.hour_weather import get_weather
-from datetime import datetime, timezone, timedelta
+from weather_call.schema.weather import HourlyWeatherDataBronze
+from weather_call.model.weather import HourlyWeatherBronze
+from weather_call.model.dead_letter import DeadLetterCity
+from weather_call.transform import transform_bronze_to_silver
+from weather_call.api.client import ApiClient, ApiError, ExecutorClient
+from weather_call import metrics
+from weather_call.city_registry import (
+    CityLocation,
+    CityRegistry,
+    city_registry,
+    load_city_list,
+)
+from weather_call.observation_index import ObservationIndex, observation_index
+from weather_call.api.hour_weather import (
+    GROUP_MAX_IDS,
+    get_weather_async,
+    get_weather_batch_async,
+)
+from collections.abc import Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, NamedTuple
+import asyncio
 import logging
 
+# the async path needs the optional httpx and aiosqlite dependencies
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from weather_call.api.async_client import AsyncApiClient
+
 logger = logging.getLogger(__name__)
 
 
-def add_new_hourly_data(session: Session, api_key: str):
+def build_bronze_row(city_id: int, payload: dict) -> dict:
+    """Builds the bronze row for one current weather api response"""
+    dt = payload["dt"]
+    full_timestamp = datetime.fromtimestamp(dt, timezone.utc)
+    hourly_timestamp = full_timestamp.replace(minute=0, second=0, microsecond=0)
+
+    hourly_bronze = HourlyWeatherDataBronze(
+        city_id=city_id, payload=payload, hourly_timestamp=hourly_timestamp
+    )
+    logger.debug(f"Bronze row for city {city_id} at {hourly_timestamp}")
+    return hourly_bronze.model_dump()
+
+
+def write_bronze_batch(
+    session: Session, bronze_rows: list[dict], batch_size: int = 1000
+):
     """
-    Populates the DimCityLocation table with the required cities
-    if they do not already exist.
+    Writes the bronze rows with executemany inserts of at most batch_size rows.
+    Nothing is committed, so a whole run can be written in one transaction.
     """
-    cities = [
-        {"city_name": "milan", "country_name": "italy"},
-        {"city_name": "bologna", "country_name": "italy"},
-        {"city_name": "cagliari", "country_name": "italy"},
+    with metrics.span("bronze_insert"):
+        for start in range(0, len(bronze_rows), batch_size):
+            session.execute(
+                insert(HourlyWeatherBronze), bronze_rows[start : start + batch_size]
+            )
+    metrics.count("bronze_rows", len(bronze_rows))
+
+
+def load_dead_letters(session: Session) -> set[int]:
+    """Ids of the cities that previous runs could not fetch"""
+    return set(session.scalars(select(DeadLetterCity.city_id)))
+
+
+def save_dead_letters(
+    session: Session,
+    plan: "FetchPlan",
+    failed: list[CityLocation],
+    errors: dict[int, str],
+):
+    """
+    Keeps the cities a run could not fetch in the dead letter table, with
+    their last error, and drops the ones the run fetched from it. Nothing
+    is committed.
+    """
+    failed_ids = {location.id for location in failed}
+    fetched_ids = [
+        location.id
+        for batch in plan.batches
+        for location in batch
+        if location.id in plan.dead_letter_ids and location.id not in failed_ids
     ]
-    for city_data in cities:
-        logger.info(
-            f"Processing city: {city_data['city_name']}, {city_data['country_name']}"
+    if fetched_ids:
+        session.execute(
+            delete(DeadLetterCity).where(DeadLetterCity.city_id.in_(fetched_ids))
         )
-        # Check if the city already exists to prevent duplicate insertions
-        city_value = session.execute(
-            select(City.latitude, City.longitude, City.id)
-            .join(Country)
-            .where(
-                (City.name == city_data["city_name"])
-                & (Country.name == city_data["country_name"])
+    if not failed:
+        return
+    stmt = sqlite_insert(DeadLetterCity)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["city_id"],
+        set_={
+            "failed_runs": DeadLetterCity.failed_runs + 1,
+            "error": stmt.excluded.error,
+            "updated_at": datetime.now(timezone.utc),
+        },
+    )
+    session.execute(
+        stmt,
+        [
+            {
+                "city_id": location.id,
+                "failed_runs": 1,
+                "error": errors.get(location.id, "")[:500],
+            }
+            for location in failed
+        ],
+    )
+
+
+class FetchPlan(NamedTuple):
+    """
+    Batches of a run, the api calls saved by skipping fresh cities and the
+    cities previous runs could not fetch
+    """
+
+    provider_ids: dict[int, int]
+    batches: list[list[CityLocation]]
+    skipped_cities: int
+    saved_calls: int
+    dead_letter_ids: set[int]
+
+
+def batch_locations(
+    locations: list[CityLocation], provider_ids: dict[int, int], group_size: int
+) -> list[list[CityLocation]]:
+    """Cities with a known provider id group_size at a time, the others alone"""
+    grouped = [location for location in locations if location.id in provider_ids]
+    batches = [
+        grouped[start : start + group_size]
+        for start in range(0, len(grouped), group_size)
+    ]
+    batches += [[location] for location in locations if location.id not in provider_ids]
+    return batches
+
+
+def plan_fetch_batches(
+    session: Session,
+    cities: list[dict] | None = None,
+    registry: CityRegistry | None = None,
+    group_size: int = GROUP_MAX_IDS,
+    observations: ObservationIndex | None = None,
+) -> FetchPlan:
+    """
+    Resolves the locations of the cities, leaves out the ones observed too
+    recently to have a newer observation and splits the others in fetch
+    batches.
+    """
+    if cities is None:
+        cities = load_city_list()
+    if registry is None:
+        registry = city_registry
+    if observations is None:
+        observations = observation_index
+
+    # ids and coordinates of every city, from the cache or one bulk query
+    locations = registry.resolve(session, cities)
+    observations.load(session)
+    now = datetime.now(timezone.utc)
+    due = [location for location in locations if observations.is_due(location.id, now)]
+    # the cities previous runs could not fetch go first
+    dead_letter_ids = load_dead_letters(session)
+    due.sort(key=lambda location: location.id not in dead_letter_ids)
+    retried = sum(1 for location in due if location.id in dead_letter_ids)
+    if retried:
+        logger.info(f"Retrying {retried} cities left by the previous runs")
+    logger.info(
+        f"Fetching hourly weather for {len(due)} cities, {len(locations) - len(due)} were observed in the last {observations.refresh_seconds:.0f}s"
+    )
+
+    # cities with a known provider id share group requests, the others go alone
+    provider_ids = observations.provider_ids() if group_size > 1 else {}
+    batches = batch_locations(due, provider_ids, group_size)
+    grouped = sum(1 for location in due if location.id in provider_ids)
+    logger.info(
+        f"Fetching {grouped} cities in group requests and {len(due) - grouped} cities one by one"
+    )
+    saved_calls = len(batch_locations(locations, provider_ids, group_size)) - len(
+        batches
+    )
+    return FetchPlan(
+        provider_ids,
+        batches,
+        len(locations) - len(due),
+        saved_calls,
+        dead_letter_ids,
+    )
+
+
+def keep_new_payloads(
+    results: list[tuple[CityLocation, dict | None]],
+    observations: ObservationIndex,
+    bronze_rows: list[dict],
+) -> tuple[int, int]:
+    """
+    Appends the bronze rows of the payloads newer than the last observation
+    of their city. Returns the number of not modified responses and of
+    payloads with an observation already stored, which are left out.
+    """
+    not_modified = 0
+    unchanged = 0
+    for location, payload in results:
+        if payload is None:
+            not_modified += 1
+        elif observations.record(location.id, payload["dt"], payload.get("id")):
+            bronze_rows.append(build_bronze_row(location.id, payload))
+        else:
+            unchanged += 1
+    return not_modified, unchanged
+
+
+def log_saved_calls(plan: FetchPlan, not_modified: int, unchanged: int):
+    """Logs and counts the api calls and the bronze rows saved by a run"""
+    metrics.count("saved_api_calls", plan.saved_calls)
+    metrics.count("unchanged_observations", unchanged)
+    logger.info(
+        f"Saved {plan.saved_calls} api calls by skipping {plan.skipped_cities} recently observed cities, "
+        f"left out {not_modified} not modified responses and {unchanged} unchanged observations"
+    )
+
+
+def store_bronze_rows(
+    session: Session,
+    bronze_rows: list[dict],
+    batch_size: int,
+    observations: ObservationIndex | None = None,
+):
+    """
+    Writes the bronze rows of a run, and the observations it recorded, and
+    transforms them, committing everything
+    """
+    try:
+        if observations is not None:
+            observations.save(session)
+        logger.info(f"Writing {len(bronze_rows)} bronze rows")
+        write_bronze_batch(session, bronze_rows, batch_size)
+
+        # derive the hourly weather rows from the new bronze rows, committing both
+        transform_bronze_to_silver(session, batch_size=batch_size)
+    except Exception:
+        # the observations of the run were not stored, they must not skip
+        # the payloads of the next run
+        if observations is not None:
+            observations.reset()
+        raise
+
+
+def add_new_hourly_data(
+    session: Session,
+    api_key: str,
+    cities: list[dict] | None = None,
+    client: ApiClient | None = None,
+    max_concurrency: int = 8,
+    batch_size: int = 1000,
+    registry: CityRegistry | None = None,
+    group_size: int = GROUP_MAX_IDS,
+    retry_dead_letters: bool = True,
+    observations: ObservationIndex | None = None,
+) -> list[CityLocation]:
+    """
+    Fetches the current weather for every tracked city and stores it in the
+    bronze and hourly weather tables.
+    Cities default to the registry file and their locations are resolved
+    through the in-process city registry.
+    Cities already seen by the provider are fetched group_size at a time
+    through the group endpoint, the others one request per city
+    (group_size=1 disables batching).
+    Api calls run concurrently on a bounded thread pool sharing one pooled
+    http client, while this thread is the only one writing to the database.
+    The bronze rows of the run are written in bulk and then transformed
+    into hourly weather rows by the incremental bronze to silver stage.
+    Cities whose requests fail go to a dead letter list and are retried one
+    by one at the end of the run, unless the circuit breaker is open; the
+    cities that still fail are kept in the dead letter table, fetched first
+    by the next run, and returned.
+    The last observation of every city is kept in the observation index:
+    cities observed less than its refresh interval ago are not fetched,
+    requests per city are conditional, and payloads whose observation is
+    already stored are not written again.
+    The run is the one of add_new_hourly_data_async, on an event loop of
+    this thread driving the sync client through the thread pool.
+    """
+    owns_client = client is None
+    if owns_client:
+        client = ApiClient(pool_size=max_concurrency)
+
+    async def run_db(function, *args):
+        return function(session, *args)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            return asyncio.run(
+                _ingest(
+                    run_db,
+                    api_key,
+                    ExecutorClient(client, executor),
+                    cities,
+                    max_concurrency,
+                    batch_size,
+                    registry,
+                    group_size,
+                    retry_dead_letters,
+                    observations,
+                )
             )
-        ).one()
-        logger.debug(f"City value: {city_value}")
+    finally:
+        if owns_client:
+            client.close()
 
-        logger.info(
-            f"Found city in database: {city_data['city_name']} at lat {city_value.latitude}, long {city_value.longitude}"
-        )
 
-        # get lat long from api
-        payload = get_weather(
-            lat=city_value.latitude, long=city_value.longitude, api_key=api_key
-        )
-        dt = payload["dt"]
-        full_timestamp = datetime.fromtimestamp(dt, timezone.utc)
-        hourly_timestamp = full_timestamp.replace(minute=0, second=0, microsecond=0)
+async def add_new_hourly_data_async(
+    session: "AsyncSession",
+    api_key: str,
+    cities: list[dict] | None = None,
+    client: "AsyncApiClient | None" = None,
+    max_concurrency: int = 8,
+    batch_size: int = 1000,
+    registry: CityRegistry | None = None,
+    group_size: int = GROUP_MAX_IDS,
+    retry_dead_letters: bool = True,
+    observations: ObservationIndex | None = None,
+) -> list[CityLocation]:
+    """
+    Asyncio counterpart of add_new_hourly_data, for services running an
+    event loop. The batches are fetched as tasks on one async client, at
+    most max_concurrency at a time, so the requests of thousands of cities
+    overlap without a thread per request. Planning, writing and the bronze
+    to silver stage are the sync ones, run on the session connection with
+    run_sync. Returns the cities that could not be fetched.
+    Needs the async extra: pip install weather-call[async].
+    """
+    from weather_call.api.async_client import AsyncApiClient
 
-        # add the reponse to the bronze table first
-        hourly_bronze = HourlyWeatherDataBronze(
-            city_id=city_value.id, payload=payload, hourly_timestamp=hourly_timestamp
-        )
-        logger.info(
-            f"Adding hourly weather data to bronze table for city: {city_data['city_name']}"
+    owns_client = client is None
+    if owns_client:
+        client = AsyncApiClient(pool_size=max_concurrency)
+
+    async def run_db(function, *args):
+        return await session.run_sync(function, *args)
+
+    try:
+        return await _ingest(
+            run_db,
+            api_key,
+            client,
+            cities,
+            max_concurrency,
+            batch_size,
+            registry,
+            group_size,
+            retry_dead_letters,
+            observations,
         )
-        logger.debug(f"Payload: {hourly_bronze.payload}")
-        city_bronze_orm = HourlyWeatherBronze(**hourly_bronze.model_dump())
+    finally:
+        if owns_client:
+            await client.aclose()
+
+
+async def _ingest(
+    run_db: Callable[..., Awaitable],
+    api_key: str,
+    client: "AsyncApiClient | ExecutorClient",
+    cities: list[dict] | None,
+    max_concurrency: int,
+    batch_size: int,
+    registry: CityRegistry | None,
+    group_size: int,
+    retry_dead_letters: bool,
+    observations: ObservationIndex | None,
+) -> list[CityLocation]:
+    """
+    Ingestion run shared by add_new_hourly_data and its asyncio counterpart.
+    run_db(function, *args) runs function(session, *args) on the session of
+    the run, on the thread of the event loop.
+    """
+    if observations is None:
+        observations = observation_index
+    plan = await run_db(plan_fetch_batches, cities, registry, group_size, observations)
 
-        session.add(city_bronze_orm)
-        session.commit()
+    semaphore = asyncio.Semaphore(max_concurrency)
 
-        cutoff_time = datetime.now(timezone.utc) - timedelta(days=3)
-        if hourly_timestamp < cutoff_time:
-            logger.info(
-                f"Skipping processing for old data at {hourly_timestamp} for city: {city_data['city_name']}"
+    async def fetch(batch: list[CityLocation]) -> list[tuple[object, dict | None]]:
+        async with semaphore:
+            return await get_weather_batch_async(
+                batch, api_key, plan.provider_ids, client, observations
             )
+
+    bronze_rows = []
+    dead_letters = []
+    errors = {}
+    not_modified = 0
+    unchanged = 0
+    # get the weather for every batch of cities concurrently
+    outcomes = await asyncio.gather(
+        *(fetch(batch) for batch in plan.batches), return_exceptions=True
+    )
+    for batch, outcome in zip(plan.batches, outcomes, strict=True):
+        if isinstance(outcome, ApiError):
+            metrics.count("dead_letter_cities", len(batch))
+            # a failing batch must not waste the rest of the run
+            logger.warning(
+                f"Moving {len(batch)} cities to the dead letter list: {outcome}"
+            )
+            dead_letters.extend(batch)
+            errors.update((location.id, str(outcome)) for location in batch)
             continue
+        if isinstance(outcome, BaseException):
+            raise outcome
+        skipped = keep_new_payloads(outcome, observations, bronze_rows)
+        not_modified += skipped[0]
+        unchanged += skipped[1]
 
-        hourly_pydantic = HourlyWeatherData(
-            city_id=city_value.id,
-            temperature=payload["main"]["temp"],
-            wind_speed=payload["wind"]["speed"],
-            weather_condition=payload["weather"][0]["main"],
-            hourly_timestamp=hourly_timestamp,
+    # retry the failed cities one by one, once the others are done,
+    # unless the api is failing: then they are left to the next run
+    failed = []
+    if dead_letters and client.circuit_breaker.is_open:
+        logger.warning(
+            f"Circuit breaker is open, leaving {len(dead_letters)} cities to the next run"
         )
+    if not retry_dead_letters or client.circuit_breaker.is_open:
+        failed, dead_letters = dead_letters, []
+    for location in dead_letters:
+        try:
+            payload = await get_weather_async(
+                location.latitude, location.longitude, api_key, client
+            )
+        except ApiError as error:
+            logger.error(f"Giving up on city {location.name}: {error}")
+            failed.append(location)
+            errors[location.id] = str(error)
+            continue
+        unchanged += keep_new_payloads(
+            [(location, payload)], observations, bronze_rows
+        )[1]
 
-        # Create a new ORM object and add it to the session
-        hourly_weather_stmt = sqlite_insert(HourlyWeather).values(
-            hourly_pydantic.model_dump()
-        )
-        hourly_weather_stmt = hourly_weather_stmt.on_conflict_do_update(
-            index_elements=["city_id", "hourly_timestamp"],
-            set_={
-                "temperature": hourly_weather_stmt.excluded.temperature,
-                "wind_speed": hourly_weather_stmt.excluded.wind_speed,
-                "weather_condition": hourly_weather_stmt.excluded.weather_condition,
-                "updated_at": datetime.now(timezone.utc),
-            },
-        )
-        session.execute(hourly_weather_stmt)
+    log_saved_calls(plan, not_modified, unchanged)
+    await run_db(save_dead_letters, plan, failed, errors)
+    await run_db(store_bronze_rows, bronze_rows, batch_size, observations)
 
-    # Commit changes to make them permanent in the database file
-    session.commit()
+    if failed:
+        logger.error(
+            f"{len(failed)} cities could not be fetched in this run, they are kept for the next one"
+        )
+    return failed
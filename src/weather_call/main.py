@@ -1,89 +1,382 @@
-from weather_call.model.database import SessionLocal, engine
-from weather_call.model.initial_database import full_database_initialization
-from weather_call.config import Config
-from weather_call.etl_service import add_new_hourly_data
-from weather_call.reports import (
-    distinct_weather,
-    rank_common_weather,
-    average_temperature,
-    city_with_highest_column_value,
-    city_with_variation,
-)
+from weather_call import metrics
+from typing import TYPE_CHECKING
+import argparse
+import functools
 import logging
 import sys
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+
+# the commands import what they use when they run, so starting the cli does
+# not load sqlalchemy, polars, requests or pydantic, does not read the
+# settings and does not touch the database
+if TYPE_CHECKING:
+    from weather_call.api.client import ApiClient
+    from weather_call.config import Config
+    from weather_call.observation_index import ObservationIndex
 
 logger = logging.getLogger(__name__)
 
 
-# Configure the root logger
-logging.basicConfig(
-    level=logging.INFO,  # <--- This captures INFO, WARNING, ERROR
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout)  # Prints to terminal
-    ],
-)
+@functools.cache
+def get_config() -> "Config":
+    """Settings read from the env and the .env file on first use"""
+    from weather_call.config import Config
+
+    return Config()
+
+
+def require_api_key() -> str:
+    """Api key of the settings, for the commands that call the weather api"""
+    api_key = get_config().api_key
+    if not api_key:
+        raise SystemExit("API_KEY is not set, add it to the env or the .env file")
+    return api_key
+
+
+def configure_logging():
+    # Configure the root logger
+    logging.basicConfig(
+        level=logging.INFO,  # <--- This captures INFO, WARNING, ERROR
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        handlers=[
+            logging.StreamHandler(sys.stdout)  # Prints to terminal
+        ],
+    )
+
+
+def build_client() -> "ApiClient":
+    """Pooled api client configured from the settings"""
+    from weather_call.api.client import ApiClient, CircuitBreaker
+
+    config = get_config()
+    return ApiClient(
+        base_url=config.api_base_url,
+        pool_size=config.max_concurrency,
+        timeout=config.request_timeout,
+        rate_limit_per_minute=config.rate_limit_per_minute,
+        max_retries=config.max_retries,
+        backoff_base=config.backoff_base,
+        backoff_max=config.backoff_max,
+        circuit_breaker=CircuitBreaker(
+            config.circuit_breaker_failures, config.circuit_breaker_reset
+        ),
+    )
+
+
+def initialize(session, client: "ApiClient") -> list[dict]:
+    """Creates the tables, seeds the tracked cities and returns them"""
+    from weather_call.api.geocoding_cache import GeocodingCache
+    from weather_call.city_registry import load_city_list
+    from weather_call.model.database import get_engine
+    from weather_call.model.initial_database import full_database_initialization
+
+    config = get_config()
+    cities = load_city_list(config.cities_file)
+    geocoding_cache = GeocodingCache(config.geocoding_cache_file)
+    geocoding_cache.load()
+    full_database_initialization(
+        session,
+        get_engine(),
+        config.api_key,
+        cities,
+        client=client,
+        geocoding_cache=geocoding_cache,
+    )
+    return cities
+
+
+@functools.cache
+def get_observation_index() -> "ObservationIndex":
+    """Index of the last observation of every city, shared by the runs"""
+    from weather_call.observation_index import ObservationIndex
+
+    return ObservationIndex(get_config().observation_refresh_minutes * 60)
+
+
+def ingest(session, client: "ApiClient", cities: list[dict]) -> bool:
+    """
+    Adds the current hour of every city and updates the parquet export.
+    Returns False when some cities could not be fetched.
+    """
+    from weather_call.etl_service import add_new_hourly_data
+
+    config = get_config()
+    # add new hourly data to the weather table
+    failed = add_new_hourly_data(
+        session,
+        require_api_key(),
+        cities=cities,
+        client=client,
+        max_concurrency=config.max_concurrency,
+        batch_size=config.write_batch_size,
+        group_size=config.fetch_group_size,
+        observations=get_observation_index(),
+    )
+
+    # append the new hourly rows to the parquet export
+    export_parquet(session)
+    return not failed
+
+
+def export_parquet(session):
+    """Appends the new hourly rows to the parquet export, when configured"""
+    config = get_config()
+    if config.parquet_root is not None:
+        from weather_call.export import export_silver_to_parquet
+
+        export_silver_to_parquet(session, config.parquet_root)
+
+
+def log_reports(hours: int = 48):
+    """Computes the reports over the last hours and logs them"""
+    from weather_call.model.database import get_session_factory
+    from weather_call.report_cache import ReportCache
+    from weather_call.reports import ReportBundle
+
+    config = get_config()
+    # reports request in order of the pdf
+    initial_time = datetime.now() - timedelta(hours=hours)
+    final_time = datetime.now()
+    pool = None
+    if config.report_workers is not None:
+        from weather_call.report_pool import ReportPool
+
+        pool = ReportPool(config.report_workers)
+    # all reports are computed from a single read of the window, on a
+    # read only connection that does not block the writer
+    with get_session_factory(read_only=True)() as read_session:
+        reports = ReportBundle(
+            read_session,
+            initial_time,
+            final_time,
+            parquet_root=config.parquet_root,
+            rollup=config.report_rollup,
+            memory_limit_mb=config.report_memory_limit_mb,
+            pool=pool,
+            cache=ReportCache(
+                ttl=config.report_cache_ttl, persist_dir=config.report_cache_dir
+            ),
+        ).collect()
+    if pool is not None:
+        pool.close()
+
+    # 1. distinct weather conditions in the last hours
+    logger.info(
+        f"Distinct weather conditions in the last {hours} hours:\n{reports['distinct_weather']}"
+    )
+
+    # 2. rank the most common weather condition per city in the last hours
+    logger.info(
+        f"Most common weather condition per city in the last {hours} hours:\n{reports['rank_common_weather']}"
+    )
+
+    # 3. average temperature per city in the last hours
+    logger.info(
+        f"Average temperature per city in the last {hours} hours:\n{reports['average_temperature']}"
+    )
+
+    # 4. highest absolute temp city in the last hours
+    logger.info(
+        f"City with highest absolute temperature in the last {hours} hours:\n{reports['highest_temperature']}"
+    )
 
-config = Config()
-print(config.api_key)
+    # 5. highest daily temperature variation city in the last hours
+    logger.info(
+        f"City with highest daily temperature variation in the last {hours} hours:\n{reports['temperature_variation']}"
+    )
 
+    # 6. highest wind speed city in the last hours
+    logger.info(
+        f"City with highest wind speed in the last {hours} hours:\n{reports['highest_wind_speed']}"
+    )
 
-def main():
-    with SessionLocal() as session:
+
+def after_hour(session):
+    """Export and metrics refreshed after every scheduled hour"""
+    export_parquet(session)
+    config = get_config()
+    if config.metrics_file is not None:
+        metrics.write_metrics(config.metrics_file)
+
+
+def run_command(args):
+    """Initializes the database, ingests the current hour and logs the reports"""
+    from weather_call.model.database import get_session_factory
+
+    require_api_key()
+    with get_session_factory()() as session, build_client() as client:
         # create all tables and initialize the database and tables
-        full_database_initialization(session, engine, config.api_key)
+        cities = initialize(session, client)
+        complete = ingest(session, client, cities)
+    log_reports(args.hours)
+    if not complete:
+        # the failed cities are retried by the next run
+        sys.exit(1)
 
-        # add new hourly data to the weather table
-        add_new_hourly_data(session, config.api_key)
 
-        # reports request in order of the pdf
-        initial_time = datetime.now() - timedelta(hours=48)
-        final_time = datetime.now()
-        # 1. distinct weather conditions in the last 48 hours
-        distinct_df = distinct_weather(
-            initial_time=initial_time, final_time=final_time, session=session
-        )
-        logger.info(f"Distinct weather conditions in the last 48 hours:\n{distinct_df}")
+def init_command(args):
+    """Creates the tables and seeds the countries and cities"""
+    from weather_call.model.database import get_session_factory
 
-        # 2. rank the most common weather condition per city in the last 48 hours
-        most_common_df = rank_common_weather(
-            initial_time=initial_time, final_time=final_time, session=session
-        )
-        logger.info(
-            f"Most common weather condition per city in the last 48 hours:\n{most_common_df}"
-        )
+    with get_session_factory()() as session, build_client() as client:
+        initialize(session, client)
 
-        # 3. average temperature per city in the last 48 hours
-        average_temp_df = average_temperature(
-            initial_time=initial_time, final_time=final_time, session=session
-        )
-        logger.info(
-            f"Average temperature per city in the last 48 hours:\n{average_temp_df}"
-        )
 
-        # 4. highest absolute temp city in the last 48 hours
-        highest_temp_df = city_with_highest_column_value(
-            "temperature", initial_time, final_time, session
-        )
-        logger.info(
-            f"City with highest absolute temperature in the last 48 hours:\n{highest_temp_df}"
-        )
+def ingest_command(args):
+    """Ingests the current hour of the cities seeded by init"""
+    from weather_call.city_registry import load_city_list
+    from weather_call.model.database import get_session_factory
 
-        # 5. highest daily temperature variation city in the last 48 hours
-        variation_temp_df = city_with_variation(initial_time, final_time, session)
-        logger.info(
-            f"City with highest daily temperature variation in the last 48 hours:\n{variation_temp_df}"
-        )
+    require_api_key()
+    cities = load_city_list(get_config().cities_file)
+    with get_session_factory()() as session, build_client() as client:
+        complete = ingest(session, client, cities)
+    if not complete:
+        # the failed cities are retried by the next run
+        sys.exit(1)
 
-        # 6. highest wind speed city in the last 48 hours
-        highest_wind_df = city_with_highest_column_value(
-            "wind_speed", initial_time, final_time, session
+
+def backfill_command(args):
+    """Fills the hours missing in the window from the historical endpoint"""
+    from weather_call.backfill import backfill_hourly_weather, pending_backfill_start
+    from weather_call.model.database import get_session_factory
+
+    config = get_config()
+    with get_session_factory()() as session, build_client() as client:
+        start = args.start
+        if start is None:
+            start = datetime.now(timezone.utc) - timedelta(hours=args.hours)
+            # an interrupted run of the default window is resumed from its start
+            pending = pending_backfill_start(session)
+            if args.end is None and pending is not None:
+                start = min(start, pending.replace(tzinfo=timezone.utc))
+        backfill_hourly_weather(
+            session,
+            require_api_key(),
+            start,
+            args.end,
+            client=client,
+            max_concurrency=config.max_concurrency,
+            max_calls=config.backfill_max_calls,
+            batch_size=config.write_batch_size,
         )
-        logger.info(
-            f"City with highest wind speed in the last 48 hours:\n{highest_wind_df}"
+        export_parquet(session)
+
+
+def compact_command(args):
+    """Compacts and archives the bronze tables, logging the size before and after"""
+    from weather_call.model.database import get_session_factory
+    from weather_call.retention import compact_bronze
+
+    config = get_config()
+    with get_session_factory()() as session:
+        compact_bronze(
+            session,
+            archive_root=config.bronze_archive_root,
+            retention_days=config.bronze_retention_days,
+            vacuum=args.vacuum,
         )
 
 
+def report_command(args):
+    """Logs the reports of the last hours"""
+    log_reports(args.hours)
+
+
+def serve_command(args):
+    """
+    Keeps running and ingests every hour, with the engine, the http pool
+    and the city registry kept warm between runs.
+    """
+    from weather_call.model.database import get_session_factory
+    from weather_call.scheduler import IngestScheduler
+
+    config = get_config()
+    api_key = require_api_key()
+    session_factory = get_session_factory()
+    with build_client() as client:
+        with session_factory() as session:
+            cities = initialize(session, client)
+        IngestScheduler(
+            session_factory,
+            client,
+            api_key,
+            cities,
+            spread_minutes=config.schedule_spread_minutes,
+            max_concurrency=config.max_concurrency,
+            batch_size=config.write_batch_size,
+            group_size=config.fetch_group_size,
+            observations=get_observation_index(),
+            after_hour=after_hour,
+            backfill_max_calls=config.backfill_max_calls,
+        ).run()
+
+
+COMMANDS = {
+    "run": run_command,
+    "init": init_command,
+    "ingest": ingest_command,
+    "backfill": backfill_command,
+    "compact": compact_command,
+    "report": report_command,
+    "serve": serve_command,
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="weather-call")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="run",
+        choices=list(COMMANDS),
+        help=(
+            "run (default): init, ingest and report in one go, "
+            "init: create the tables and seed the cities, "
+            "ingest: fetch the current hour, "
+            "backfill: fill the missing hours from the historical endpoint, "
+            "compact: drop superseded bronze payloads and archive the old ones, "
+            "report: log the reports, "
+            "serve: ingest every hour until stopped"
+        ),
+    )
+    parser.add_argument(
+        "--hours",
+        type=int,
+        default=48,
+        help="window of the reports and the backfill, in hours before now",
+    )
+    parser.add_argument(
+        "--start",
+        type=datetime.fromisoformat,
+        help="first hour to backfill, utc when no offset is given",
+    )
+    parser.add_argument(
+        "--end",
+        type=datetime.fromisoformat,
+        help="end of the backfill, excluded, the current hour by default",
+    )
+    parser.add_argument(
+        "--vacuum",
+        action="store_true",
+        help="give the space freed by compact back to the file system",
+    )
+    return parser
+
+
+def main(argv: list[str] | None = None):
+    args = build_parser().parse_args(argv)
+    configure_logging()
+
+    config = get_config()
+    if config.metrics_file is not None:
+        metrics.enable()
+    try:
+        COMMANDS[args.command](args)
+    finally:
+        if config.metrics_file is not None:
+            metrics.write_metrics(config.metrics_file)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,175 @@
+from collections import defaultdict
+from pathlib import Path
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# prefix of the exported prometheus metric names
+METRIC_PREFIX = "weather_call"
+
+_enabled = False
+_lock = threading.Lock()
+# (span name, labels) -> [count, total seconds, max seconds]
+_spans: dict[tuple[str, tuple], list[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+# (counter name, labels) -> value
+_counters: dict[tuple[str, tuple], float] = defaultdict(float)
+
+
+class _Span:
+    """Times the block it wraps and adds it to the span statistics"""
+
+    __slots__ = ("key", "start")
+
+    def __init__(self, key: tuple[str, tuple]):
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        with _lock:
+            stats = _spans[self.key]
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+
+
+class _NoopSpan:
+    """Span used while metrics are disabled, it does nothing"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def enable():
+    """Starts collecting spans and counters"""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Stops collecting, spans and counters become no-ops"""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    """Drops every collected value"""
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+def span(name: str, **labels):
+    """
+    Context manager timing a block of code under a name and optional labels.
+    While metrics are disabled it returns a shared no-op span.
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span((name, tuple(sorted(labels.items()))))
+
+
+def count(name: str, value: float = 1, **labels):
+    """Adds value to a counter, nothing happens while metrics are disabled"""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[(name, tuple(sorted(labels.items())))] += value
+
+
+def snapshot() -> dict:
+    """Collected spans and counters as plain data"""
+    with _lock:
+        spans = [
+            {
+                "name": name,
+                "labels": dict(labels),
+                "count": int(stats[0]),
+                "seconds": stats[1],
+                "max_seconds": stats[2],
+            }
+            for (name, labels), stats in _spans.items()
+        ]
+        counters = [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in _counters.items()
+        ]
+    return {"spans": spans, "counters": counters}
+
+
+def _prometheus_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_prometheus(data: dict | None = None) -> str:
+    """Collected values in the prometheus text exposition format"""
+    if data is None:
+        data = snapshot()
+    lines = [
+        f"# TYPE {METRIC_PREFIX}_span_seconds summary",
+    ]
+    for entry in data["spans"]:
+        labels = _prometheus_labels({"span": entry["name"], **entry["labels"]})
+        lines.append(f"{METRIC_PREFIX}_span_seconds_count{labels} {entry['count']}")
+        lines.append(f"{METRIC_PREFIX}_span_seconds_sum{labels} {entry['seconds']}")
+    lines.append(f"# TYPE {METRIC_PREFIX}_span_seconds_max gauge")
+    for entry in data["spans"]:
+        labels = _prometheus_labels({"span": entry["name"], **entry["labels"]})
+        lines.append(f"{METRIC_PREFIX}_span_seconds_max{labels} {entry['max_seconds']}")
+
+    for name in sorted({entry["name"] for entry in data["counters"]}):
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name}_total counter")
+        for entry in data["counters"]:
+            if entry["name"] == name:
+                labels = _prometheus_labels(entry["labels"])
+                lines.append(f"{METRIC_PREFIX}_{name}_total{labels} {entry['value']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path: str | Path):
+    """
+    Writes the collected values to a file, as json when its name ends with
+    .json and in the prometheus text format otherwise (for the node exporter
+    textfile collector). The file is replaced atomically.
+    """
+    path = Path(path)
+    data = snapshot()
+    if path.suffix == ".json":
+        content = json.dumps(data, indent=2)
+    else:
+        content = to_prometheus(data)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as metrics_file:
+        metrics_file.write(content)
+    os.replace(tmp_path, path)
+    logger.info(
+        f"Wrote {len(data['spans'])} spans and {len(data['counters'])} counters to {path}"
+    )
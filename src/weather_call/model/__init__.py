@@ -0,0 +1,10 @@
+# every model is registered as soon as the package is imported, so the
+# relationships between them resolve whichever model a module imports
+from weather_call.model import (  # noqa: F401
+    city,
+    country,
+    dead_letter,
+    etl_state,
+    observation,
+    weather,
+)
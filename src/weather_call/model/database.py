@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import create_engine, func
+from sqlalchemy import Engine, create_engine, event, func
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
@@ -7,27 +7,110 @@ from sqlalchemy.orm import (
     sessionmaker,
     declared_attr,
 )
+from typing import TYPE_CHECKING
+import functools
 import re
 import os
 
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+    from weather_call.config import SqliteProfile
+
 # 1. Define the path explicitly
 DB_FOLDER = "./data"
 DB_FILE = "weather.db"
 
-# 2. Check if folder exists, if not, create it
-if not os.path.exists(DB_FOLDER):
-    os.makedirs(DB_FOLDER)
-
-# 3. Database File Location
+# 2. Database File Location
 DATABASE_URL = f"sqlite:///{DB_FOLDER}/{DB_FILE}"
+# same file through the aiosqlite driver, for the asyncio services
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{DB_FOLDER}/{DB_FILE}"
 
-# 4. Create the Engine
-engine = create_engine(
-    DATABASE_URL, echo=False, connect_args={"check_same_thread": False}
-)
+# most bind parameters sqlite accepts in one statement (since 3.32)
+SQLITE_MAX_VARIABLES = 32766
+
+
+def rows_per_statement(batch_size: int, columns: int) -> int:
+    """
+    Caps a multi-row insert batch so its rows x columns bind parameters stay
+    within SQLITE_MAX_VARIABLES
+    """
+    return max(1, min(batch_size, SQLITE_MAX_VARIABLES // max(1, columns)))
+
+
+def build_engine(
+    database_url: str,
+    profile: "SqliteProfile | None" = None,
+    read_only: bool = False,
+) -> Engine:
+    """
+    Creates a sqlite engine applying the profile pragmas on every connection.
+    The writer engine keeps a single connection, so writes are serialized in
+    the process, while the read only engine pools profile.reader_pool_size
+    connections that can read concurrently thanks to WAL.
+    """
+    if profile is None:
+        from weather_call.config import SqliteProfile
+
+        profile = SqliteProfile()
+
+    engine = create_engine(
+        database_url,
+        echo=False,
+        connect_args={"check_same_thread": False},
+        pool_size=profile.reader_pool_size if read_only else 1,
+        max_overflow=0,
+    )
+
+    _apply_profile(engine, profile, read_only)
+    return engine
+
+
+def build_async_engine(
+    database_url: str,
+    profile: "SqliteProfile | None" = None,
+    read_only: bool = False,
+) -> "AsyncEngine":
+    """
+    Creates an asyncio sqlite engine on the aiosqlite driver, with the same
+    profile pragmas and pool sizes as build_engine.
+    Needs the async extra: pip install weather-call[async].
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    if profile is None:
+        from weather_call.config import SqliteProfile
+
+        profile = SqliteProfile()
+
+    engine = create_async_engine(
+        database_url,
+        echo=False,
+        pool_size=profile.reader_pool_size if read_only else 1,
+        max_overflow=0,
+    )
+    # connection events are only dispatched by the underlying sync engine
+    _apply_profile(engine.sync_engine, profile, read_only)
+    return engine
+
+
+def _apply_profile(engine: Engine, profile: "SqliteProfile", read_only: bool):
+    """Sets the profile pragmas on every new connection of the engine"""
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={profile.journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={profile.synchronous}")
+        cursor.execute(f"PRAGMA cache_size={profile.cache_size}")
+        cursor.execute(f"PRAGMA mmap_size={profile.mmap_size}")
+        cursor.execute(f"PRAGMA temp_store={profile.temp_store}")
+        cursor.execute(f"PRAGMA busy_timeout={profile.busy_timeout}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
 
 
-# 5. Define the Base for your models (ORM)
+# 3. Define the Base for your models (ORM)
 class Base(DeclarativeBase):
     """Base class for all ORM"""
 
@@ -46,5 +129,71 @@ class Base(DeclarativeBase):
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
 
 
-# 6. Create the Session Factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 4. Engines and session factories are created on first use, so importing
+# the models does not create the data folder nor open the database
+def get_engine(read_only: bool = False) -> Engine:
+    """Writer engine, or the read only engine, of the application database"""
+    # cached on the positional flag, get_engine() and get_engine(read_only=False)
+    # would otherwise be cached apart and open two writer engines
+    return _application_engine(read_only)
+
+
+@functools.cache
+def _application_engine(read_only: bool) -> Engine:
+    from weather_call.config import SqliteProfile
+
+    os.makedirs(DB_FOLDER, exist_ok=True)
+    return build_engine(DATABASE_URL, SqliteProfile(), read_only=read_only)
+
+
+@functools.cache
+def get_session_factory(read_only: bool = False) -> sessionmaker:
+    """Session factory bound to the writer, or the read only, engine"""
+    return sessionmaker(
+        autocommit=False, autoflush=False, bind=get_engine(read_only=read_only)
+    )
+
+
+def get_async_engine(read_only: bool = False) -> "AsyncEngine":
+    """
+    Asyncio writer engine, or read only engine, of the application database.
+    aiosqlite runs every connection on its own thread, so the engine must be
+    disposed before the event loop ends or the process will not exit.
+    """
+    return _application_async_engine(read_only)
+
+
+@functools.cache
+def _application_async_engine(read_only: bool) -> "AsyncEngine":
+    from weather_call.config import SqliteProfile
+
+    os.makedirs(DB_FOLDER, exist_ok=True)
+    return build_async_engine(ASYNC_DATABASE_URL, SqliteProfile(), read_only=read_only)
+
+
+@functools.cache
+def get_async_session_factory(read_only: bool = False) -> "async_sessionmaker":
+    """Asyncio session factory bound to the writer, or the read only, engine"""
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    return async_sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        expire_on_commit=False,
+        bind=get_async_engine(read_only=read_only),
+    )
+
+
+_LAZY_ATTRIBUTES = {
+    "engine": lambda: get_engine(),
+    "read_engine": lambda: get_engine(read_only=True),
+    "SessionLocal": lambda: get_session_factory(),
+    "ReadSessionLocal": lambda: get_session_factory(read_only=True),
+}
+
+
+def __getattr__(name: str):
+    """Builds engine, read_engine, SessionLocal and ReadSessionLocal on access"""
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,21 @@
+from sqlalchemy import ForeignKey, String
+from sqlalchemy.orm import Mapped, mapped_column
+from weather_call.model.database import Base
+
+
+class DeadLetterCity(Base):
+    """
+    Cities whose current weather could not be fetched by an ingestion run,
+    fetched first by the next run and removed once they succeed.
+    """
+
+    city_id: Mapped[int] = mapped_column(ForeignKey("city.id"), unique=True)
+
+    # consecutive runs that could not fetch the city
+    failed_runs: Mapped[int]
+    error: Mapped[str | None] = mapped_column(String(500))
+
+    def __repr__(self):
+        return (
+            f"<DeadLetterCity(city_id={self.city_id}, failed_runs={self.failed_runs})>"
+        )
@@ -0,0 +1,16 @@
+from sqlalchemy import String
+from sqlalchemy.orm import Mapped, mapped_column
+from weather_call.model.database import Base
+
+
+class EtlState(Base):
+    """
+    Key value table keeping the progress of the etl stages,
+    like the high-water mark of the bronze rows already transformed.
+    """
+
+    name: Mapped[str] = mapped_column(String(100), unique=True)
+    value: Mapped[int]
+
+    def __repr__(self):
+        return f"<EtlState(name='{self.name}', value={self.value})>"
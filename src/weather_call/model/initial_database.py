@@ -1,9 +1,13 @@
-from sqlalchemy import select, Engine
+from sqlalchemy import inspect, select, text, Engine
 from sqlalchemy.orm import Session
 from weather_call.model.database import Base
 from weather_call.model.city import City, CityBronze
 from weather_call.model.country import Country
+from weather_call.model.weather import DailyWeatherSummary, HourlyWeather
+from weather_call.api.client import ApiClient
 from weather_call.api.city_location import get_lat_long_from_api
+from weather_call.api.geocoding_cache import GeocodingCache
+from weather_call.city_registry import load_city_list
 from weather_call.schema.city import CityData, CityDataBronze
 from weather_call.schema.country import CountryData
 from sqlalchemy.dialects.sqlite import insert as sqlite_insert
@@ -16,52 +20,92 @@ def create_db_and_tables(engine: Engine):
     """Initializes the database and creates all tables defined under Base."""
     logger.info("Creating database and tables if they do not exist.")
     Base.metadata.create_all(bind=engine)
+
+    # create_all skips the columns added to tables that already exist, only
+    # nullable ones are added so no default is needed. The inspector reads
+    # through the open connection, the writer engine pools a single one
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(engine.dialect)
+                    connection.execute(
+                        text(
+                            f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                        )
+                    )
+
+    # create_all skips the indexes of tables that already exist
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
     logger.info("Database and tables created successfully.")
 
 
-def seed_initial_locations(session: Session, api_key: str):
+def seed_initial_locations(
+    session: Session,
+    api_key: str | None,
+    cities: list[dict] | None = None,
+    client: ApiClient | None = None,
+    geocoding_cache: GeocodingCache | None = None,
+):
     """
     Populates the DimCityLocation table with the required cities
     if they do not already exist.
+    Coordinates come from the geocoding cache when available, and the
+    geocoding api is only called for cities that are not cached, so the
+    api_key is only required on a cache miss.
     """
-    cities = [
-        {"city_name": "milan", "country_name": "italy"},
-        {"city_name": "bologna", "country_name": "italy"},
-        {"city_name": "cagliari", "country_name": "italy"},
+    if cities is None:
+        cities = load_city_list()
+
+    # every city and country already stored, loaded with a single query each
+    existing_cities = set(
+        session.execute(select(City.name, Country.name).join(Country)).tuples()
+    )
+    countries = {country.name: country for country in session.scalars(select(Country))}
+    missing_cities = [
+        city_data
+        for city_data in cities
+        if (city_data["city_name"], city_data["country_name"]) not in existing_cities
     ]
-    for city_data in cities:
+    logger.info(f"{len(missing_cities)} cities missing from the database")
+    if not missing_cities:
+        return
+
+    if geocoding_cache is None:
+        geocoding_cache = GeocodingCache()
+    geocoding_cache.warm_from_bronze(session)
+
+    for city_data in missing_cities:
         logger.info(
             f"Processing city: {city_data['city_name']}, {city_data['country_name']}"
         )
-        # Check if the city already exists to prevent duplicate insertions
-        existing_city = session.execute(
-            select(City).where(City.name == city_data["city_name"])
-        ).scalar_one_or_none()
-
-        if existing_city is not None:
-            logger.info(
-                f"City {city_data['city_name']} already exists in the database. Skipping insertion."
-            )
-            continue  # City already exists, skip to the next one
-
-        country = session.execute(
-            select(Country).where(Country.name == city_data["country_name"])
-        ).one()
+        country = countries[city_data["country_name"]]
         logger.info(
             f"Found country in database: {city_data['country_name']} with ISO {country.iso_3166}"
         )
 
-        # get lat long from api
-        payload = get_lat_long_from_api(
-            city_data["city_name"], country.iso_3166, api_key
-        )
-        logger.info(
-            f"Retrieved lat/long from API for city: {city_data['city_name']} - Payload: {payload}"
-        )
+        # get lat long from the cache, or from the api on a miss
+        payload = geocoding_cache.get(city_data["city_name"], country.iso_3166)
+        if payload is None:
+            if api_key is None:
+                raise ValueError(
+                    f"API_KEY is not set, it is needed to geocode {city_data['city_name']}"
+                )
+            payload = get_lat_long_from_api(
+                city_data["city_name"], country.iso_3166, api_key, client
+            )[0]
+            geocoding_cache.put(city_data["city_name"], country.iso_3166, payload)
+            logger.info(
+                f"Retrieved lat/long from API for city: {city_data['city_name']}"
+            )
 
         # add the reponse to the bronze table first
         city_bronze = CityDataBronze(
-            name=city_data["city_name"], country_id=country.id, payload=payload[0]
+            name=city_data["city_name"], country_id=country.id, payload=payload
         )
         city_bronze_orm = CityBronze(**city_bronze.model_dump())
         logger.info(
@@ -87,15 +131,24 @@ def seed_initial_locations(session: Session, api_key: str):
 
     # Commit changes to make them permanent in the database file
     session.commit()
+    geocoding_cache.save()
 
 
-def seed_initial_locations_countries(session: Session):
+def seed_initial_locations_countries(
+    session: Session, cities: list[dict] | None = None
+):
     """
-    Populates the DimCityLocation table with the required cities
+    Populates the Country table with the countries of the tracked cities
     if they do not already exist.
     """
+    if cities is None:
+        cities = load_city_list()
+
     countries_list = [
-        CountryData(country_name="italy", iso_3166="IT"),
+        CountryData(country_name=country_name, iso_3166=iso_3166)
+        for country_name, iso_3166 in sorted(
+            {(city["country_name"], city["iso_3166"]) for city in cities}
+        )
     ]
     countries = [country.model_dump() for country in countries_list]
     stmt = sqlite_insert(Country).values(countries)
@@ -108,10 +161,39 @@ def seed_initial_locations_countries(session: Session):
     session.commit()
 
 
-def full_database_initialization(session: Session, engine: Engine, api_key: str):
+def seed_daily_summaries(session: Session):
+    """
+    Builds the daily rollup from the hourly weather table when it is empty,
+    for databases created before the rollup existed.
+    """
+    has_summaries = session.scalar(select(DailyWeatherSummary.id).limit(1))
+    has_hourly = session.scalar(select(HourlyWeather.id).limit(1))
+    if has_summaries is not None or has_hourly is None:
+        return
+
+    # polars is only loaded when the rollup has to be built
+    from weather_call.rollup import refresh_daily_summaries
+
+    written = refresh_daily_summaries(session)
+    session.commit()
+    logger.info(f"Built {written} daily weather summaries from the hourly table")
+
+
+def full_database_initialization(
+    session: Session,
+    engine: Engine,
+    api_key: str | None,
+    cities: list[dict] | None = None,
+    client: ApiClient | None = None,
+    geocoding_cache: GeocodingCache | None = None,
+):
     """
     Full database initialization including countries and cities.
     """
+    if cities is None:
+        cities = load_city_list()
+
     create_db_and_tables(engine)
-    seed_initial_locations_countries(session)
-    seed_initial_locations(session, api_key)
+    seed_initial_locations_countries(session, cities)
+    seed_initial_locations(session, api_key, cities, client, geocoding_cache)
+    seed_daily_summaries(session)
@@ -0,0 +1,24 @@
+from sqlalchemy import ForeignKey, String
+from sqlalchemy.orm import Mapped, mapped_column
+from weather_call.model.database import Base
+
+
+class CityObservation(Base):
+    """
+    Last current weather observation received for every city: the provider
+    observation time and the http validators of the response, used to skip
+    the api calls that cannot return anything new, and the provider id of
+    the city used by the group requests.
+    """
+
+    city_id: Mapped[int] = mapped_column(ForeignKey("city.id"), unique=True)
+
+    # provider observation time, unix seconds
+    observed_at: Mapped[int]
+    etag: Mapped[str | None] = mapped_column(String(200))
+    last_modified: Mapped[str | None] = mapped_column(String(100))
+    # OpenWeather city id, from the last current weather payload
+    provider_id: Mapped[int | None]
+
+    def __repr__(self):
+        return f"<CityObservation(city_id={self.city_id}, observed_at={self.observed_at}, etag='{self.etag}')>"
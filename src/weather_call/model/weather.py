@@ -1,7 +1,7 @@
-from sqlalchemy import ForeignKey, JSON, String, Numeric, UniqueConstraint
+from sqlalchemy import ForeignKey, Index, JSON, String, Numeric, UniqueConstraint
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from weather_call.model.database import Base
-from datetime import datetime
+from datetime import date, datetime
 
 
 class HourlyWeather(Base):
@@ -13,8 +13,8 @@ class HourlyWeather(Base):
     # Foreign Key to City table
     city_id: Mapped[int] = mapped_column(ForeignKey("city.id"), index=True)
 
-    # features
-    hourly_timestamp: Mapped[datetime] = mapped_column(index=True)
+    # features, hourly_timestamp is indexed by the covering report index
+    hourly_timestamp: Mapped[datetime]
     temperature: Mapped[float] = mapped_column(Numeric(5, 2))
     wind_speed: Mapped[float] = mapped_column(Numeric(5, 2))
     weather_condition: Mapped[str] = mapped_column(String(100))
@@ -23,6 +23,16 @@ class HourlyWeather(Base):
     city = relationship("City", back_populates="hourly_weather")
     __table_args__ = (
         UniqueConstraint("city_id", "hourly_timestamp", name="uq_city_time"),
+        # covering index for the report window scans: the time range seeks on
+        # hourly_timestamp and every column read by the reports is in the index
+        Index(
+            "ix_hourly_weather_report",
+            "hourly_timestamp",
+            "city_id",
+            "temperature",
+            "wind_speed",
+            "weather_condition",
+        ),
     )
 
     def __repr__(self):
@@ -48,6 +58,37 @@ class HourlyWeatherBronze(Base):
 
     # relationships
     city = relationship("City", back_populates="hourly_weather_bronze")
+    __table_args__ = (
+        # lookups of the other payloads of an hour when is_latest is maintained
+        Index("ix_hourly_weather_bronze_city_time", "city_id", "hourly_timestamp"),
+    )
 
     def __repr__(self):
         return f"<CityBronze(hourly_timestamp='{self.hourly_timestamp}', payload={self.payload})>"
+
+
+class DailyWeatherSummary(Base):
+    """
+    Daily rollup of the hourly weather table, one row per city and day.
+    Rows are recomputed from the hourly rows of their day every time one of
+    them is inserted or corrected, so it answers multi-day reports without
+    reading every hour.
+    """
+
+    # foreign key to City table
+    city_id: Mapped[int] = mapped_column(ForeignKey("city.id"), index=True)
+
+    # features
+    day: Mapped[date] = mapped_column(index=True)
+    temperature_min: Mapped[float] = mapped_column(Numeric(5, 2))
+    temperature_max: Mapped[float] = mapped_column(Numeric(5, 2))
+    temperature_sum: Mapped[float] = mapped_column(Numeric(10, 2))
+    temperature_count: Mapped[int]
+    wind_speed_max: Mapped[float] = mapped_column(Numeric(5, 2))
+    # list of {"weather_condition": ..., "count": ...} objects
+    weather_condition_counts: Mapped[list] = mapped_column(JSON)
+
+    __table_args__ = (UniqueConstraint("city_id", "day", name="uq_city_day"),)
+
+    def __repr__(self):
+        return f"<DailyWeatherSummary(city_id='{self.city_id}', day={self.day}, temperature_min={self.temperature_min}, temperature_max={self.temperature_max}, temperature_count={self.temperature_count})>"
@@ -0,0 +1,150 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from weather_call.model.observation import CityObservation
+from datetime import datetime, timezone
+from typing import NamedTuple
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# the provider refreshes the current weather about every 10 minutes
+DEFAULT_REFRESH_SECONDS = 600
+
+
+class Observation(NamedTuple):
+    """
+    Last observation of a city, the validators of its response and the
+    provider id of the city
+    """
+
+    observed_at: int
+    etag: str | None = None
+    last_modified: str | None = None
+    provider_id: int | None = None
+
+
+class ObservationIndex:
+    """
+    In-process index of the last observation of every city, persisted in
+    the city_observation table. A city observed less than refresh_seconds
+    ago cannot have a newer observation yet, so it is not fetched again.
+    The index is loaded from the table once and only the cities that
+    changed are written back.
+    """
+
+    def __init__(self, refresh_seconds: float = DEFAULT_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._observations: dict[int, Observation] = {}
+        self._changed: set[int] = set()
+        self._loaded = False
+        # validators are recorded by the fetch threads
+        self._lock = threading.Lock()
+
+    def load(self, session: Session):
+        """Loads the persisted observations, once"""
+        if self._loaded:
+            return
+        rows = session.execute(
+            select(
+                CityObservation.city_id,
+                CityObservation.observed_at,
+                CityObservation.etag,
+                CityObservation.last_modified,
+                CityObservation.provider_id,
+            )
+        )
+        with self._lock:
+            for city_id, *observation in rows:
+                self._observations.setdefault(city_id, Observation(*observation))
+        self._loaded = True
+        logger.debug(f"Observation index holds {len(self._observations)} cities")
+
+    def get(self, city_id: int) -> Observation | None:
+        return self._observations.get(city_id)
+
+    def is_due(self, city_id: int, now: datetime | None = None) -> bool:
+        """True when the provider may have a newer observation of the city"""
+        observation = self._observations.get(city_id)
+        if observation is None:
+            return True
+        if now is None:
+            now = datetime.now(timezone.utc)
+        return now.timestamp() >= observation.observed_at + self.refresh_seconds
+
+    def provider_ids(self) -> dict[int, int]:
+        """OpenWeather city id of every city that has one"""
+        return {
+            city_id: observation.provider_id
+            for city_id, observation in self._observations.items()
+            if observation.provider_id
+        }
+
+    def record(
+        self, city_id: int, observed_at: int, provider_id: int | None = None
+    ) -> bool:
+        """
+        Records the observation time and the provider id of a fetched
+        payload. Returns False when it is not newer than the last one, so
+        the payload holds nothing new.
+        """
+        with self._lock:
+            observation = self._observations.get(city_id)
+            if observation is not None and observed_at <= observation.observed_at:
+                return False
+            if observation is None:
+                observation = Observation(observed_at)
+            self._observations[city_id] = observation._replace(
+                observed_at=observed_at,
+                provider_id=provider_id or observation.provider_id,
+            )
+            self._changed.add(city_id)
+        return True
+
+    def record_validators(
+        self, city_id: int, etag: str | None, last_modified: str | None
+    ):
+        """Keeps the ETag and Last-Modified of a response for the next request"""
+        if etag is None and last_modified is None:
+            return
+        with self._lock:
+            observation = self._observations.get(city_id, Observation(0))
+            self._observations[city_id] = observation._replace(
+                etag=etag, last_modified=last_modified
+            )
+            self._changed.add(city_id)
+
+    def reset(self):
+        """Drops the unsaved observations, the index is loaded again on next use"""
+        with self._lock:
+            self._observations.clear()
+            self._changed.clear()
+        self._loaded = False
+
+    def save(self, session: Session):
+        """Upserts the observations changed since the last save, without committing"""
+        with self._lock:
+            rows = [
+                {"city_id": city_id, **self._observations[city_id]._asdict()}
+                for city_id in self._changed
+            ]
+            self._changed.clear()
+        if not rows:
+            return
+        stmt = sqlite_insert(CityObservation)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["city_id"],
+            set_={
+                "observed_at": stmt.excluded.observed_at,
+                "etag": stmt.excluded.etag,
+                "last_modified": stmt.excluded.last_modified,
+                "provider_id": stmt.excluded.provider_id,
+                "updated_at": datetime.now(timezone.utc),
+            },
+        )
+        session.execute(stmt, rows)
+
+
+# shared instance, kept warm for the lifetime of the process
+observation_index = ObservationIndex()
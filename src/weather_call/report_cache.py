@@ -0,0 +1,194 @@
+from sqlalchemy.orm import Session
+from weather_call.watermark import read_watermark
+from collections import OrderedDict
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from pathlib import Path
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+import polars as pl
+
+logger = logging.getLogger(__name__)
+
+# counter bumped by the etl every time hourly weather rows are written
+DATA_VERSION = "hourly_weather_data_version"
+
+ReportResult = pl.DataFrame | dict[str, pl.DataFrame]
+
+
+class ReportCache:
+    """
+    Memoizes report results keyed by report name, parameters, window and the
+    data version of the hourly weather table. The window is snapped to the
+    hourly rows it contains, so calls a few minutes apart share their entry,
+    and a new etl run changes the data version so stale results are never
+    returned. Entries are kept in memory with LRU and TTL eviction and can
+    be persisted as parquet files in persist_dir, to be reused across runs.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 128,
+        ttl: float = 300.0,
+        bucket: timedelta = timedelta(hours=1),
+        persist_dir: str | Path | None = None,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.bucket = bucket
+        self.persist_dir = Path(persist_dir) if persist_dir is not None else None
+        self._entries: OrderedDict[tuple, tuple[float, ReportResult]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+
+    def window(
+        self, initial_time: datetime, final_time: datetime
+    ) -> tuple[datetime, datetime]:
+        """
+        Snaps a window to the bucket boundaries of the rows it contains:
+        the start is rounded up and the end rounded down, which leaves the
+        selected hourly rows unchanged.
+        """
+        epoch = datetime(1970, 1, 1, tzinfo=initial_time.tzinfo)
+        start = initial_time - (initial_time - epoch) % self.bucket
+        if start < initial_time:
+            start += self.bucket
+        end = final_time - (final_time - epoch) % self.bucket
+        return start, end
+
+    def get_or_compute(
+        self,
+        session: Session,
+        report: str,
+        initial_time: datetime,
+        final_time: datetime,
+        params: dict,
+        compute: Callable[[datetime, datetime], ReportResult],
+    ) -> ReportResult:
+        """
+        Returns the cached result of a report, or computes it on the snapped
+        window with compute(initial_time, final_time) and stores it.
+        """
+        start, end = self.window(initial_time, final_time)
+        data_version = read_watermark(session, DATA_VERSION)
+        key = (
+            report,
+            tuple(sorted((name, repr(value)) for name, value in params.items())),
+            start,
+            end,
+            data_version,
+        )
+
+        result = self._get(key)
+        if result is None:
+            result = self._load(key)
+        if result is not None:
+            self.hits += 1
+            return result
+
+        self.misses += 1
+        result = compute(start, end)
+        self._put(key, result)
+        self._save(key, result)
+        return result
+
+    def call(
+        self,
+        report: Callable[..., pl.DataFrame],
+        initial_time: datetime,
+        final_time: datetime,
+        session: Session,
+        **params,
+    ) -> pl.DataFrame:
+        """Cached call of one of the report functions of weather_call.reports."""
+        return self.get_or_compute(
+            session,
+            report.__name__,
+            initial_time,
+            final_time,
+            params,
+            lambda start, end: report(
+                initial_time=start, final_time=end, session=session, **params
+            ),
+        )
+
+    def clear(self):
+        """Drops every entry, in memory and on disk"""
+        with self._lock:
+            self._entries.clear()
+        if self.persist_dir is not None:
+            shutil.rmtree(self.persist_dir, ignore_errors=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key: tuple) -> ReportResult | None:
+        """Returns a live in-memory entry, marking it as recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, result = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return result
+
+    def _put(self, key: tuple, result: ReportResult):
+        """Adds an entry, evicting the least recently used ones"""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _entry_dir(self, key: tuple) -> Path:
+        return self.persist_dir / hashlib.sha256(repr(key).encode()).hexdigest()[:32]
+
+    def _load(self, key: tuple) -> ReportResult | None:
+        """Loads a persisted entry younger than the ttl, if any"""
+        if self.persist_dir is None:
+            return None
+        entry_dir = self._entry_dir(key)
+        if not entry_dir.is_dir() or time.time() - entry_dir.stat().st_mtime > self.ttl:
+            return None
+
+        frame_path = entry_dir / "frame.parquet"
+        if frame_path.exists():
+            result = pl.read_parquet(frame_path)
+        else:
+            result = {
+                path.stem.removeprefix("report-"): pl.read_parquet(path)
+                for path in entry_dir.glob("report-*.parquet")
+            }
+        self._put(key, result)
+        return result
+
+    def _save(self, key: tuple, result: ReportResult):
+        """Persists an entry as parquet files, replacing the folder atomically"""
+        if self.persist_dir is None:
+            return
+        entry_dir = self._entry_dir(key)
+        tmp_dir = entry_dir.with_name(f"{entry_dir.name}.{os.getpid()}.tmp")
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        if isinstance(result, pl.DataFrame):
+            result.write_parquet(tmp_dir / "frame.parquet")
+        else:
+            for name, df in result.items():
+                df.write_parquet(tmp_dir / f"report-{name}.parquet")
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+        logger.debug(f"Persisted report cache entry {key[0]} to {entry_dir}")
+
+        # entries of older data versions are never read again
+        for old_dir in self.persist_dir.iterdir():
+            if time.time() - old_dir.stat().st_mtime > self.ttl:
+                shutil.rmtree(old_dir, ignore_errors=True)
@@ -0,0 +1,143 @@
+from sqlalchemy import Engine, select
+from sqlalchemy.orm import Session
+from weather_call.model.city import City
+from weather_call.model.database import build_engine
+from weather_call.export import scan_hourly_parquet
+from weather_call.reports import (
+    DAILY_SOURCE_COLUMNS,
+    WINDOW_SCHEMA,
+    _hourly_window_query,
+)
+from weather_call.rollup import daily_aggregates
+from weather_call import metrics
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import functools
+import logging
+import multiprocessing
+import os
+import polars as pl
+
+logger = logging.getLogger(__name__)
+
+
+@functools.cache
+def _worker_engine(database_url: str) -> Engine:
+    """Read only engine of a worker process, opened on its first shard"""
+    return build_engine(database_url, read_only=True)
+
+
+def _shard_daily_window(
+    database_url: str,
+    initial_time: datetime,
+    final_time: datetime,
+    city_ids: list[int],
+    parquet_root: str | None = None,
+) -> pl.DataFrame:
+    """
+    Daily aggregates per city name of the hourly rows of a shard of cities,
+    computed in a worker process on its own read only connection.
+    """
+    if parquet_root is not None:
+        lf_window = scan_hourly_parquet(parquet_root, initial_time, final_time).filter(
+            pl.col("city_id").is_in(city_ids)
+        )
+        return daily_aggregates(
+            lf_window.select(
+                pl.col(column).cast(WINDOW_SCHEMA[column])
+                for column in DAILY_SOURCE_COLUMNS
+            ),
+            "name",
+        ).collect()
+
+    with _worker_engine(database_url).connect() as connection:
+        df_window = pl.read_database(
+            query=_hourly_window_query(
+                initial_time,
+                final_time,
+                DAILY_SOURCE_COLUMNS,
+                city_ids=city_ids,
+            ),
+            connection=connection,
+            schema_overrides={
+                column: WINDOW_SCHEMA[column] for column in DAILY_SOURCE_COLUMNS
+            },
+        )
+    return daily_aggregates(df_window.lazy(), "name").collect()
+
+
+class ReportPool:
+    """
+    Process pool computing the daily aggregates of a report window in
+    parallel. The cities are split in one shard per worker, every worker
+    reads and aggregates the hourly rows of its shard on its own read only
+    SQLite connection (or its own parquet partitions), and the shards are
+    concatenated: a city is in a single shard, so its daily rows are
+    complete and the daily report plans give the same frames as the single
+    process modes.
+    Workers are started once and reused, so the pool should be kept for
+    the lifetime of the process and closed at the end.
+    """
+
+    def __init__(self, workers: int | None = None):
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        # polars runs its own threads, which do not survive a fork
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    def daily_window(
+        self,
+        session: Session,
+        initial_time: datetime,
+        final_time: datetime,
+        cities: list[str] | None = None,
+        parquet_root: str | None = None,
+    ) -> pl.DataFrame:
+        """Daily aggregates per city name of a window, computed by shard"""
+        city_query = select(City.id).order_by(City.id)
+        if cities is not None:
+            city_query = city_query.where(City.name.in_(cities))
+        city_ids = list(session.scalars(city_query))
+        if not city_ids:
+            return daily_aggregates(
+                pl.LazyFrame(
+                    schema={
+                        column: WINDOW_SCHEMA[column] for column in DAILY_SOURCE_COLUMNS
+                    }
+                ),
+                "name",
+            ).collect()
+
+        # contiguous ids, so every worker reads a compact part of the index
+        shard_size = -(-len(city_ids) // self.workers)
+        shards = [
+            city_ids[start : start + shard_size]
+            for start in range(0, len(city_ids), shard_size)
+        ]
+        database_url = session.get_bind().url.render_as_string(hide_password=False)
+        with metrics.span("report_shards", workers=self.workers):
+            futures = [
+                self._executor.submit(
+                    _shard_daily_window,
+                    database_url,
+                    initial_time,
+                    final_time,
+                    shard,
+                    parquet_root,
+                )
+                for shard in shards
+            ]
+            frames = [future.result() for future in futures]
+        logger.debug(f"Computed {len(shards)} report shards on {self.workers} workers")
+        return pl.concat(frames, how="vertical_relaxed")
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,48 +1,328 @@
-from sqlalchemy import select
+from sqlalchemy import Select, select
 from sqlalchemy.orm import Session
 import logging
 import polars as pl
-from datetime import datetime
+from datetime import datetime, time, timedelta
 from weather_call.model.weather import HourlyWeather
 from weather_call.model.city import City
+from weather_call.export import scan_hourly_parquet
+from weather_call.rollup import (
+    combine_daily_aggregates,
+    daily_aggregates,
+    load_daily_window,
+)
+from weather_call.report_cache import ReportCache
+from weather_call import metrics
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from weather_call.report_pool import ReportPool
 
 logger = logging.getLogger(__name__)
 
+# dtypes of the columns a report can request, so empty windows keep their schema
+WINDOW_SCHEMA = {
+    "name": pl.String,
+    "city_id": pl.Int64,
+    "hourly_timestamp": pl.Datetime("us"),
+    "temperature": pl.Decimal(38, 2),
+    "wind_speed": pl.Decimal(38, 2),
+    "weather_condition": pl.String,
+}
 
-def distinct_weather(
-    initial_time: datetime, final_time: datetime, session: Session
+# hourly columns aggregated into daily rows by the rollup and streaming modes
+DAILY_SOURCE_COLUMNS = [
+    "name",
+    "hourly_timestamp",
+    "temperature",
+    "wind_speed",
+    "weather_condition",
+]
+
+# rough in-memory size of one hourly window row, to size the streaming batches
+HOURLY_ROW_BYTES = 100
+
+
+def load_hourly_window(
+    session: Session,
+    initial_time: datetime,
+    final_time: datetime,
+    columns: list[str],
+    cities: list[str] | None = None,
+    parquet_root: str | None = None,
 ) -> pl.DataFrame:
-    """Generate a report of distinct weather conditions between two timestamps."""
-    stmt = select(HourlyWeather)
+    """
+    Load only the requested hourly weather columns between two timestamps.
+    The time range and the optional city subset are sent to SQLite as a
+    predicate so the hourly_timestamp index is used instead of a full scan.
+    The city name is available as the "name" column.
+    With parquet_root the window is read from the parquet export instead.
+    """
+    if parquet_root is not None:
+        lf_window = scan_hourly_parquet(parquet_root, initial_time, final_time)
+        if cities is not None:
+            lf_window = lf_window.filter(pl.col("name").is_in(cities))
+        with metrics.span("read_parquet", table="hourly_weather"):
+            df_window = lf_window.select(
+                pl.col(column).cast(WINDOW_SCHEMA[column]) for column in columns
+            ).collect()
+    else:
+        with metrics.span("read_database", table="hourly_weather"):
+            df_window = pl.read_database(
+                query=_hourly_window_query(initial_time, final_time, columns, cities),
+                connection=session.connection(),
+                schema_overrides={
+                    column: WINDOW_SCHEMA[column]
+                    for column in columns
+                    if column in WINDOW_SCHEMA
+                },
+            )
+    metrics.count("report_rows_read", df_window.height, table="hourly_weather")
+    return df_window
 
-    df_full = pl.read_database(
-        query=stmt,
-        connection=session.connection(),
-    )
 
-    distinct_weather_df = (
-        df_full.filter(pl.col("hourly_timestamp").is_between(initial_time, final_time))
-        .select("weather_condition")
-        .unique()
+def _hourly_window_query(
+    initial_time: datetime,
+    final_time: datetime,
+    columns: list[str],
+    cities: list[str] | None = None,
+    city_ids: list[int] | None = None,
+) -> Select:
+    """
+    Query of the requested hourly weather columns between two timestamps,
+    optionally restricted to city names or to city ids.
+    """
+    selected_columns = [
+        City.name if column == "name" else getattr(HourlyWeather, column)
+        for column in columns
+    ]
+    stmt = (
+        select(*selected_columns)
+        .select_from(HourlyWeather)
+        .where(HourlyWeather.hourly_timestamp.between(initial_time, final_time))
     )
-    return distinct_weather_df
+    if "name" in columns or cities is not None:
+        stmt = stmt.join(City, HourlyWeather.city_id == City.id)
+    if cities is not None:
+        stmt = stmt.where(City.name.in_(cities))
+    if city_ids is not None:
+        stmt = stmt.where(HourlyWeather.city_id.in_(city_ids))
+    return stmt
 
 
-def rank_common_weather(
-    initial_time: datetime, final_time: datetime, session: Session
+def load_rollup_window(
+    session: Session,
+    initial_time: datetime,
+    final_time: datetime,
+    cities: list[str] | None = None,
+    parquet_root: str | None = None,
+) -> tuple[pl.DataFrame, int]:
+    """
+    Load the window as daily aggregates per city name: the days fully inside
+    the window come from the daily rollup table and the partial days at its
+    edges are aggregated from their hourly rows, so the result is exact.
+    Returns the daily rows and the number of reads.
+    """
+    # hourly rows are on the hour, so a day is full once its 23:00 row is in
+    first_day = initial_time.date()
+    if initial_time > datetime.combine(first_day, time.min):
+        first_day += timedelta(days=1)
+    last_day = (final_time + timedelta(hours=1)).date() - timedelta(days=1)
+
+    if first_day > last_day:
+        df_window = load_hourly_window(
+            session,
+            initial_time,
+            final_time,
+            DAILY_SOURCE_COLUMNS,
+            cities,
+            parquet_root,
+        )
+        return daily_aggregates(df_window.lazy(), "name").collect(), 1
+
+    daily_frames = [load_daily_window(session, first_day, last_day, cities)]
+    edges = [
+        (initial_time, datetime.combine(first_day, time.min) - timedelta.resolution),
+        (datetime.combine(last_day + timedelta(days=1), time.min), final_time),
+    ]
+    for edge_start, edge_end in edges:
+        if edge_start > edge_end:
+            continue
+        df_edge = load_hourly_window(
+            session, edge_start, edge_end, DAILY_SOURCE_COLUMNS, cities, parquet_root
+        )
+        daily_frames.append(daily_aggregates(df_edge.lazy(), "name").collect())
+    return pl.concat(daily_frames, how="diagonal_relaxed"), len(daily_frames)
+
+
+def stream_daily_window(
+    session: Session,
+    initial_time: datetime,
+    final_time: datetime,
+    cities: list[str] | None = None,
+    parquet_root: str | None = None,
+    memory_limit_mb: float = 256,
 ) -> pl.DataFrame:
-    """Generate a report of distinct weather conditions between two timestamps."""
-    stmt = select(HourlyWeather).join(City).add_columns(City.name)
+    """
+    Load the window as daily aggregates per city name without holding all
+    its hourly rows in memory. Hourly rows are read in batches sized so a
+    batch takes about half of memory_limit_mb; the limit only covers the
+    batch, the daily aggregates kept next to it grow with the number of
+    cities and days of the window. Every batch is aggregated on its own and
+    the partial aggregates are combined when they outgrow both a batch and
+    the aggregates combined so far, so every row is combined a bounded
+    number of times. With parquet_root the same aggregation runs on the
+    polars streaming engine.
+    """
+    if parquet_root is not None:
+        lf_window = scan_hourly_parquet(parquet_root, initial_time, final_time)
+        if cities is not None:
+            lf_window = lf_window.filter(pl.col("name").is_in(cities))
+        lf_window = lf_window.select(
+            pl.col(column).cast(WINDOW_SCHEMA[column])
+            for column in DAILY_SOURCE_COLUMNS
+        )
+        with metrics.span("read_parquet", table="hourly_weather", mode="streaming"):
+            return daily_aggregates(lf_window, "name").collect(engine="streaming")
 
-    df_full = pl.read_database(
-        query=stmt,
+    batch_size = max(int(memory_limit_mb * 2**20 / 2 / HOURLY_ROW_BYTES), 1)
+    batches = pl.read_database(
+        query=_hourly_window_query(
+            initial_time, final_time, DAILY_SOURCE_COLUMNS, cities
+        ),
         connection=session.connection(),
+        iter_batches=True,
+        batch_size=batch_size,
+        schema_overrides={
+            column: WINDOW_SCHEMA[column] for column in DAILY_SOURCE_COLUMNS
+        },
+    )
+    # the empty aggregates keep the schema of a window without rows
+    partials = [
+        daily_aggregates(
+            pl.LazyFrame(
+                schema={
+                    column: WINDOW_SCHEMA[column] for column in DAILY_SOURCE_COLUMNS
+                }
+            ),
+            "name",
+        ).collect()
+    ]
+    combined_rows = 0
+    pending_rows = 0
+    with metrics.span("read_database", table="hourly_weather", mode="streaming"):
+        for df_batch in batches:
+            metrics.count("report_rows_read", df_batch.height, table="hourly_weather")
+            df_partial = daily_aggregates(df_batch.lazy(), "name").collect()
+            partials.append(df_partial)
+            pending_rows += df_partial.height
+            if pending_rows > max(batch_size, combined_rows):
+                partials = [_combine_partials(partials)]
+                combined_rows = partials[0].height
+                pending_rows = 0
+    if len(partials) == 1:
+        return partials[0]
+    return _combine_partials(partials)
+
+
+def _combine_partials(partials: list[pl.DataFrame]) -> pl.DataFrame:
+    """Combines partial daily aggregates per city name into one row per day."""
+    return combine_daily_aggregates(
+        pl.concat([partial.lazy() for partial in partials]), "name"
+    ).collect()
+
+
+def _daily_window(
+    session: Session,
+    initial_time: datetime,
+    final_time: datetime,
+    cities: list[str] | None,
+    parquet_root: str | None,
+    memory_limit_mb: float | None,
+    pool: "ReportPool | None",
+) -> pl.DataFrame:
+    """Daily aggregates of a window, sharded on the pool or streamed in batches."""
+    if pool is not None:
+        return pool.daily_window(
+            session, initial_time, final_time, cities, parquet_root
+        )
+    return stream_daily_window(
+        session, initial_time, final_time, cities, parquet_root, memory_limit_mb
+    )
+
+
+def _distinct_weather_plan(lf_window: pl.LazyFrame) -> pl.LazyFrame:
+    """Distinct weather conditions of a window."""
+    return lf_window.select("weather_condition").unique()
+
+
+def _rank_common_weather_plan(lf_window: pl.LazyFrame) -> pl.LazyFrame:
+    """Most common weather condition per city of a window."""
+    return (
+        lf_window.group_by(pl.col("name").alias("city"), "weather_condition")
+        .agg(frequency=pl.len())
+        .with_columns(
+            pl.col("frequency")
+            .rank("dense", descending=True)
+            .over("city")
+            .alias("rank")
+        )
+        .filter(pl.col("rank") == 1)
+        .drop("rank")
+    )
+
+
+def _average_temperature_plan(lf_window: pl.LazyFrame) -> pl.LazyFrame:
+    """Average temperature per city of a window."""
+    # exact decimal sum, so the streaming and rollup modes give the same floats
+    return lf_window.group_by(pl.col("name").alias("city")).agg(
+        average_temperature=pl.sum("temperature").cast(pl.Float64)
+        / pl.count("temperature")
+    )
+
+
+def _highest_column_value_plan(lf_window: pl.LazyFrame, column: str) -> pl.LazyFrame:
+    """City with the highest absolute value of a column in a window."""
+    # ties go to the positive value and then to the first city by name
+    return lf_window.top_k(
+        1, by=[pl.col(column).abs(), column, "name"], reverse=[False, False, True]
+    ).select(pl.col("name").alias("city"), column)
+
+
+def _variation_plan(lf_window: pl.LazyFrame) -> pl.LazyFrame:
+    """City with the highest daily temperature variation in a window."""
+    return (
+        lf_window.with_columns(
+            day=pl.col("hourly_timestamp").dt.date(),
+        )
+        .group_by(pl.col("name").alias("city"), "day")
+        .agg(variation=pl.max("temperature") - pl.min("temperature"))
+        # ties go to the first city by name and then to the first day
+        .top_k(1, by=["variation", "city", "day"], reverse=[False, True, True])
+    )
+
+
+def _condition_frequencies(lf_daily: pl.LazyFrame) -> pl.LazyFrame:
+    """Weather condition counts per city and day of a daily window, long form."""
+    return (
+        lf_daily.select("name", "weather_condition_counts")
+        .explode("weather_condition_counts")
+        .unnest("weather_condition_counts")
+        .drop_nulls("weather_condition")
     )
 
-    most_common_df = (
-        df_full.filter(pl.col("hourly_timestamp").is_between(initial_time, final_time))
+
+def _daily_distinct_weather_plan(lf_daily: pl.LazyFrame) -> pl.LazyFrame:
+    """Distinct weather conditions of a daily window."""
+    return _condition_frequencies(lf_daily).select("weather_condition").unique()
+
+
+def _daily_rank_common_weather_plan(lf_daily: pl.LazyFrame) -> pl.LazyFrame:
+    """Most common weather condition per city of a daily window."""
+    return (
+        _condition_frequencies(lf_daily)
         .group_by(pl.col("name").alias("city"), "weather_condition")
-        .agg(frequency=pl.count())
+        .agg(frequency=pl.sum("count").cast(pl.UInt32))
         .with_columns(
             pl.col("frequency")
             .rank("dense", descending=True)
@@ -52,65 +332,377 @@ def rank_common_weather(
         .filter(pl.col("rank") == 1)
         .drop("rank")
     )
+
+
+def _daily_average_temperature_plan(lf_daily: pl.LazyFrame) -> pl.LazyFrame:
+    """Average temperature per city of a daily window."""
+    return lf_daily.group_by(pl.col("name").alias("city")).agg(
+        average_temperature=pl.sum("temperature_sum").cast(pl.Float64)
+        / pl.sum("temperature_count")
+    )
+
+
+def _daily_highest_temperature_plan(lf_daily: pl.LazyFrame) -> pl.LazyFrame:
+    """City with the highest absolute temperature of a daily window."""
+    return (
+        lf_daily.with_columns(
+            temperature=pl.when(
+                pl.col("temperature_max").abs() >= pl.col("temperature_min").abs()
+            )
+            .then("temperature_max")
+            .otherwise("temperature_min")
+        )
+        .top_k(
+            1,
+            by=[pl.col("temperature").abs(), "temperature", "name"],
+            reverse=[False, False, True],
+        )
+        .select(pl.col("name").alias("city"), "temperature")
+    )
+
+
+def _daily_variation_plan(lf_daily: pl.LazyFrame) -> pl.LazyFrame:
+    """City with the highest daily temperature variation of a daily window."""
+    return (
+        lf_daily.group_by(pl.col("name").alias("city"), "day")
+        .agg(variation=pl.max("temperature_max") - pl.min("temperature_min"))
+        .top_k(1, by=["variation", "city", "day"], reverse=[False, True, True])
+    )
+
+
+def _daily_highest_wind_speed_plan(lf_daily: pl.LazyFrame) -> pl.LazyFrame:
+    """City with the highest wind speed of a daily window."""
+    return lf_daily.top_k(
+        1, by=["wind_speed_max", "name"], reverse=[False, True]
+    ).select(pl.col("name").alias("city"), pl.col("wind_speed_max").alias("wind_speed"))
+
+
+def _daily_highest_column_value_plan(
+    lf_daily: pl.LazyFrame, column: str
+) -> pl.LazyFrame:
+    """City with the highest absolute value of a column in a daily window."""
+    if column == "temperature":
+        return _daily_highest_temperature_plan(lf_daily)
+    if column == "wind_speed":
+        return _daily_highest_wind_speed_plan(lf_daily)
+    raise ValueError(f"No daily aggregate for column {column}")
+
+
+def distinct_weather(
+    initial_time: datetime,
+    final_time: datetime,
+    session: Session,
+    cities: list[str] | None = None,
+    parquet_root: str | None = None,
+    memory_limit_mb: float | None = None,
+    pool: "ReportPool | None" = None,
+) -> pl.DataFrame:
+    """Generate a report of distinct weather conditions between two timestamps."""
+    if memory_limit_mb is not None or pool is not None:
+        df_daily = _daily_window(
+            session,
+            initial_time,
+            final_time,
+            cities,
+            parquet_root,
+            memory_limit_mb,
+            pool,
+        )
+        with metrics.span("report_transform", report="distinct_weather"):
+            return _daily_distinct_weather_plan(df_daily.lazy()).collect()
+
+    df_window = load_hourly_window(
+        session, initial_time, final_time, ["weather_condition"], cities, parquet_root
+    )
+
+    with metrics.span("report_transform", report="distinct_weather"):
+        distinct_weather_df = _distinct_weather_plan(df_window.lazy()).collect()
+    return distinct_weather_df
+
+
+def rank_common_weather(
+    initial_time: datetime,
+    final_time: datetime,
+    session: Session,
+    cities: list[str] | None = None,
+    parquet_root: str | None = None,
+    memory_limit_mb: float | None = None,
+    pool: "ReportPool | None" = None,
+) -> pl.DataFrame:
+    """Generate a report of distinct weather conditions between two timestamps."""
+    if memory_limit_mb is not None or pool is not None:
+        df_daily = _daily_window(
+            session,
+            initial_time,
+            final_time,
+            cities,
+            parquet_root,
+            memory_limit_mb,
+            pool,
+        )
+        with metrics.span("report_transform", report="rank_common_weather"):
+            return _daily_rank_common_weather_plan(df_daily.lazy()).collect()
+
+    df_window = load_hourly_window(
+        session,
+        initial_time,
+        final_time,
+        ["name", "weather_condition"],
+        cities,
+        parquet_root,
+    )
+
+    with metrics.span("report_transform", report="rank_common_weather"):
+        most_common_df = _rank_common_weather_plan(df_window.lazy()).collect()
     return most_common_df
 
 
 def average_temperature(
-    initial_time: datetime, final_time: datetime, session: Session
+    initial_time: datetime,
+    final_time: datetime,
+    session: Session,
+    cities: list[str] | None = None,
+    parquet_root: str | None = None,
+    memory_limit_mb: float | None = None,
+    pool: "ReportPool | None" = None,
 ) -> pl.DataFrame:
     """Generate a report of distinct weather conditions between two timestamps."""
-    stmt = select(HourlyWeather).join(City).add_columns(City.name)
+    if memory_limit_mb is not None or pool is not None:
+        df_daily = _daily_window(
+            session,
+            initial_time,
+            final_time,
+            cities,
+            parquet_root,
+            memory_limit_mb,
+            pool,
+        )
+        with metrics.span("report_transform", report="average_temperature"):
+            return _daily_average_temperature_plan(df_daily.lazy()).collect()
 
-    df_full = pl.read_database(
-        query=stmt,
-        connection=session.connection(),
+    df_window = load_hourly_window(
+        session, initial_time, final_time, ["name", "temperature"], cities, parquet_root
     )
 
-    avg_temp_df = (
-        df_full.filter(pl.col("hourly_timestamp").is_between(initial_time, final_time))
-        .group_by(pl.col("name").alias("city"))
-        .agg(average_temperature=pl.mean("temperature"))
-    )
+    with metrics.span("report_transform", report="average_temperature"):
+        avg_temp_df = _average_temperature_plan(df_window.lazy()).collect()
     return avg_temp_df
 
 
 def city_with_highest_column_value(
-    column, initial_time: datetime, final_time: datetime, session: Session
+    column,
+    initial_time: datetime,
+    final_time: datetime,
+    session: Session,
+    cities: list[str] | None = None,
+    parquet_root: str | None = None,
+    memory_limit_mb: float | None = None,
+    pool: "ReportPool | None" = None,
 ) -> pl.DataFrame:
     """Generate a report of distinct weather conditions between two timestamps."""
-    stmt = select(HourlyWeather).join(City).add_columns(City.name)
+    if memory_limit_mb is not None or pool is not None:
+        df_daily = _daily_window(
+            session,
+            initial_time,
+            final_time,
+            cities,
+            parquet_root,
+            memory_limit_mb,
+            pool,
+        )
+        with metrics.span("report_transform", report="city_with_highest_column_value"):
+            return _daily_highest_column_value_plan(df_daily.lazy(), column).collect()
 
-    df_full = pl.read_database(
-        query=stmt,
-        connection=session.connection(),
+    df_window = load_hourly_window(
+        session, initial_time, final_time, ["name", column], cities, parquet_root
     )
 
-    highest_attribute_df = (
-        df_full.filter(pl.col("hourly_timestamp").is_between(initial_time, final_time))
-        .top_k(1, by=pl.col(column).abs())
-        .select(pl.col("name").alias("city"), column)
-    )
+    with metrics.span("report_transform", report="city_with_highest_column_value"):
+        highest_attribute_df = _highest_column_value_plan(
+            df_window.lazy(), column
+        ).collect()
     return highest_attribute_df
 
 
 def city_with_variation(
-    initial_time: datetime, final_time: datetime, session: Session
+    initial_time: datetime,
+    final_time: datetime,
+    session: Session,
+    cities: list[str] | None = None,
+    parquet_root: str | None = None,
+    memory_limit_mb: float | None = None,
+    pool: "ReportPool | None" = None,
 ) -> pl.DataFrame:
     """Generate a report of distinct weather conditions between two timestamps."""
-    stmt = select(HourlyWeather).join(City).add_columns(City.name)
+    if memory_limit_mb is not None or pool is not None:
+        df_daily = _daily_window(
+            session,
+            initial_time,
+            final_time,
+            cities,
+            parquet_root,
+            memory_limit_mb,
+            pool,
+        )
+        with metrics.span("report_transform", report="city_with_variation"):
+            return _daily_variation_plan(df_daily.lazy()).collect()
 
-    df_full = pl.read_database(
-        query=stmt,
-        connection=session.connection(),
+    df_window = load_hourly_window(
+        session,
+        initial_time,
+        final_time,
+        ["name", "hourly_timestamp", "temperature"],
+        cities,
+        parquet_root,
     )
 
-    highest_temp_variation_df = (
-        df_full.filter(pl.col("hourly_timestamp").is_between(initial_time, final_time))
-        .with_columns(
-            day=pl.col("hourly_timestamp").dt.date(),
-        )
-        .group_by(pl.col("name").alias("city"), "day")
-        .agg(variation=pl.max("temperature") - pl.min("temperature"))
-        .top_k(1, by=pl.col("variation"))
-    )
+    with metrics.span("report_transform", report="city_with_variation"):
+        highest_temp_variation_df = _variation_plan(df_window.lazy()).collect()
     return highest_temp_variation_df
+
+
+class ReportBundle:
+    """
+    Computes all the main reports of a time window from a single read of the
+    hourly weather table. The window is loaded once as a LazyFrame and every
+    report is a plan on top of it, collected together with pl.collect_all so
+    the shared scan is only computed once.
+    With parquet_root the window is scanned from the parquet export.
+    With rollup the reports are computed from the daily rollup table, which
+    reads about 24 times fewer rows on multi-day windows.
+    With memory_limit_mb the window is streamed in batches and folded into
+    daily aggregates, so long windows fit in a bounded amount of memory.
+    With a pool the daily aggregates are computed by city shard on several
+    worker processes.
+    With a cache, results are reused until new hourly rows are written.
+    """
+
+    columns = [
+        "name",
+        "hourly_timestamp",
+        "temperature",
+        "wind_speed",
+        "weather_condition",
+    ]
+
+    def __init__(
+        self,
+        session: Session,
+        initial_time: datetime,
+        final_time: datetime,
+        cities: list[str] | None = None,
+        parquet_root: str | None = None,
+        rollup: bool = False,
+        cache: ReportCache | None = None,
+        memory_limit_mb: float | None = None,
+        pool: "ReportPool | None" = None,
+    ):
+        self.session = session
+        self.initial_time = initial_time
+        self.final_time = final_time
+        self.cities = cities
+        self.parquet_root = parquet_root
+        self.rollup = rollup
+        self.cache = cache
+        self.memory_limit_mb = memory_limit_mb
+        self.pool = pool
+
+        # read statistics, to check that a bundle only scans the table once
+        self.db_reads = 0
+        self.rows_loaded = 0
+
+    def collect(self) -> dict[str, pl.DataFrame]:
+        """Load the window once and compute every report from it."""
+        if self.cache is None:
+            return self._compute(self.initial_time, self.final_time)
+
+        return self.cache.get_or_compute(
+            self.session,
+            "report_bundle",
+            self.initial_time,
+            self.final_time,
+            {
+                "cities": self.cities,
+                "parquet_root": self.parquet_root,
+                "rollup": self.rollup,
+                "memory_limit_mb": self.memory_limit_mb,
+                "workers": None if self.pool is None else self.pool.workers,
+            },
+            self._compute,
+        )
+
+    def _compute(
+        self, initial_time: datetime, final_time: datetime
+    ) -> dict[str, pl.DataFrame]:
+        """Compute every report of a window from a single read of it."""
+        if self.rollup or self.memory_limit_mb is not None or self.pool is not None:
+            return self._compute_daily(initial_time, final_time)
+
+        df_window = load_hourly_window(
+            self.session,
+            initial_time,
+            final_time,
+            self.columns,
+            self.cities,
+            self.parquet_root,
+        )
+        self.db_reads += 1
+        self.rows_loaded += df_window.height
+        logger.info(
+            f"Loaded {df_window.height} hourly rows for the report bundle between {initial_time} and {final_time}"
+        )
+
+        lf_window = df_window.lazy()
+        plans = {
+            "distinct_weather": _distinct_weather_plan(lf_window),
+            "rank_common_weather": _rank_common_weather_plan(lf_window),
+            "average_temperature": _average_temperature_plan(lf_window),
+            "highest_temperature": _highest_column_value_plan(lf_window, "temperature"),
+            "temperature_variation": _variation_plan(lf_window),
+            "highest_wind_speed": _highest_column_value_plan(lf_window, "wind_speed"),
+        }
+        with metrics.span("report_transform", report="bundle"):
+            reports = pl.collect_all(list(plans.values()))
+        return dict(zip(plans.keys(), reports, strict=True))
+
+    def _compute_daily(
+        self, initial_time: datetime, final_time: datetime
+    ) -> dict[str, pl.DataFrame]:
+        """Compute every report from the daily aggregates of a window."""
+        if self.rollup:
+            df_daily, reads = load_rollup_window(
+                self.session,
+                initial_time,
+                final_time,
+                self.cities,
+                self.parquet_root,
+            )
+        else:
+            df_daily = _daily_window(
+                self.session,
+                initial_time,
+                final_time,
+                self.cities,
+                self.parquet_root,
+                self.memory_limit_mb,
+                self.pool,
+            )
+            reads = 1
+        self.db_reads += reads
+        self.rows_loaded += df_daily.height
+        logger.info(
+            f"Loaded {df_daily.height} daily rows for the report bundle between {initial_time} and {final_time}"
+        )
+
+        lf_daily = df_daily.lazy()
+        plans = {
+            "distinct_weather": _daily_distinct_weather_plan(lf_daily),
+            "rank_common_weather": _daily_rank_common_weather_plan(lf_daily),
+            "average_temperature": _daily_average_temperature_plan(lf_daily),
+            "highest_temperature": _daily_highest_temperature_plan(lf_daily),
+            "temperature_variation": _daily_variation_plan(lf_daily),
+            "highest_wind_speed": _daily_highest_wind_speed_plan(lf_daily),
+        }
+        with metrics.span("report_transform", report="bundle"):
+            reports = pl.collect_all(list(plans.values()))
+        return dict(zip(plans.keys(), reports, strict=True))
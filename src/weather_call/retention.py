@@ -0,0 +1,437 @@
+from sqlalchemy import (
+    Text,
+    case,
+    delete,
+    exists,
+    func,
+    or_,
+    select,
+    text,
+    tuple_,
+    type_coerce,
+    update,
+)
+from sqlalchemy.orm import Session, aliased
+from weather_call.model.city import CityBronze
+from weather_call.model.weather import HourlyWeatherBronze
+from weather_call.transform import BRONZE_WATERMARK
+from weather_call.watermark import read_watermark, write_watermark
+from weather_call import metrics
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import logging
+import os
+import polars as pl
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# highest bronze id whose is_latest flag is up to date
+COMPACTION_WATERMARK = "hourly_weather_bronze_compacted_id"
+
+# cutoff hour (hours since epoch) and highest transformed bronze id of the
+# last pruning run, the payloads before both are pruned already
+PRUNED_HOUR_WATERMARK = "hourly_weather_bronze_pruned_hour"
+PRUNED_ID_WATERMARK = "hourly_weather_bronze_pruned_id"
+
+# naive utc, like the stored hourly timestamps
+EPOCH = datetime(1970, 1, 1)
+
+# hive partition column of the bronze archive
+ARCHIVE_PARTITION_SCHEMA = {"month": pl.String}
+
+ARCHIVE_SCHEMA = {
+    "id": pl.Int64,
+    "city_id": pl.Int64,
+    "hourly_timestamp": pl.Datetime("us"),
+    "created_at": pl.Datetime("us"),
+    "payload": pl.String,
+}
+
+# payloads of the same city and provider share most of their text, zstd over
+# a parquet page of them compresses far better than every row on its own
+ARCHIVE_COMPRESSION_LEVEL = 15
+
+
+def mark_latest_bronze(session: Session) -> int:
+    """
+    Flips is_latest off in bulk for every bronze payload superseded by a
+    newer one of the same city and hour, and for every city bronze payload
+    superseded by a newer one of the same city. Only the hours that got new
+    payloads since the previous run are looked at. Nothing is committed.
+    Returns the number of hourly payloads flipped.
+    """
+    last_id = read_watermark(session, COMPACTION_WATERMARK)
+    max_id = session.scalar(select(func.max(HourlyWeatherBronze.id)))
+    if max_id is None or max_id <= last_id:
+        return 0
+
+    newer = aliased(HourlyWeatherBronze)
+    touched_hours = select(
+        HourlyWeatherBronze.city_id, HourlyWeatherBronze.hourly_timestamp
+    ).where(HourlyWeatherBronze.id > last_id, HourlyWeatherBronze.id <= max_id)
+    flipped = session.execute(
+        update(HourlyWeatherBronze)
+        .where(
+            HourlyWeatherBronze.is_latest,
+            HourlyWeatherBronze.id <= max_id,
+            tuple_(
+                HourlyWeatherBronze.city_id, HourlyWeatherBronze.hourly_timestamp
+            ).in_(touched_hours),
+            exists().where(
+                newer.city_id == HourlyWeatherBronze.city_id,
+                newer.hourly_timestamp == HourlyWeatherBronze.hourly_timestamp,
+                newer.id > HourlyWeatherBronze.id,
+                newer.id <= max_id,
+            ),
+        )
+        .values(is_latest=False)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    # the city bronze table has one row per geocoded city, it is small
+    newer_city = aliased(CityBronze)
+    session.execute(
+        update(CityBronze)
+        .where(
+            CityBronze.is_latest,
+            exists().where(
+                newer_city.name == CityBronze.name,
+                newer_city.country_id == CityBronze.country_id,
+                newer_city.id > CityBronze.id,
+            ),
+        )
+        .values(is_latest=False)
+        .execution_options(synchronize_session=False)
+    )
+    write_watermark(session, COMPACTION_WATERMARK, max_id)
+    return flipped
+
+
+def delete_superseded_bronze(session: Session) -> int:
+    """
+    Deletes the superseded payloads, keeping the latest payload of every
+    city and hour. Bronze rows not transformed into silver yet are kept.
+    Nothing is committed. Returns the number of hourly payloads deleted.
+    """
+    transformed_id = read_watermark(session, BRONZE_WATERMARK)
+    deleted = session.execute(
+        delete(HourlyWeatherBronze)
+        .where(
+            HourlyWeatherBronze.is_latest.is_(False),
+            HourlyWeatherBronze.id <= transformed_id,
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    session.execute(
+        delete(CityBronze)
+        .where(CityBronze.is_latest.is_(False))
+        .execution_options(synchronize_session=False)
+    )
+    return deleted
+
+
+def archive_aged_bronze(
+    session: Session,
+    root: str | Path,
+    older_than: datetime,
+    chunk_size: int = 50_000,
+) -> int:
+    """
+    Moves the bronze rows of the hours before older_than to zstd compressed
+    parquet files under root/month=YYYY-MM/, chunk_size rows at a time.
+    Every chunk is written to its files before its rows are deleted and
+    committed, so an interrupted run can only archive rows twice (readers
+    drop the duplicates, see scan_bronze_archive) and never lose them.
+    Bronze rows not transformed into silver yet stay in the database.
+    Returns the number of archived rows.
+    """
+    root = Path(root)
+    if older_than.tzinfo is not None:
+        older_than = older_than.astimezone(timezone.utc).replace(tzinfo=None)
+    transformed_id = read_watermark(session, BRONZE_WATERMARK)
+    run_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+    archived = 0
+    last_id = 0
+    while True:
+        stmt = (
+            select(
+                HourlyWeatherBronze.id,
+                HourlyWeatherBronze.city_id,
+                HourlyWeatherBronze.hourly_timestamp,
+                HourlyWeatherBronze.created_at,
+                # raw json text, archived as it was received
+                type_coerce(HourlyWeatherBronze.payload, Text).label("payload"),
+            )
+            .where(
+                HourlyWeatherBronze.id > last_id,
+                HourlyWeatherBronze.id <= transformed_id,
+                HourlyWeatherBronze.hourly_timestamp < older_than,
+            )
+            .order_by(HourlyWeatherBronze.id)
+            .limit(chunk_size)
+        )
+        chunk_df = pl.read_database(
+            query=stmt,
+            connection=session.connection(),
+            schema_overrides=ARCHIVE_SCHEMA,
+        )
+        if chunk_df.is_empty():
+            break
+
+        chunk_df = chunk_df.with_columns(
+            month=pl.col("hourly_timestamp").dt.strftime("%Y-%m")
+        )
+        partitions = chunk_df.partition_by("month", as_dict=True, include_key=False)
+        for (month,), partition_df in partitions.items():
+            folder = root / f"month={month}"
+            folder.mkdir(parents=True, exist_ok=True)
+            path = folder / f"bronze-{run_id}-{last_id}.parquet"
+            tmp_path = path.with_suffix(".parquet.tmp")
+            partition_df.write_parquet(
+                tmp_path,
+                compression="zstd",
+                compression_level=ARCHIVE_COMPRESSION_LEVEL,
+            )
+            os.replace(tmp_path, path)
+
+        ids = chunk_df["id"]
+        session.execute(
+            delete(HourlyWeatherBronze)
+            .where(
+                HourlyWeatherBronze.id.between(ids.min(), ids.max()),
+                HourlyWeatherBronze.hourly_timestamp < older_than,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        archived += chunk_df.height
+        last_id = ids.max()
+        logger.debug(f"Archived bronze rows up to id {last_id}")
+
+    metrics.count("archived_bronze_rows", archived)
+    if archived:
+        logger.info(
+            f"Archived {archived} bronze rows older than {older_than} to {root}"
+        )
+    return archived
+
+
+def _pruned_payload():
+    """
+    Column pruned json of a bronze payload, keeping the observation time,
+    the provider id and the fields the bronze to silver stage reads of the
+    current weather payloads, or of the historical (timemachine) ones
+    """
+
+    def field(path: str):
+        return func.json_extract(HourlyWeatherBronze.payload, path)
+
+    weather = func.json_array(func.json_object("main", field("$.weather[0].main")))
+    return case(
+        (
+            func.json_type(HourlyWeatherBronze.payload, "$.main").is_not(None),
+            func.json_object(
+                "id",
+                field("$.id"),
+                "dt",
+                field("$.dt"),
+                "main",
+                func.json_object("temp", field("$.main.temp")),
+                "wind",
+                func.json_object("speed", field("$.wind.speed")),
+                "weather",
+                weather,
+            ),
+        ),
+        else_=func.json_object(
+            "dt",
+            field("$.dt"),
+            "temp",
+            field("$.temp"),
+            "wind_speed",
+            field("$.wind_speed"),
+            "weather",
+            weather,
+        ),
+    )
+
+
+def prune_aged_bronze(session: Session, older_than: datetime) -> int:
+    """
+    Rewrites the payloads of the hours before older_than that stay in the
+    database to their column pruned json, in one bulk update, so they keep
+    being read by the bronze to silver stage (a full replay gives the same
+    silver rows) at a fraction of their size. Bronze rows not transformed
+    into silver yet are kept whole, and only the rows that were not pruned
+    by a previous run are rewritten. Nothing is committed.
+    Returns the number of pruned payloads.
+    """
+    if older_than.tzinfo is not None:
+        older_than = older_than.astimezone(timezone.utc).replace(tzinfo=None)
+    transformed_id = read_watermark(session, BRONZE_WATERMARK)
+    pruned_hour = read_watermark(session, PRUNED_HOUR_WATERMARK)
+    pruned_id = read_watermark(session, PRUNED_ID_WATERMARK)
+    # rows of the hours newly past the cutoff, and older hours added since
+    # the last run, like backfilled ones
+    pruned_before = EPOCH + timedelta(hours=pruned_hour)
+    pruned = session.execute(
+        update(HourlyWeatherBronze)
+        .where(
+            HourlyWeatherBronze.hourly_timestamp < older_than,
+            HourlyWeatherBronze.id <= transformed_id,
+            or_(
+                HourlyWeatherBronze.hourly_timestamp >= pruned_before,
+                HourlyWeatherBronze.id > pruned_id,
+            ),
+        )
+        # is_latest is kept as it is, its onupdate would flag the pruned
+        # payloads as superseded and the next compaction would delete them
+        .values(payload=_pruned_payload(), is_latest=HourlyWeatherBronze.is_latest)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    # rounded up, the hourly timestamps are whole hours so every one before
+    # older_than is before it and the hour it falls in is not pruned again
+    cutoff_hour = -((EPOCH - older_than) // timedelta(hours=1))
+    write_watermark(session, PRUNED_HOUR_WATERMARK, max(pruned_hour, cutoff_hour))
+    write_watermark(session, PRUNED_ID_WATERMARK, transformed_id)
+    metrics.count("pruned_bronze_rows", pruned)
+    return pruned
+
+
+def scan_bronze_archive(root: str | Path) -> pl.LazyFrame:
+    """
+    Lazily scans the archived bronze rows, with the payload as json text.
+    Rows archived twice by an interrupted run are kept once.
+    """
+    root = Path(root)
+    if not any(root.glob("month=*/*.parquet")):
+        return pl.LazyFrame(schema={**ARCHIVE_PARTITION_SCHEMA, **ARCHIVE_SCHEMA})
+
+    return pl.scan_parquet(
+        root / "**" / "*.parquet",
+        hive_partitioning=True,
+        hive_schema=ARCHIVE_PARTITION_SCHEMA,
+    ).unique(subset=["id"], keep="first")
+
+
+def bronze_storage_report(
+    session: Session,
+    archive_root: str | Path | None = None,
+    chunk_size: int = 50_000,
+):
+    """
+    Size of the database and of the bronze archive, and the time it takes to
+    read every bronze payload the way the bronze to silver stage reads them:
+    in chunks of chunk_size rows ordered by id, so only one chunk is held in
+    memory at a time.
+    """
+    page_size = session.execute(text("PRAGMA page_size")).scalar_one()
+    page_count = session.execute(text("PRAGMA page_count")).scalar_one()
+    freelist_count = session.execute(text("PRAGMA freelist_count")).scalar_one()
+
+    bronze_rows = 0
+    payload_bytes = 0
+    last_id = 0
+    start_time = time.perf_counter()
+    while True:
+        chunk_df = pl.read_database(
+            query=select(
+                HourlyWeatherBronze.id,
+                HourlyWeatherBronze.city_id,
+                HourlyWeatherBronze.hourly_timestamp,
+                type_coerce(HourlyWeatherBronze.payload, Text).label("payload"),
+            )
+            .where(HourlyWeatherBronze.id > last_id)
+            .order_by(HourlyWeatherBronze.id)
+            .limit(chunk_size),
+            connection=session.connection(),
+        )
+        if chunk_df.is_empty():
+            break
+        bronze_rows += chunk_df.height
+        payload_bytes += chunk_df["payload"].str.len_bytes().sum()
+        last_id = chunk_df["id"].max()
+    scan_seconds = time.perf_counter() - start_time
+
+    archive_bytes = 0
+    if archive_root is not None:
+        archive_bytes = sum(
+            path.stat().st_size for path in Path(archive_root).glob("month=*/*.parquet")
+        )
+    return {
+        "database_bytes": page_size * page_count,
+        "free_bytes": page_size * freelist_count,
+        "bronze_rows": bronze_rows,
+        "bronze_payload_bytes": payload_bytes,
+        "bronze_scan_seconds": scan_seconds,
+        "archive_bytes": archive_bytes,
+    }
+
+
+def compact_bronze(
+    session: Session,
+    archive_root: str | Path | None = None,
+    retention_days: float | None = None,
+    vacuum: bool = False,
+) -> dict:
+    """
+    Retention job of the bronze tables: keeps only the latest payload of
+    every city and hour, maintaining is_latest in bulk, and moves the hours
+    older than retention_days to the compressed archive under archive_root.
+    Without archive_root the aged payloads stay in the database pruned to
+    the fields silver reads (nothing ages when retention_days is unset).
+    With vacuum the freed pages are given back to the file system. Returns
+    the storage report before and after, which is also logged.
+    """
+    before = bronze_storage_report(session, archive_root)
+    logger.info(f"Bronze storage before compaction: {_format_report(before)}")
+
+    with metrics.span("bronze_compaction"):
+        flipped = mark_latest_bronze(session)
+        deleted = delete_superseded_bronze(session)
+        session.commit()
+        logger.info(
+            f"Flagged {flipped} superseded bronze payloads and deleted {deleted}"
+        )
+
+        archived = 0
+        pruned = 0
+        if retention_days is not None:
+            older_than = datetime.now(timezone.utc) - timedelta(days=retention_days)
+            if archive_root is not None:
+                archived = archive_aged_bronze(session, archive_root, older_than)
+            else:
+                pruned = prune_aged_bronze(session, older_than)
+                session.commit()
+                logger.info(f"Pruned {pruned} aged bronze payloads")
+
+    if vacuum:
+        # VACUUM cannot run inside a transaction
+        session.commit()
+        with metrics.span("vacuum"):
+            session.connection().exec_driver_sql("VACUUM")
+
+    after = bronze_storage_report(session, archive_root)
+    logger.info(f"Bronze storage after compaction: {_format_report(after)}")
+    return {
+        "before": before,
+        "after": after,
+        "superseded_deleted": deleted,
+        "archived": archived,
+        "pruned": pruned,
+    }
+
+
+def _format_report(report: dict) -> str:
+    return (
+        f"database {report['database_bytes'] / 2**20:.1f} MiB "
+        f"({report['free_bytes'] / 2**20:.1f} MiB free), "
+        f"{report['bronze_rows']} bronze rows "
+        f"({report['bronze_payload_bytes'] / 2**20:.1f} MiB of payloads) "
+        f"scanned in {report['bronze_scan_seconds']:.3f}s, "
+        f"archive {report['archive_bytes'] / 2**20:.1f} MiB"
+    )
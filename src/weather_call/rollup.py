@@ -0,0 +1,197 @@
+from sqlalchemy import Text, and_, or_, select, type_coerce
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from weather_call.model.weather import DailyWeatherSummary, HourlyWeather
+from weather_call.model.city import City
+from weather_call.model.database import rows_per_statement
+from weather_call import metrics
+from datetime import date, datetime, time, timedelta, timezone
+import logging
+import polars as pl
+
+logger = logging.getLogger(__name__)
+
+# weather condition counts of a day, as stored in the json column
+CONDITION_COUNTS_DTYPE = pl.List(
+    pl.Struct({"weather_condition": pl.String, "count": pl.Int64})
+)
+
+# dtypes of the hourly columns read to build the rollup
+HOURLY_SCHEMA = {
+    "city_id": pl.Int64,
+    "hourly_timestamp": pl.Datetime("us"),
+    "temperature": pl.Decimal(38, 2),
+    "wind_speed": pl.Decimal(38, 2),
+    "weather_condition": pl.String,
+}
+
+# dtypes of the daily rollup columns
+DAILY_SCHEMA = {
+    "name": pl.String,
+    "day": pl.Date,
+    "temperature_min": pl.Decimal(38, 2),
+    "temperature_max": pl.Decimal(38, 2),
+    "temperature_sum": pl.Decimal(38, 2),
+    "temperature_count": pl.Int64,
+    "wind_speed_max": pl.Decimal(38, 2),
+}
+
+
+def daily_aggregates(lf_hourly: pl.LazyFrame, by: str) -> pl.LazyFrame:
+    """
+    Aggregates hourly weather rows into one row per city and day, with the
+    same columns as the daily rollup table. Cities are identified by the
+    by column, "city_id" or "name".
+    """
+    return (
+        lf_hourly.with_columns(day=pl.col("hourly_timestamp").dt.date())
+        .group_by(by, "day")
+        .agg(
+            temperature_min=pl.min("temperature"),
+            temperature_max=pl.max("temperature"),
+            temperature_sum=pl.sum("temperature"),
+            temperature_count=pl.len().cast(pl.Int64),
+            wind_speed_max=pl.max("wind_speed"),
+            weather_condition_counts=pl.col("weather_condition")
+            .value_counts(name="count")
+            .cast(CONDITION_COUNTS_DTYPE.inner),
+        )
+    )
+
+
+def combine_daily_aggregates(lf_daily: pl.LazyFrame, by: str) -> pl.LazyFrame:
+    """
+    Merges daily aggregate rows of the same city and day, computed from
+    different sets of hourly rows, into one row with the same columns.
+    """
+    lf_condition_counts = (
+        lf_daily.select(by, "day", "weather_condition_counts")
+        .explode("weather_condition_counts")
+        .unnest("weather_condition_counts")
+        .group_by(by, "day", "weather_condition")
+        .agg(pl.sum("count"))
+        .group_by(by, "day")
+        .agg(weather_condition_counts=pl.struct("weather_condition", "count"))
+    )
+    return (
+        lf_daily.group_by(by, "day")
+        .agg(
+            temperature_min=pl.min("temperature_min"),
+            temperature_max=pl.max("temperature_max"),
+            temperature_sum=pl.sum("temperature_sum"),
+            temperature_count=pl.sum("temperature_count"),
+            wind_speed_max=pl.max("wind_speed_max"),
+        )
+        .join(lf_condition_counts, on=[by, "day"], how="left")
+    )
+
+
+def refresh_daily_summaries(
+    session: Session, keys: pl.DataFrame | None = None, batch_size: int = 1000
+) -> int:
+    """
+    Recomputes the daily rollup rows of the (city_id, day) pairs in keys
+    from the hourly weather table and upserts them, so inserted and
+    corrected hourly rows are both reflected. Without keys the whole rollup
+    is rebuilt. Nothing is committed.
+    Returns the number of rollup rows written.
+    """
+    stmt = select(
+        HourlyWeather.city_id,
+        HourlyWeather.hourly_timestamp,
+        HourlyWeather.temperature,
+        HourlyWeather.wind_speed,
+        HourlyWeather.weather_condition,
+    )
+    if keys is not None:
+        if keys.is_empty():
+            return 0
+        # only the hours of the affected days are read, through the
+        # hourly_timestamp index
+        day_ranges = [
+            and_(
+                HourlyWeather.hourly_timestamp >= datetime.combine(day, time.min),
+                HourlyWeather.hourly_timestamp
+                < datetime.combine(day + timedelta(days=1), time.min),
+            )
+            for day in keys["day"].unique().sort()
+        ]
+        stmt = stmt.where(or_(*day_ranges))
+
+    hourly_df = pl.read_database(
+        query=stmt,
+        connection=session.connection(),
+        schema_overrides=HOURLY_SCHEMA,
+    )
+    lf_summary = daily_aggregates(hourly_df.lazy(), "city_id")
+    if keys is not None:
+        lf_summary = lf_summary.join(
+            keys.lazy().select("city_id", "day").unique(),
+            on=["city_id", "day"],
+            how="semi",
+        )
+    summary_rows = lf_summary.collect().to_dicts()
+
+    if summary_rows:
+        batch_size = rows_per_statement(batch_size, len(summary_rows[0]))
+    for start in range(0, len(summary_rows), batch_size):
+        summary_stmt = sqlite_insert(DailyWeatherSummary).values(
+            summary_rows[start : start + batch_size]
+        )
+        summary_stmt = summary_stmt.on_conflict_do_update(
+            index_elements=["city_id", "day"],
+            set_={
+                "temperature_min": summary_stmt.excluded.temperature_min,
+                "temperature_max": summary_stmt.excluded.temperature_max,
+                "temperature_sum": summary_stmt.excluded.temperature_sum,
+                "temperature_count": summary_stmt.excluded.temperature_count,
+                "wind_speed_max": summary_stmt.excluded.wind_speed_max,
+                "weather_condition_counts": summary_stmt.excluded.weather_condition_counts,
+                "updated_at": datetime.now(timezone.utc),
+            },
+        )
+        session.execute(summary_stmt)
+
+    logger.debug(f"Refreshed {len(summary_rows)} daily weather summaries")
+    return len(summary_rows)
+
+
+def load_daily_window(
+    session: Session,
+    first_day: date,
+    last_day: date,
+    cities: list[str] | None = None,
+) -> pl.DataFrame:
+    """
+    Load the daily rollup rows between two days, both included, with the
+    city name as the "name" column and the decoded weather condition counts.
+    """
+    stmt = (
+        select(
+            City.name,
+            DailyWeatherSummary.day,
+            DailyWeatherSummary.temperature_min,
+            DailyWeatherSummary.temperature_max,
+            DailyWeatherSummary.temperature_sum,
+            DailyWeatherSummary.temperature_count,
+            DailyWeatherSummary.wind_speed_max,
+            type_coerce(DailyWeatherSummary.weather_condition_counts, Text).label(
+                "weather_condition_counts"
+            ),
+        )
+        .join(City, DailyWeatherSummary.city_id == City.id)
+        .where(DailyWeatherSummary.day.between(first_day, last_day))
+    )
+    if cities is not None:
+        stmt = stmt.where(City.name.in_(cities))
+
+    with metrics.span("read_database", table="daily_weather_summary"):
+        daily_df = pl.read_database(
+            query=stmt,
+            connection=session.connection(),
+            schema_overrides={**DAILY_SCHEMA, "weather_condition_counts": pl.String},
+        )
+    metrics.count("report_rows_read", daily_df.height, table="daily_weather_summary")
+    return daily_df.with_columns(
+        pl.col("weather_condition_counts").str.json_decode(CONDITION_COUNTS_DTYPE)
+    )
@@ -0,0 +1,227 @@
+from sqlalchemy.orm import Session, sessionmaker
+from weather_call.api.client import ApiClient
+from weather_call.backfill import backfill_hourly_weather
+from weather_call.city_registry import CityRegistry, city_registry
+from weather_call.etl_service import add_new_hourly_data
+from weather_call.observation_index import ObservationIndex, observation_index
+from weather_call.watermark import read_watermark, write_watermark
+from collections.abc import Callable
+from datetime import datetime, timedelta, timezone
+import logging
+import math
+import signal
+import threading
+
+logger = logging.getLogger(__name__)
+
+# start of the last hour fully ingested by the scheduler, in hours since epoch
+SCHEDULER_WATERMARK = "scheduler_last_hour"
+
+HOUR = timedelta(hours=1)
+
+
+def hour_start(moment: datetime) -> datetime:
+    """Start of the utc hour containing moment"""
+    return moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def hour_number(hour: datetime) -> int:
+    """Hours since epoch of the start of an hour, as stored in the watermark"""
+    return int(hour.timestamp()) // 3600
+
+
+class IngestScheduler:
+    """
+    Long running ingestion loop: at the top of every hour the tracked
+    cities are split in waves spread over spread_minutes, so the api sees a
+    flat load instead of a burst. The engine, the http pool, the city
+    registry and the observation index stay warm between hours.
+    On start, the current hour is ingested right away when it was missed
+    while the process was down, and the older missed hours are backfilled
+    from the historical endpoint, with at most backfill_max_calls requests.
+    A failing wave or hook is logged and leaves its hour unmarked, and the
+    loop goes on with the next hour.
+    stop() (called on SIGTERM and SIGINT by run()) lets the current wave
+    finish and then returns.
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker[Session],
+        client: ApiClient,
+        api_key: str,
+        cities: list[dict],
+        registry: CityRegistry | None = None,
+        spread_minutes: float = 45,
+        max_concurrency: int = 8,
+        batch_size: int = 1000,
+        group_size: int = 20,
+        observations: ObservationIndex | None = None,
+        after_hour: Callable[[Session], None] | None = None,
+        backfill_max_calls: int | None = None,
+    ):
+        self.session_factory = session_factory
+        self.client = client
+        self.api_key = api_key
+        self.cities = cities
+        self.registry = registry if registry is not None else city_registry
+        self.observations = (
+            observations if observations is not None else observation_index
+        )
+        self.spread_minutes = spread_minutes
+        self.max_concurrency = max_concurrency
+        self.batch_size = batch_size
+        self.group_size = group_size
+        self.after_hour = after_hour
+        self.backfill_max_calls = backfill_max_calls
+        self._stop = threading.Event()
+
+    def stop(self, *_):
+        """Asks the loop to stop after the current wave"""
+        if not self._stop.is_set():
+            logger.info("Stopping the scheduler after the current wave")
+        self._stop.set()
+
+    def run(self):
+        """Runs until stopped, ingesting every hour"""
+        previous_handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            for signal_number in (signal.SIGTERM, signal.SIGINT):
+                previous_handlers[signal_number] = signal.signal(
+                    signal_number, self.stop
+                )
+        try:
+            self.catch_up()
+            while not self._stop.is_set():
+                next_hour = hour_start(datetime.now(timezone.utc)) + HOUR
+                if self._wait_until(next_hour):
+                    break
+                self.run_hour(next_hour)
+        finally:
+            for signal_number, handler in previous_handlers.items():
+                signal.signal(signal_number, handler)
+        logger.info("Scheduler stopped")
+
+    def catch_up(self):
+        """
+        Ingests the current hour right away when it was not ingested yet,
+        and backfills the hours missed before it from the historical
+        endpoint.
+        """
+        current_hour = hour_start(datetime.now(timezone.utc))
+        with self.session_factory() as session:
+            last_hour = read_watermark(session, SCHEDULER_WATERMARK, default=-1)
+        if last_hour >= hour_number(current_hour):
+            return
+
+        logger.info(f"Catching up the hour starting at {current_hour}")
+        self.run_hour(current_hour, spread=False)
+
+        # the first start has no missed hours, only the current one
+        if last_hour >= 0 and last_hour + 1 < hour_number(current_hour):
+            first_missed = datetime.fromtimestamp((last_hour + 1) * 3600, timezone.utc)
+            self.backfill(first_missed, current_hour)
+
+    def backfill(self, start: datetime, end: datetime):
+        """Fills the hours from start to end (excluded) from the historical endpoint"""
+        missed = int((end - start) / HOUR)
+        logger.info(f"Backfilling {missed} hours missed while the scheduler was down")
+        try:
+            with self.session_factory() as session:
+                result = backfill_hourly_weather(
+                    session,
+                    self.api_key,
+                    start,
+                    end,
+                    cities=self.cities,
+                    client=self.client,
+                    max_concurrency=self.max_concurrency,
+                    max_calls=self.backfill_max_calls,
+                    batch_size=self.batch_size,
+                    registry=self.registry,
+                )
+        except Exception:
+            logger.exception(f"Backfill of the hours from {start} to {end} failed")
+            return
+        if not result.complete:
+            logger.warning(
+                f"Backfill from {start} to {end} is incomplete, weather-call backfill resumes it"
+            )
+
+    def run_hour(self, hour: datetime, spread: bool = True):
+        """
+        Ingests every city for an hour, in waves spread over the hour unless
+        spread is False. The hour is marked done only when every wave and
+        the after_hour hook ran without an error; a failing wave is logged
+        and the next waves still run.
+        """
+        waves = self._waves(spread)
+        wave_interval = timedelta(minutes=self.spread_minutes) / len(waves)
+        logger.info(
+            f"Ingesting {len(self.cities)} cities for {hour} in {len(waves)} waves"
+        )
+
+        failed = []
+        failed_waves = 0
+        for index, wave in enumerate(waves):
+            if index and self._wait_until(hour + index * wave_interval):
+                logger.info(f"Stopped before wave {index + 1} of {len(waves)}")
+                return
+            try:
+                with self.session_factory() as session:
+                    failed += add_new_hourly_data(
+                        session,
+                        self.api_key,
+                        cities=wave,
+                        client=self.client,
+                        max_concurrency=self.max_concurrency,
+                        batch_size=self.batch_size,
+                        registry=self.registry,
+                        group_size=self.group_size,
+                        observations=self.observations,
+                    )
+            except Exception:
+                logger.exception(f"Wave {index + 1} of {len(waves)} for {hour} failed")
+                failed_waves += 1
+
+        if failed:
+            logger.error(f"{len(failed)} cities could not be fetched for {hour}")
+        if failed_waves:
+            logger.error(f"{hour} is not marked done, {failed_waves} waves failed")
+            return
+
+        try:
+            with self.session_factory() as session:
+                if self.after_hour is not None:
+                    self.after_hour(session)
+                write_watermark(session, SCHEDULER_WATERMARK, hour_number(hour))
+                session.commit()
+        except Exception:
+            logger.exception(f"Finishing the hour {hour} failed, it is not marked done")
+
+    def _waves(self, spread: bool) -> list[list[dict]]:
+        """
+        Splits the cities in waves: one per minute of the spread at most,
+        and never smaller than a group request.
+        """
+        if not spread or not self.cities:
+            return [self.cities]
+        wave_count = max(
+            1,
+            min(
+                math.ceil(self.spread_minutes),
+                math.ceil(len(self.cities) / self.group_size),
+            ),
+        )
+        wave_size = math.ceil(len(self.cities) / wave_count)
+        return [
+            self.cities[start : start + wave_size]
+            for start in range(0, len(self.cities), wave_size)
+        ]
+
+    def _wait_until(self, moment: datetime) -> bool:
+        """Sleeps until moment, returns True when stopped in the meantime"""
+        timeout = (moment - datetime.now(timezone.utc)).total_seconds()
+        if timeout > 0:
+            return self._stop.wait(timeout)
+        return self._stop.is_set()
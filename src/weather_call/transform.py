@@ -0,0 +1,241 @@
+from sqlalchemy import Text, select, type_coerce
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from weather_call.model.weather import HourlyWeatherBronze, HourlyWeather
+from weather_call.model.database import rows_per_statement
+from weather_call.watermark import (
+    increment_watermark,
+    read_watermark,
+    write_watermark,
+)
+from weather_call.report_cache import DATA_VERSION
+from weather_call import metrics
+from weather_call.rollup import refresh_daily_summaries
+from datetime import datetime, timezone, timedelta
+import logging
+import polars as pl
+import time
+
+logger = logging.getLogger(__name__)
+
+# high-water mark of the bronze ids already transformed into silver
+BRONZE_WATERMARK = "hourly_weather_bronze_id"
+
+# bronze columns read by the transform, with the payload as json text
+BRONZE_SCHEMA = {
+    "id": pl.Int64,
+    "city_id": pl.Int64,
+    "hourly_timestamp": pl.Datetime("us"),
+    "payload": pl.String,
+}
+
+# payload fields used by silver, decoded as text so a wrongly typed value
+# becomes null for its row instead of failing the whole batch; temp and
+# wind_speed are the flat fields of the historical (timemachine) payloads
+PAYLOAD_DTYPE = pl.Struct(
+    {
+        "main": pl.Struct({"temp": pl.String}),
+        "wind": pl.Struct({"speed": pl.String}),
+        "temp": pl.String,
+        "wind_speed": pl.String,
+        "weather": pl.List(pl.Struct({"main": pl.String})),
+    }
+)
+
+
+def _payload_fields(payloads: pl.Expr, decoded: bool) -> list[pl.Expr]:
+    """Expressions extracting the silver fields from the json payload"""
+    if decoded:
+        parsed = payloads.str.json_decode(PAYLOAD_DTYPE)
+        temperature = pl.coalesce(
+            parsed.struct.field("main").struct.field("temp"),
+            parsed.struct.field("temp"),
+        )
+        wind_speed = pl.coalesce(
+            parsed.struct.field("wind").struct.field("speed"),
+            parsed.struct.field("wind_speed"),
+        )
+        weather_condition = (
+            parsed.struct.field("weather").list.first().struct.field("main")
+        )
+    else:
+        temperature = pl.coalesce(
+            payloads.str.json_path_match("$.main.temp"),
+            payloads.str.json_path_match("$.temp"),
+        )
+        wind_speed = pl.coalesce(
+            payloads.str.json_path_match("$.wind.speed"),
+            payloads.str.json_path_match("$.wind_speed"),
+        )
+        weather_condition = payloads.str.json_path_match("$.weather[0].main")
+    return [
+        temperature.cast(pl.Float64, strict=False).alias("temperature"),
+        wind_speed.cast(pl.Float64, strict=False).alias("wind_speed"),
+        weather_condition.alias("weather_condition"),
+    ]
+
+
+def parse_weather_payloads(
+    bronze_df: pl.DataFrame,
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Builds hourly weather rows from a frame of bronze rows in one columnar
+    pass. The frame has the id, city_id, hourly_timestamp and payload
+    columns, with the payload as json text (the way it is stored in the
+    bronze table).
+    Returns the valid hourly weather rows and the invalid bronze rows with
+    the reason they were rejected.
+    """
+    columns = [pl.col("id"), pl.col("city_id"), pl.col("hourly_timestamp")]
+    try:
+        fields_df = bronze_df.select(
+            *columns, *_payload_fields(pl.col("payload"), decoded=True)
+        )
+    except pl.exceptions.ComputeError:
+        # malformed json in the batch: path matching gives null for those rows
+        fields_df = bronze_df.select(
+            *columns, *_payload_fields(pl.col("payload"), decoded=False)
+        )
+
+    fields_df = fields_df.with_columns(
+        error=pl.when(pl.col("hourly_timestamp").is_null())
+        .then(pl.lit("missing hourly_timestamp"))
+        .when(pl.col("temperature").is_null())
+        .then(pl.lit("missing or invalid main.temp"))
+        .when(pl.col("wind_speed").is_null())
+        .then(pl.lit("missing or invalid wind.speed"))
+        .when(pl.col("wind_speed") < 0)
+        .then(pl.lit("negative wind.speed"))
+        .when(pl.col("weather_condition").fill_null("") == "")
+        .then(pl.lit("missing weather[0].main"))
+    )
+    valid_df = fields_df.filter(pl.col("error").is_null()).select(
+        "city_id", "hourly_timestamp", "temperature", "wind_speed", "weather_condition"
+    )
+    invalid_df = fields_df.filter(pl.col("error").is_not_null()).select("id", "error")
+    return valid_df, invalid_df
+
+
+def upsert_hourly_weather(
+    session: Session, hourly_rows: list[dict], batch_size: int = 1000
+):
+    """
+    Writes the hourly weather rows with multi-row upserts of at most
+    batch_size rows, fewer when the rows would exceed the bind parameter
+    limit of sqlite. Later rows win over earlier rows for the same city and
+    hour. Nothing is committed.
+    """
+    # a single upsert statement must not touch the same row twice
+    unique_rows = list(
+        {(row["city_id"], row["hourly_timestamp"]): row for row in hourly_rows}.values()
+    )
+    metrics.count("silver_rows", len(unique_rows))
+    if unique_rows:
+        batch_size = rows_per_statement(batch_size, len(unique_rows[0]))
+    for start in range(0, len(unique_rows), batch_size):
+        hourly_weather_stmt = sqlite_insert(HourlyWeather).values(
+            unique_rows[start : start + batch_size]
+        )
+        hourly_weather_stmt = hourly_weather_stmt.on_conflict_do_update(
+            index_elements=["city_id", "hourly_timestamp"],
+            set_={
+                "temperature": hourly_weather_stmt.excluded.temperature,
+                "wind_speed": hourly_weather_stmt.excluded.wind_speed,
+                "weather_condition": hourly_weather_stmt.excluded.weather_condition,
+                "updated_at": datetime.now(timezone.utc),
+            },
+        )
+        session.execute(hourly_weather_stmt)
+
+
+def transform_bronze_to_silver(
+    session: Session,
+    chunk_size: int = 5000,
+    batch_size: int = 1000,
+    full_replay: bool = False,
+    max_age: timedelta | None = timedelta(days=3),
+) -> int:
+    """
+    Upserts into the hourly weather table the bronze rows that were not
+    transformed yet, reading them in chunks of chunk_size ordered by id.
+    Every chunk is parsed at once with polars and invalid rows are logged
+    and skipped. The daily rollup of the affected city days is refreshed in
+    the same transaction.
+    The high-water mark is stored with every chunk, so an interrupted run
+    continues where it stopped.
+    With full_replay the whole silver table is rebuilt from bronze, without
+    age cutoff and without any api call.
+    Observations older than max_age are skipped in incremental runs.
+    Returns the number of bronze rows read.
+    """
+    last_id = 0 if full_replay else read_watermark(session, BRONZE_WATERMARK)
+    cutoff_time = None
+    if max_age is not None and not full_replay:
+        cutoff_time = (datetime.now(timezone.utc) - max_age).replace(tzinfo=None)
+
+    start_time = time.perf_counter()
+    processed = 0
+    while True:
+        stmt = (
+            select(
+                HourlyWeatherBronze.id,
+                HourlyWeatherBronze.city_id,
+                HourlyWeatherBronze.hourly_timestamp,
+                # raw json text, decoded by polars instead of row by row
+                type_coerce(HourlyWeatherBronze.payload, Text).label("payload"),
+            )
+            .where(HourlyWeatherBronze.id > last_id)
+            .order_by(HourlyWeatherBronze.id)
+            .limit(chunk_size)
+        )
+        with metrics.span("read_database", table="hourly_weather_bronze"):
+            bronze_df = pl.read_database(
+                query=stmt,
+                connection=session.connection(),
+                schema_overrides=BRONZE_SCHEMA,
+            )
+        if bronze_df.is_empty():
+            break
+        chunk_last_id = bronze_df["id"].max()
+        chunk_rows = bronze_df.height
+
+        if cutoff_time is not None:
+            old_rows = bronze_df.filter(pl.col("hourly_timestamp") < cutoff_time)
+            if not old_rows.is_empty():
+                logger.info(f"Skipping {old_rows.height} bronze rows with old data")
+            bronze_df = bronze_df.filter(pl.col("hourly_timestamp") >= cutoff_time)
+
+        with metrics.span("payload_parse"):
+            hourly_df, invalid_df = parse_weather_payloads(bronze_df)
+        metrics.count("invalid_bronze_rows", invalid_df.height)
+        for bronze_id, error in invalid_df.iter_rows():
+            logger.warning(f"Skipping invalid bronze row {bronze_id}: {error}")
+
+        with metrics.span("silver_upsert"):
+            upsert_hourly_weather(session, hourly_df.to_dicts(), batch_size)
+        # recompute the daily rollup of every city and day touched by the chunk
+        with metrics.span("rollup_refresh"):
+            refresh_daily_summaries(
+                session,
+                hourly_df.select(
+                    "city_id", day=pl.col("hourly_timestamp").dt.date()
+                ).unique(),
+                batch_size,
+            )
+        if not hourly_df.is_empty():
+            # invalidates the cached reports
+            increment_watermark(session, DATA_VERSION)
+        last_id = chunk_last_id
+        write_watermark(session, BRONZE_WATERMARK, last_id)
+        with metrics.span("commit"):
+            session.commit()
+
+        processed += chunk_rows
+        logger.debug(f"Transformed bronze rows up to id {last_id}")
+
+    elapsed = time.perf_counter() - start_time
+    if processed:
+        logger.info(
+            f"Transformed {processed} bronze rows into silver in {elapsed:.2f}s ({processed / elapsed:,.0f} rows/s)"
+        )
+    return processed
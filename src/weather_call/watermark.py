@@ -0,0 +1,34 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from weather_call.model.etl_state import EtlState
+from datetime import datetime, timezone
+
+
+def read_watermark(session: Session, name: str, default: int = 0) -> int:
+    """Returns the stored value of an etl watermark"""
+    value = session.execute(
+        select(EtlState.value).where(EtlState.name == name)
+    ).scalar_one_or_none()
+    return default if value is None else value
+
+
+def write_watermark(session: Session, name: str, value: int):
+    """Stores the value of an etl watermark, without committing"""
+    stmt = sqlite_insert(EtlState).values(name=name, value=value)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"value": stmt.excluded.value, "updated_at": datetime.now(timezone.utc)},
+    )
+    session.execute(stmt)
+
+
+def increment_watermark(session: Session, name: str) -> int:
+    """Adds one to an etl counter, without committing, and returns its new value"""
+    stmt = sqlite_insert(EtlState).values(name=name, value=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"value": EtlState.value + 1, "updated_at": datetime.now(timezone.utc)},
+    )
+    session.execute(stmt)
+    return read_watermark(session, name)
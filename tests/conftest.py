@@ -0,0 +1,196 @@
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, sessionmaker
+from weather_call.model.database import Base, build_engine
+from weather_call.model.city import City
+from weather_call.model.country import Country
+from weather_call.model.weather import HourlyWeather
+from weather_call.config import SqliteProfile
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import json
+import random
+import threading
+import time
+import pytest
+
+WEATHER_CONDITIONS = ["Clear", "Clouds", "Rain", "Snow"]
+
+# first hour of the seeded history, naive utc like the stored rows
+HISTORY_START = datetime(2025, 3, 1)
+HISTORY_HOURS = 72
+
+
+def tracked_cities(count: int) -> list[dict]:
+    """City list entries of count cities, spread over two countries"""
+    return [
+        {
+            "city_name": f"City {index}",
+            "country_name": f"Country {index % 2}",
+            "iso_3166": f"C{index % 2}",
+        }
+        for index in range(count)
+    ]
+
+
+def seed_cities(session: Session, cities: list[dict]):
+    """Stores the countries and cities of a city list, with made up coordinates"""
+    countries = {city["country_name"]: city["iso_3166"] for city in cities}
+    session.execute(
+        insert(Country),
+        [{"name": name, "iso_3166": iso} for name, iso in countries.items()],
+    )
+    country_ids = {name: index + 1 for index, name in enumerate(countries)}
+    session.execute(
+        insert(City),
+        [
+            {
+                "name": city["city_name"],
+                "country_id": country_ids[city["country_name"]],
+                "latitude": 45 + index / 10,
+                "longitude": 9 + index / 10,
+            }
+            for index, city in enumerate(cities)
+        ],
+    )
+    session.commit()
+
+
+def seed_hourly_weather(session: Session, city_count: int, seed: int = 0):
+    """Stores HISTORY_HOURS of random hourly weather for every city"""
+    rng = random.Random(seed)
+    session.execute(
+        insert(HourlyWeather),
+        [
+            {
+                "city_id": city_id,
+                "hourly_timestamp": HISTORY_START + timedelta(hours=hour),
+                "temperature": round(rng.uniform(-10, 35), 2),
+                "wind_speed": round(rng.uniform(0, 20), 2),
+                "weather_condition": rng.choice(WEATHER_CONDITIONS),
+            }
+            for hour in range(HISTORY_HOURS)
+            for city_id in range(1, city_count + 1)
+        ],
+    )
+    session.commit()
+
+
+class StubRequest:
+    """A request received by the stub api"""
+
+    def __init__(self, path: str, query: dict[str, str]):
+        self.path = path
+        self.query = query
+        self.received_at = time.monotonic()
+
+
+class StubApi:
+    """
+    Weather api served on a localhost port. Every request waits delay
+    seconds and is answered by respond, which returns the status, the
+    headers and the json body; by default a current weather payload for the
+    requested coordinates. Received requests are kept in order.
+    """
+
+    def __init__(self):
+        self.delay = 0.0
+        self.respond = self.weather_response
+        self.requests: list[StubRequest] = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                request = StubRequest(
+                    url.path,
+                    {key: values[0] for key, values in parse_qs(url.query).items()},
+                )
+                with stub._lock:
+                    stub.requests.append(request)
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                try:
+                    time.sleep(stub.delay)
+                    status, headers, body = stub.respond(request)
+                finally:
+                    with stub._lock:
+                        stub.active -= 1
+                content = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @staticmethod
+    def weather_response(request: StubRequest) -> tuple[int, dict, dict]:
+        """Current weather of the requested coordinates, observed now"""
+        latitude = float(request.query["lat"])
+        return (
+            200,
+            {},
+            {
+                "id": round(latitude * 100),
+                "dt": int(time.time()),
+                "main": {"temp": 21.5},
+                "wind": {"speed": 3.2},
+                "weather": [{"main": "Clear"}],
+            },
+        )
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_api() -> StubApi:
+    stub = StubApi()
+    stub.start()
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def session_factory(tmp_path) -> sessionmaker[Session]:
+    """Sessions on a new database file with every table created"""
+    engine = build_engine(f"sqlite:///{tmp_path / 'weather.db'}", SqliteProfile())
+    Base.metadata.create_all(engine)
+    yield sessionmaker(engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def session(session_factory) -> Session:
+    with session_factory() as session:
+        yield session
+
+
+@pytest.fixture
+def cities() -> list[dict]:
+    return tracked_cities(6)
+
+
+@pytest.fixture
+def weather_session(session, cities) -> Session:
+    """Session on a database holding the hourly weather history of the cities"""
+    seed_cities(session, cities)
+    seed_hourly_weather(session, len(cities))
+    return session
@@ -0,0 +1,206 @@
+from sqlalchemy import func, select
+from weather_call.api.client import (
+    ApiClient,
+    ApiError,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+from weather_call.city_registry import CityRegistry
+from weather_call.etl_service import add_new_hourly_data
+from weather_call.model.dead_letter import DeadLetterCity
+from weather_call.model.weather import HourlyWeather
+from weather_call.observation_index import ObservationIndex
+from conftest import seed_cities
+import time
+import pytest
+
+PATH = "/data/2.5/weather"
+PARAMS = {"lat": 45.0, "lon": 9.0}
+
+
+def responses(*statuses: int, retry_after: str | None = None):
+    """Answers the requests with the statuses in order, then with 200"""
+    remaining = list(statuses)
+    headers = {} if retry_after is None else {"Retry-After": retry_after}
+
+    def respond(request):
+        if remaining:
+            return remaining.pop(0), headers, {"message": "try later"}
+        return 200, {}, {"ok": True}
+
+    return respond
+
+
+def failing(status: int = 503):
+    """Answers every request with status"""
+    return lambda request: (status, {}, {"message": "unavailable"})
+
+
+def build_client(stub_api, **kwargs) -> ApiClient:
+    """Client of the stub api with backoffs short enough for the tests"""
+    return ApiClient(
+        base_url=stub_api.base_url,
+        **{"backoff_base": 0.001, "backoff_max": 0.01, **kwargs},
+    )
+
+
+def test_retries_until_success(stub_api):
+    stub_api.respond = responses(503, 503)
+
+    with build_client(stub_api, max_retries=3) as client:
+        response = client.get(PATH, PARAMS)
+
+    assert response.status_code == 200
+    assert len(stub_api.requests) == 3
+
+
+def test_gives_up_after_max_retries(stub_api):
+    stub_api.respond = failing(503)
+
+    with build_client(stub_api, max_retries=2) as client:
+        with pytest.raises(ApiError) as error:
+            client.get(PATH, PARAMS)
+
+    assert error.value.status_code == 503
+    assert len(stub_api.requests) == 3
+
+
+def test_honours_retry_after(stub_api):
+    stub_api.respond = responses(429, retry_after="1")
+
+    with build_client(stub_api, backoff_max=5.0) as client:
+        client.get(PATH, PARAMS)
+
+    first, second = stub_api.requests
+    assert second.received_at - first.received_at >= 1.0
+
+
+def test_retry_after_is_capped_by_backoff_max(stub_api):
+    stub_api.respond = responses(503, retry_after="3600")
+
+    start = time.monotonic()
+    with build_client(stub_api, backoff_max=0.2) as client:
+        client.get(PATH, PARAMS)
+
+    assert len(stub_api.requests) == 2
+    assert time.monotonic() - start < 2.0
+
+
+def test_breaker_opens_and_lets_a_trial_through_when_half_open(stub_api):
+    stub_api.respond = failing(503)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.3)
+
+    with build_client(stub_api, max_retries=0, circuit_breaker=breaker) as client:
+        for _ in range(2):
+            with pytest.raises(ApiError):
+                client.get(PATH, PARAMS)
+        assert breaker.is_open
+
+        # open: the api is not called
+        with pytest.raises(CircuitOpenError):
+            client.get(PATH, PARAMS)
+        assert len(stub_api.requests) == 2
+
+        # half open: one trial, a failure keeps the circuit open
+        time.sleep(0.35)
+        with pytest.raises(ApiError):
+            client.get(PATH, PARAMS)
+        assert len(stub_api.requests) == 3
+        with pytest.raises(CircuitOpenError):
+            client.get(PATH, PARAMS)
+
+        # half open again: a successful trial closes the circuit
+        stub_api.respond = responses()
+        time.sleep(0.35)
+        assert client.get(PATH, PARAMS).status_code == 200
+        assert not breaker.is_open
+
+
+def test_rate_limited_responses_do_not_open_the_breaker(stub_api):
+    stub_api.respond = failing(429)
+    breaker = CircuitBreaker(failure_threshold=2)
+
+    with build_client(stub_api, max_retries=3, circuit_breaker=breaker) as client:
+        with pytest.raises(ApiError):
+            client.get(PATH, PARAMS)
+
+    assert len(stub_api.requests) == 4
+    assert not breaker.is_open
+
+
+def ingest(session, stub_api, cities, client: ApiClient, **kwargs):
+    return add_new_hourly_data(
+        session,
+        "key",
+        cities=cities,
+        client=client,
+        registry=CityRegistry(),
+        group_size=1,
+        observations=ObservationIndex(refresh_seconds=0),
+        **kwargs,
+    )
+
+
+def dead_letters(session) -> dict[int, int]:
+    rows = session.execute(select(DeadLetterCity.city_id, DeadLetterCity.failed_runs))
+    return {city_id: failed_runs for city_id, failed_runs in rows}
+
+
+def test_failed_cities_are_dead_lettered_and_retried_first(session, stub_api, cities):
+    seed_cities(session, cities)
+    failing_latitudes = {45.1, 45.3}
+
+    def respond(request):
+        if float(request.query["lat"]) in failing_latitudes:
+            return 503, {}, {"message": "unavailable"}
+        return stub_api.weather_response(request)
+
+    stub_api.respond = respond
+
+    breaker = CircuitBreaker(failure_threshold=100)
+    with build_client(stub_api, max_retries=1, circuit_breaker=breaker) as client:
+        failed = ingest(session, stub_api, cities, client, max_concurrency=2)
+
+    # every failing city was retried once one by one, after its batch failed
+    assert sorted(location.id for location in failed) == [2, 4]
+    assert len(stub_api.requests) == 4 + 2 * 2 * 2
+    assert dead_letters(session) == {2: 1, 4: 1}
+
+    # the next run fetches them first and keeps counting the failed runs
+    stub_api.requests.clear()
+    with build_client(stub_api, max_retries=0) as client:
+        ingest(session, stub_api, cities, client, max_concurrency=1)
+    first_requests = stub_api.requests[:2]
+    assert {float(request.query["lat"]) for request in first_requests} == (
+        failing_latitudes
+    )
+    assert dead_letters(session) == {2: 2, 4: 2}
+
+    # once they succeed they leave the dead letter table
+    failing_latitudes.clear()
+    with build_client(stub_api, max_retries=0) as client:
+        assert ingest(session, stub_api, cities, client, max_concurrency=1) == []
+    assert dead_letters(session) == {}
+
+
+def test_open_breaker_leaves_dead_letters_to_the_next_run(session, stub_api, cities):
+    seed_cities(session, cities)
+    stub_api.respond = failing(503)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    with build_client(stub_api, max_retries=0, circuit_breaker=breaker) as client:
+        failed = ingest(session, stub_api, cities, client, max_concurrency=1)
+
+    # the breaker opened after two failures: no other city and no immediate
+    # retry reached the api
+    assert breaker.is_open
+    assert len(stub_api.requests) == 2
+    assert len(failed) == len(cities)
+    assert dead_letters(session) == {city_id: 1 for city_id in range(1, 7)}
+    assert session.scalar(select(func.count()).select_from(HourlyWeather)) == 0
+
+    stub_api.respond = stub_api.weather_response
+    with build_client(stub_api, max_retries=0) as client:
+        assert ingest(session, stub_api, cities, client, max_concurrency=1) == []
+    assert dead_letters(session) == {}
+    assert session.scalar(select(func.count()).select_from(HourlyWeather)) == 6
@@ -0,0 +1,152 @@
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from weather_call.api.async_client import AsyncApiClient
+from weather_call.api.client import ApiError, CircuitBreaker
+from weather_call.city_registry import CityRegistry
+from weather_call.config import SqliteProfile
+from weather_call.etl_service import add_new_hourly_data_async
+from weather_call.model.database import build_async_engine
+from weather_call.model.dead_letter import DeadLetterCity
+from weather_call.model.weather import HourlyWeather, HourlyWeatherBronze
+from weather_call.observation_index import ObservationIndex
+from conftest import seed_cities, tracked_cities
+import asyncio
+import math
+import time
+import pytest
+
+PATH = "/data/2.5/weather"
+PARAMS = {"lat": 45.0, "lon": 9.0}
+
+# seconds every stub api request takes
+LATENCY = 0.3
+
+
+def build_client(stub_api, **kwargs) -> AsyncApiClient:
+    """Async client of the stub api with backoffs short enough for the tests"""
+    return AsyncApiClient(
+        base_url=stub_api.base_url,
+        **{"backoff_base": 0.001, "backoff_max": 0.01, **kwargs},
+    )
+
+
+def ingest(session_factory, client: AsyncApiClient, cities, **kwargs):
+    """Runs add_new_hourly_data_async on the database of the session factory"""
+    database_url = session_factory.kw["bind"].url.set(drivername="sqlite+aiosqlite")
+
+    async def run():
+        engine = build_async_engine(database_url, SqliteProfile())
+        try:
+            async with async_sessionmaker(engine)() as session, client:
+                return await add_new_hourly_data_async(
+                    session,
+                    "key",
+                    cities=cities,
+                    client=client,
+                    registry=CityRegistry(),
+                    group_size=1,
+                    observations=ObservationIndex(refresh_seconds=0),
+                    **kwargs,
+                )
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+def count_rows(session, model) -> int:
+    return session.scalar(select(func.count()).select_from(model))
+
+
+def test_async_client_retries_until_success(stub_api):
+    remaining = [503, 429]
+
+    def respond(request):
+        if remaining:
+            return remaining.pop(0), {}, {"message": "try later"}
+        return 200, {}, {"ok": True}
+
+    stub_api.respond = respond
+
+    async def get():
+        async with build_client(stub_api, max_retries=3) as client:
+            return await client.get(PATH, PARAMS)
+
+    assert asyncio.run(get()).status_code == 200
+    assert len(stub_api.requests) == 3
+
+
+def test_async_client_gives_up_and_opens_the_breaker(stub_api):
+    stub_api.respond = lambda request: (503, {}, {"message": "unavailable"})
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+
+    async def get():
+        async with build_client(
+            stub_api, max_retries=2, circuit_breaker=breaker
+        ) as client:
+            await client.get(PATH, PARAMS)
+
+    with pytest.raises(ApiError) as error:
+        asyncio.run(get())
+    assert error.value.status_code == 503
+    assert len(stub_api.requests) == 3
+    assert breaker.is_open
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 4, 8])
+def test_async_wall_time_is_bounded_by_the_concurrency(
+    session_factory, session, stub_api, max_concurrency
+):
+    cities = tracked_cities(8)
+    seed_cities(session, cities)
+    stub_api.delay = LATENCY
+
+    start = time.monotonic()
+    failed = ingest(
+        session_factory,
+        build_client(stub_api, pool_size=max_concurrency),
+        cities,
+        max_concurrency=max_concurrency,
+    )
+    elapsed = time.monotonic() - start
+
+    rounds = math.ceil(len(cities) / max_concurrency)
+    assert failed == []
+    assert stub_api.max_active == max_concurrency
+    assert rounds * LATENCY <= elapsed < (rounds + 1) * LATENCY + 1.0
+    assert count_rows(session, HourlyWeatherBronze) == len(cities)
+    assert count_rows(session, HourlyWeather) == len(cities)
+
+
+def test_async_failed_cities_are_dead_lettered(
+    session_factory, session, stub_api, cities
+):
+    seed_cities(session, cities)
+    failing_latitudes = {45.1, 45.3}
+
+    def respond(request):
+        if float(request.query["lat"]) in failing_latitudes:
+            return 503, {}, {"message": "unavailable"}
+        return stub_api.weather_response(request)
+
+    stub_api.respond = respond
+
+    client = build_client(
+        stub_api, max_retries=1, circuit_breaker=CircuitBreaker(failure_threshold=100)
+    )
+    failed = ingest(session_factory, client, cities, max_concurrency=2)
+
+    # every failing city was retried once one by one, after its batch failed
+    assert sorted(location.id for location in failed) == [2, 4]
+    assert len(stub_api.requests) == 4 + 2 * 2 * 2
+    dead_letters = session.execute(
+        select(DeadLetterCity.city_id, DeadLetterCity.failed_runs)
+    ).all()
+    assert sorted(dead_letters) == [(2, 1), (4, 1)]
+    assert count_rows(session, HourlyWeather) == len(cities) - 2
+
+    # the next run fetches them and drops them from the dead letter table
+    failing_latitudes.clear()
+    assert ingest(session_factory, build_client(stub_api), cities) == []
+    session.expire_all()
+    assert count_rows(session, DeadLetterCity) == 0
@@ -0,0 +1,130 @@
+from sqlalchemy import func, select
+from weather_call import backfill
+from weather_call.api.client import ApiClient
+from weather_call.backfill import backfill_hourly_weather, pending_backfill_start
+from weather_call.model.etl_state import EtlState
+from weather_call.model.weather import HourlyWeather
+from conftest import seed_cities
+from datetime import datetime, timedelta, timezone
+import pytest
+
+TIMEMACHINE_PATH = "/data/3.0/onecall/timemachine"
+
+# the hour the backfills run in, naive utc
+NOW = datetime(2025, 3, 4, 12, 30)
+
+
+def timemachine_response(request):
+    """Historical weather of the requested coordinates and time"""
+    return (
+        200,
+        {},
+        {
+            "lat": float(request.query["lat"]),
+            "lon": float(request.query["lon"]),
+            "data": [
+                {
+                    "dt": int(request.query["dt"]),
+                    "temp": 12.5,
+                    "wind_speed": 4.0,
+                    "weather": [{"main": "Rain"}],
+                }
+            ],
+        },
+    )
+
+
+def run_at(monkeypatch, now: datetime):
+    """Makes the backfill module see now as the current time"""
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now.replace(tzinfo=timezone.utc).astimezone(tz)
+
+    monkeypatch.setattr(backfill, "datetime", FrozenDatetime)
+
+
+@pytest.fixture
+def backfill_session(session, cities, stub_api):
+    seed_cities(session, cities)
+    stub_api.respond = timemachine_response
+    return session
+
+
+def run_backfill(session, stub_api, start, end=None, **kwargs):
+    with ApiClient(base_url=stub_api.base_url) as client:
+        return backfill_hourly_weather(
+            session, "key", start, end, client=client, chunk_size=1, **kwargs
+        )
+
+
+def requested_hours(stub_api) -> list[datetime]:
+    return sorted(
+        {
+            datetime.fromtimestamp(int(request.query["dt"]), timezone.utc).replace(
+                tzinfo=None
+            )
+            for request in stub_api.requests
+        }
+    )
+
+
+def checkpoint_count(session) -> int:
+    return session.scalar(
+        select(func.count())
+        .select_from(EtlState)
+        .where(EtlState.name.like(f"{backfill.BACKFILL_CHECKPOINT}:%"))
+    )
+
+
+def test_interrupted_backfill_resumes_in_a_later_hour(
+    backfill_session, stub_api, cities, monkeypatch
+):
+    start = NOW - timedelta(hours=6)
+    first_hour = start.replace(minute=0)
+
+    # capped after two of the six hours
+    run_at(monkeypatch, NOW)
+    result = run_backfill(backfill_session, stub_api, start, max_calls=2 * len(cities))
+    assert not result.complete
+    assert requested_hours(stub_api) == [first_hour, first_hour + timedelta(hours=1)]
+    assert pending_backfill_start(backfill_session) == first_hour
+
+    # an hour later the same backfill goes on after the fetched hours, up to
+    # the new current hour
+    stub_api.requests.clear()
+    run_at(monkeypatch, NOW + timedelta(hours=1))
+    result = run_backfill(backfill_session, stub_api, start)
+    assert result.complete
+    assert requested_hours(stub_api) == [
+        first_hour + timedelta(hours=offset) for offset in range(2, 7)
+    ]
+    assert pending_backfill_start(backfill_session) is None
+    assert backfill_session.scalar(
+        select(func.count()).select_from(HourlyWeather)
+    ) == 7 * len(cities)
+    # both runs shared one checkpoint
+    assert checkpoint_count(backfill_session) == 1
+
+
+def test_completed_backfill_is_not_fetched_again(
+    backfill_session, stub_api, cities, monkeypatch
+):
+    start = NOW - timedelta(hours=3)
+    end = NOW - timedelta(hours=1)
+
+    run_at(monkeypatch, NOW)
+    assert run_backfill(backfill_session, stub_api, start, end).complete
+    # the hour end falls in is included
+    assert len(stub_api.requests) == 3 * len(cities)
+
+    stub_api.requests.clear()
+    run_at(monkeypatch, NOW + timedelta(hours=2))
+    result = run_backfill(backfill_session, stub_api, start, end)
+    assert result.complete
+    assert result.missing == 0
+    assert stub_api.requests == []
+    assert checkpoint_count(backfill_session) == 1
+    # a range with an end does not touch the pending start of the cli
+    assert pending_backfill_start(backfill_session) is None
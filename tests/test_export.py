@@ -0,0 +1,52 @@
+from sqlalchemy import update
+from weather_call.export import export_silver_to_parquet, scan_hourly_parquet
+from weather_call.model.weather import HourlyWeather
+from conftest import HISTORY_HOURS, HISTORY_START
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+
+def partition_files(root) -> dict[str, list[str]]:
+    files = {}
+    for path in root.glob("date=*/city_id=*/*"):
+        files.setdefault(str(path.parent.relative_to(root)), []).append(path.name)
+    return files
+
+
+def test_exports_rewrite_the_touched_partitions(weather_session, cities, tmp_path):
+    root = tmp_path / "parquet"
+    history_end = HISTORY_START + timedelta(hours=HISTORY_HOURS)
+
+    assert export_silver_to_parquet(weather_session, root) == (
+        HISTORY_HOURS * len(cities)
+    )
+    first_files = partition_files(root)
+    # one file per day and city
+    assert len(first_files) == HISTORY_HOURS // 24 * len(cities)
+    assert all(len(names) == 1 for names in first_files.values())
+
+    # correct an hour of the first city, exported by the next run
+    corrected_hour = HISTORY_START + timedelta(hours=30)
+    weather_session.execute(
+        update(HourlyWeather)
+        .where(
+            HourlyWeather.city_id == 1,
+            HourlyWeather.hourly_timestamp == corrected_hour,
+        )
+        .values(temperature=99.5, updated_at=datetime.now(timezone.utc))
+    )
+    weather_session.commit()
+    assert export_silver_to_parquet(weather_session, root) >= 1
+
+    files = partition_files(root)
+    assert files.keys() == first_files.keys()
+    assert all(len(names) == 1 for names in files.values())
+    corrected_folder = f"date={corrected_hour.date()}/city_id=1"
+    assert files[corrected_folder] != first_files[corrected_folder]
+
+    df_scan = scan_hourly_parquet(root, HISTORY_START, history_end).collect()
+    assert df_scan.height == HISTORY_HOURS * len(cities)
+    corrected = df_scan.filter(city_id=1, hourly_timestamp=corrected_hour)[
+        "temperature"
+    ]
+    assert corrected.to_list() == [Decimal("99.50")]
@@ -0,0 +1,100 @@
+from sqlalchemy import event, func, select
+from weather_call.api.client import ApiClient, CircuitBreaker
+from weather_call.city_registry import CityRegistry
+from weather_call.etl_service import add_new_hourly_data
+from weather_call.model.weather import HourlyWeather, HourlyWeatherBronze
+from weather_call.observation_index import ObservationIndex
+from conftest import seed_cities, tracked_cities
+import math
+import threading
+import time
+import pytest
+
+# seconds every stub api request takes
+LATENCY = 0.3
+
+
+@pytest.fixture
+def many_cities(session) -> list[dict]:
+    cities = tracked_cities(8)
+    seed_cities(session, cities)
+    return cities
+
+
+def ingest(session, client: ApiClient, cities, max_concurrency: int, **kwargs):
+    return add_new_hourly_data(
+        session,
+        "key",
+        cities=cities,
+        client=client,
+        max_concurrency=max_concurrency,
+        registry=CityRegistry(),
+        group_size=1,
+        observations=ObservationIndex(refresh_seconds=0),
+        **kwargs,
+    )
+
+
+def count_rows(session, model) -> int:
+    return session.scalar(select(func.count()).select_from(model))
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 4, 8])
+def test_wall_time_is_bounded_by_the_concurrency(
+    session, stub_api, many_cities, max_concurrency
+):
+    stub_api.delay = LATENCY
+
+    with ApiClient(base_url=stub_api.base_url, pool_size=max_concurrency) as client:
+        start = time.monotonic()
+        failed = ingest(session, client, many_cities, max_concurrency)
+        elapsed = time.monotonic() - start
+
+    # the requests overlap up to max_concurrency at a time
+    rounds = math.ceil(len(many_cities) / max_concurrency)
+    assert failed == []
+    assert stub_api.max_active == max_concurrency
+    assert rounds * LATENCY <= elapsed < (rounds + 1) * LATENCY + 0.5
+    assert count_rows(session, HourlyWeather) == len(many_cities)
+
+
+def test_request_timeout_fires(session, stub_api, many_cities):
+    stub_api.delay = 2.0
+
+    with ApiClient(
+        base_url=stub_api.base_url,
+        timeout=0.2,
+        max_retries=0,
+        circuit_breaker=CircuitBreaker(failure_threshold=100),
+    ) as client:
+        start = time.monotonic()
+        failed = ingest(
+            session, client, many_cities, len(many_cities), retry_dead_letters=False
+        )
+        elapsed = time.monotonic() - start
+
+    assert len(failed) == len(many_cities)
+    assert elapsed < stub_api.delay
+    assert count_rows(session, HourlyWeatherBronze) == 0
+
+
+def test_rows_are_written_only_from_the_calling_thread(session, stub_api, many_cities):
+    stub_api.delay = 0.05
+    writers = set()
+
+    def record_writer(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE")):
+            writers.add(threading.get_ident())
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", record_writer)
+    try:
+        with ApiClient(base_url=stub_api.base_url) as client:
+            ingest(session, client, many_cities, max_concurrency=4)
+    finally:
+        event.remove(engine, "before_cursor_execute", record_writer)
+
+    assert stub_api.max_active > 1
+    assert writers == {threading.get_ident()}
+    assert count_rows(session, HourlyWeatherBronze) == len(many_cities)
+    assert count_rows(session, HourlyWeather) == len(many_cities)
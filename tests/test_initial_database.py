@@ -0,0 +1,54 @@
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.orm import Session
+from weather_call.api.geocoding_cache import GeocodingCache
+from weather_call.config import SqliteProfile
+from weather_call.model.city import City
+from weather_call.model.country import Country
+from weather_call.model.database import build_engine
+from weather_call.model.initial_database import full_database_initialization
+from conftest import tracked_cities
+
+
+def geocoded(cities: list[dict]) -> GeocodingCache:
+    """Geocoding cache holding every city, so no api call is needed"""
+    cache = GeocodingCache()
+    for index, city in enumerate(cities):
+        cache.put(
+            city["city_name"],
+            city["iso_3166"],
+            {"name": city["city_name"], "lat": 45 + index / 10, "lon": 9 + index / 10},
+        )
+    return cache
+
+
+def column_names(engine, table: str) -> set[str]:
+    return {column["name"] for column in inspect(engine).get_columns(table)}
+
+
+def test_initialization_of_a_new_and_an_existing_database(tmp_path):
+    cities = tracked_cities(4)
+    engine = build_engine(f"sqlite:///{tmp_path / 'weather.db'}", SqliteProfile())
+    try:
+        with Session(engine) as session:
+            full_database_initialization(
+                session, engine, None, cities, geocoding_cache=geocoded(cities)
+            )
+            assert session.scalar(select(func.count()).select_from(City)) == 4
+            assert session.scalar(select(func.count()).select_from(Country)) == 2
+
+        # a database created before a nullable column existed gets it added
+        with engine.begin() as connection:
+            connection.execute(
+                text("ALTER TABLE city_observation DROP COLUMN provider_id")
+            )
+        assert "provider_id" not in column_names(engine, "city_observation")
+
+        with Session(engine) as session:
+            full_database_initialization(
+                session, engine, None, cities, geocoding_cache=geocoded(cities)
+            )
+            assert session.scalar(select(func.count()).select_from(City)) == 4
+            assert session.scalar(select(func.count()).select_from(Country)) == 2
+        assert "provider_id" in column_names(engine, "city_observation")
+    finally:
+        engine.dispose()
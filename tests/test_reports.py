@@ -0,0 +1,131 @@
+from weather_call.reports import (
+    DAILY_SOURCE_COLUMNS,
+    HOURLY_ROW_BYTES,
+    ReportBundle,
+    average_temperature,
+    city_with_highest_column_value,
+    city_with_variation,
+    distinct_weather,
+    load_hourly_window,
+    rank_common_weather,
+    stream_daily_window,
+)
+from weather_call.rollup import daily_aggregates
+from conftest import HISTORY_HOURS, HISTORY_START
+from datetime import timedelta
+from polars.testing import assert_frame_equal
+import functools
+import polars as pl
+import pytest
+
+# a window that starts and ends in the middle of a day
+INITIAL_TIME = HISTORY_START + timedelta(hours=5)
+FINAL_TIME = HISTORY_START + timedelta(hours=HISTORY_HOURS - 7)
+
+# hourly rows per streamed batch, down to one row at a time
+BATCH_ROWS = [1, 7, 100, 100_000]
+
+REPORTS = {
+    "distinct_weather": distinct_weather,
+    "rank_common_weather": rank_common_weather,
+    "average_temperature": average_temperature,
+    "highest_temperature": functools.partial(
+        city_with_highest_column_value, "temperature"
+    ),
+    "highest_wind_speed": functools.partial(
+        city_with_highest_column_value, "wind_speed"
+    ),
+    "temperature_variation": city_with_variation,
+}
+
+
+def normalized(df_daily: pl.DataFrame) -> pl.DataFrame:
+    """Daily aggregates in a fixed row order, with sorted condition counts"""
+    return df_daily.sort("name", "day").with_columns(
+        pl.col("weather_condition_counts").list.eval(
+            pl.element().sort_by(pl.element().struct.field("weather_condition"))
+        )
+    )
+
+
+def memory_limit_mb(batch_rows: int) -> float:
+    """Memory limit that makes stream_daily_window read batch_rows rows at a time"""
+    return batch_rows * HOURLY_ROW_BYTES * 2 / 2**20
+
+
+@pytest.mark.parametrize("batch_rows", BATCH_ROWS)
+def test_stream_daily_window_matches_eager_aggregates(weather_session, batch_rows):
+    df_window = load_hourly_window(
+        weather_session, INITIAL_TIME, FINAL_TIME, DAILY_SOURCE_COLUMNS
+    )
+    expected = daily_aggregates(df_window.lazy(), "name").collect()
+
+    streamed = stream_daily_window(
+        weather_session,
+        INITIAL_TIME,
+        FINAL_TIME,
+        memory_limit_mb=memory_limit_mb(batch_rows),
+    )
+
+    assert_frame_equal(normalized(streamed), normalized(expected))
+
+
+def test_stream_daily_window_of_an_empty_window(weather_session):
+    streamed = stream_daily_window(
+        weather_session,
+        HISTORY_START - timedelta(days=3),
+        HISTORY_START - timedelta(days=2),
+        memory_limit_mb=memory_limit_mb(1),
+    )
+
+    assert streamed.is_empty()
+    assert "weather_condition_counts" in streamed.columns
+
+
+@pytest.mark.parametrize("batch_rows", BATCH_ROWS)
+@pytest.mark.parametrize("report", REPORTS)
+def test_streamed_report_matches_eager_report(weather_session, report, batch_rows):
+    expected = REPORTS[report](INITIAL_TIME, FINAL_TIME, weather_session)
+
+    streamed = REPORTS[report](
+        INITIAL_TIME,
+        FINAL_TIME,
+        weather_session,
+        memory_limit_mb=memory_limit_mb(batch_rows),
+    )
+
+    assert_frame_equal(streamed, expected, check_row_order=False)
+
+
+@pytest.mark.parametrize("batch_rows", BATCH_ROWS)
+def test_streamed_bundle_matches_eager_bundle(weather_session, batch_rows):
+    expected = ReportBundle(weather_session, INITIAL_TIME, FINAL_TIME).collect()
+
+    streamed = ReportBundle(
+        weather_session,
+        INITIAL_TIME,
+        FINAL_TIME,
+        memory_limit_mb=memory_limit_mb(batch_rows),
+    ).collect()
+
+    assert streamed.keys() == expected.keys()
+    for report in expected:
+        assert_frame_equal(streamed[report], expected[report], check_row_order=False)
+
+
+def test_streamed_report_of_a_city_subset(weather_session, cities):
+    subset = [city["city_name"] for city in cities[:2]]
+    expected = average_temperature(
+        INITIAL_TIME, FINAL_TIME, weather_session, cities=subset
+    )
+
+    streamed = average_temperature(
+        INITIAL_TIME,
+        FINAL_TIME,
+        weather_session,
+        cities=subset,
+        memory_limit_mb=memory_limit_mb(3),
+    )
+
+    assert sorted(streamed["city"]) == subset
+    assert_frame_equal(streamed, expected, check_row_order=False)
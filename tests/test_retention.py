@@ -0,0 +1,258 @@
+from sqlalchemy import Text, func, insert, select, type_coerce
+from weather_call.model.weather import HourlyWeather, HourlyWeatherBronze
+from weather_call.retention import (
+    archive_aged_bronze,
+    compact_bronze,
+    delete_superseded_bronze,
+    mark_latest_bronze,
+    prune_aged_bronze,
+    scan_bronze_archive,
+)
+from weather_call.transform import transform_bronze_to_silver
+from conftest import seed_cities
+from datetime import datetime, timedelta, timezone
+import json
+import pytest
+
+# hours of bronze payloads per city, ending an hour ago
+BRONZE_HOURS = 96
+
+# the bronze payloads of the hours before it are older than the retention
+RETENTION_DAYS = 2
+
+
+def current_weather(city_id: int, observed_at: datetime, temperature: float) -> dict:
+    """Current weather api payload, with the fields silver does not read"""
+    return {
+        "coord": {"lon": 9.0, "lat": 45.0},
+        "weather": [
+            {"id": 800, "main": "Clear", "description": "clear sky", "icon": "01d"}
+        ],
+        "base": "stations",
+        "main": {
+            "temp": temperature,
+            "feels_like": temperature - 1,
+            "pressure": 1013,
+            "humidity": 60,
+        },
+        "visibility": 10000,
+        "wind": {"speed": 3.2, "deg": 180},
+        "clouds": {"all": 0},
+        "dt": int(observed_at.replace(tzinfo=timezone.utc).timestamp()),
+        "sys": {"country": "IT", "sunrise": 0, "sunset": 0},
+        "timezone": 3600,
+        "id": 3000 + city_id,
+        "name": f"City {city_id}",
+        "cod": 200,
+    }
+
+
+@pytest.fixture
+def last_hour() -> datetime:
+    return datetime.now(timezone.utc).replace(
+        tzinfo=None, minute=0, second=0, microsecond=0
+    ) - timedelta(hours=1)
+
+
+@pytest.fixture
+def bronze_session(session, cities, last_hour):
+    """
+    Session on a database holding BRONZE_HOURS of bronze payloads for every
+    city, transformed into silver. Every hour was observed twice, the first
+    payload is superseded by the second one.
+    """
+    seed_cities(session, cities)
+    rows = [
+        {
+            "city_id": city_id,
+            "hourly_timestamp": hour,
+            "payload": current_weather(city_id, hour, temperature),
+            "is_latest": True,
+        }
+        for temperature in (10.0, 20.0)
+        for offset in range(BRONZE_HOURS)
+        if (hour := last_hour - timedelta(hours=offset))
+        for city_id in range(1, len(cities) + 1)
+    ]
+    session.execute(insert(HourlyWeatherBronze), rows)
+    session.commit()
+    transform_bronze_to_silver(session, full_replay=True)
+    return session
+
+
+def bronze_rows(session) -> list[tuple]:
+    return session.execute(
+        select(
+            HourlyWeatherBronze.city_id,
+            HourlyWeatherBronze.hourly_timestamp,
+            HourlyWeatherBronze.is_latest,
+        ).order_by(HourlyWeatherBronze.id)
+    ).all()
+
+
+def silver_rows(session) -> list[tuple]:
+    return session.execute(
+        select(
+            HourlyWeather.city_id,
+            HourlyWeather.hourly_timestamp,
+            HourlyWeather.temperature,
+            HourlyWeather.wind_speed,
+            HourlyWeather.weather_condition,
+        ).order_by(HourlyWeather.city_id, HourlyWeather.hourly_timestamp)
+    ).all()
+
+
+def payload_bytes(session) -> int:
+    return session.scalar(
+        select(func.sum(func.length(type_coerce(HourlyWeatherBronze.payload, Text))))
+    )
+
+
+def test_mark_latest_flags_only_the_superseded_payloads(bronze_session, cities):
+    flipped = mark_latest_bronze(bronze_session)
+
+    hours = len(cities) * BRONZE_HOURS
+    rows = bronze_rows(bronze_session)
+    assert flipped == hours
+    assert [is_latest for *_, is_latest in rows] == [False] * hours + [True] * hours
+    # nothing new since the previous run
+    assert mark_latest_bronze(bronze_session) == 0
+
+
+def test_delete_superseded_keeps_the_latest_and_untransformed_payloads(
+    bronze_session, cities, last_hour
+):
+    hours = len(cities) * BRONZE_HOURS
+    # two newer payloads of an hour, not transformed into silver yet
+    bronze_session.execute(
+        insert(HourlyWeatherBronze),
+        [
+            {
+                "city_id": 1,
+                "hourly_timestamp": last_hour,
+                "payload": current_weather(1, last_hour, temperature),
+                "is_latest": True,
+            }
+            for temperature in (30.0, 31.0)
+        ],
+    )
+    mark_latest_bronze(bronze_session)
+
+    deleted = delete_superseded_bronze(bronze_session)
+    bronze_session.commit()
+
+    # both transformed payloads of the hour are superseded, the untransformed
+    # superseded one stays until silver has read it
+    assert deleted == hours + 1
+    rows = bronze_rows(bronze_session)
+    assert len(rows) == hours + 1
+    assert [is_latest for *_, is_latest in rows[-2:]] == [False, True]
+    assert all(is_latest for *_, is_latest in rows[:-2])
+
+
+def test_pruned_payloads_replay_into_the_same_silver_rows(bronze_session):
+    expected = silver_rows(bronze_session)
+    size_before = payload_bytes(bronze_session)
+    older_than = datetime.now(timezone.utc) - timedelta(days=RETENTION_DAYS)
+
+    pruned = prune_aged_bronze(bronze_session, older_than)
+    bronze_session.commit()
+
+    assert pruned > 0
+    assert payload_bytes(bronze_session) < size_before
+    # the pruned rows are not pruned again
+    assert prune_aged_bronze(bronze_session, older_than) == 0
+
+    bronze_session.execute(HourlyWeather.__table__.delete())
+    transform_bronze_to_silver(bronze_session, full_replay=True)
+    assert silver_rows(bronze_session) == expected
+
+
+def test_compaction_keeps_the_latest_pruned_payloads(bronze_session, cities):
+    hours = len(cities) * BRONZE_HOURS
+    older_than = datetime.now(timezone.utc) - timedelta(days=RETENTION_DAYS)
+    # prune before the superseded payloads were ever flagged
+    pruned = prune_aged_bronze(bronze_session, older_than)
+    bronze_session.commit()
+    assert all(is_latest for *_, is_latest in bronze_rows(bronze_session))
+
+    report = compact_bronze(bronze_session, retention_days=RETENTION_DAYS)
+
+    # only the superseded payloads are deleted, the latest one of every
+    # city and hour survives, pruned or not
+    assert pruned > 0
+    assert report["superseded_deleted"] == hours
+    rows = bronze_rows(bronze_session)
+    assert len(rows) == hours
+    assert len({(city_id, hour) for city_id, hour, _ in rows}) == hours
+    assert all(is_latest for *_, is_latest in rows)
+
+    # a second compaction deletes nothing more
+    report = compact_bronze(bronze_session, retention_days=RETENTION_DAYS)
+    assert report["superseded_deleted"] == 0
+    assert len(bronze_rows(bronze_session)) == hours
+
+
+def test_archive_moves_the_aged_payloads_to_parquet(bronze_session, tmp_path):
+    root = tmp_path / "archive"
+    older_than = datetime.now(timezone.utc) - timedelta(days=RETENTION_DAYS)
+    naive_older_than = older_than.replace(tzinfo=None)
+    aged = {
+        row.id: row.payload
+        for row in bronze_session.scalars(
+            select(HourlyWeatherBronze).where(
+                HourlyWeatherBronze.hourly_timestamp < naive_older_than
+            )
+        )
+    }
+    total = len(bronze_rows(bronze_session))
+
+    archived = archive_aged_bronze(bronze_session, root, older_than, chunk_size=50)
+
+    assert archived == len(aged)
+    assert len(bronze_rows(bronze_session)) == total - archived
+    assert bronze_session.scalar(
+        select(func.min(HourlyWeatherBronze.hourly_timestamp))
+    ) >= naive_older_than.replace(minute=0, second=0, microsecond=0)
+
+    df_archive = scan_bronze_archive(root).collect()
+    assert sorted(df_archive["id"]) == sorted(aged)
+    assert {
+        row["id"]: json.loads(row["payload"])
+        for row in df_archive.iter_rows(named=True)
+    } == aged
+    # every month partition holds the hours of its month
+    assert (
+        df_archive["month"] == df_archive["hourly_timestamp"].dt.strftime("%Y-%m")
+    ).all()
+
+
+def test_archive_keeps_the_untransformed_payloads(bronze_session, tmp_path, last_hour):
+    aged_hour = last_hour - timedelta(days=RETENTION_DAYS + 1)
+    bronze_session.execute(
+        insert(HourlyWeatherBronze),
+        [
+            {
+                "city_id": 1,
+                "hourly_timestamp": aged_hour,
+                "payload": current_weather(1, aged_hour, 30.0),
+                "is_latest": True,
+            }
+        ],
+    )
+    bronze_session.commit()
+    older_than = datetime.now(timezone.utc) - timedelta(days=RETENTION_DAYS)
+
+    report = compact_bronze(
+        bronze_session, archive_root=tmp_path, retention_days=RETENTION_DAYS
+    )
+
+    assert report["archived"] > 0
+    assert report["pruned"] == 0
+    remaining_aged = bronze_session.scalars(
+        select(HourlyWeatherBronze.payload).where(
+            HourlyWeatherBronze.hourly_timestamp < older_than.replace(tzinfo=None)
+        )
+    ).all()
+    assert [payload["main"]["temp"] for payload in remaining_aged] == [30.0]
+    assert scan_bronze_archive(tmp_path).collect().height == report["archived"]